@@ -2,18 +2,66 @@
 GitHub Release execution module.
 Queries the GitHub API for latest release tag.
 See docs/modules/github_release.md for usage.
+
+Token checks are remembered in <cachedir>/github_release/tokens.json
+(sha256 of the token -> valid/invalid + when checked) so later salt-call
+processes skip the /user round trips. Minion options:
+
+  github_release.api_url           API base (default https://api.github.com)
+  github_release.token_ttl         seconds a valid token is trusted (3600)
+  github_release.token_negative_ttl  seconds a rejected token is skipped (86400)
+  github_release.release_ttl       seconds a cached tag is served without
+                                   any request (900)
+  github_release.retries           extra attempts per API request (0)
+  ca_bundle                        CA file for verifying the API (salt option)
+
+Requests go through the shared keep-alive client (_utils/httpclient.py),
+so one process's token checks and release lookups share a connection.
+They honour the salt proxy_host/proxy_port options (or the proxy
+environment) and make a single attempt unless github_release.retries says
+otherwise, since they run while a highstate renders.
+
+Tags the master resolves for the whole fleet (releases.resolve runner,
+github_releases pillar) are used before any of the caches below, so
+repos the state tree references normally cost no request at all.
+
+latest() keeps the last tag per repo/prerelease flag with its ETag and
+Last-Modified in <cachedir>/github_release/releases.json. Past
+release_ttl it revalidates with a conditional request (a 304 costs no
+rate limit and keeps the cached tag); if GitHub can't be reached the
+stale tag is still preferred over the fallback.
+
+latest_many() resolves a batch of repos in one GraphQL query (REST pool
+without a token) and warms a per-process memo, so the individual latest()
+calls made while rendering the same highstate don't touch the network.
 """
 
+import concurrent.futures
+import contextvars
+import hashlib
 import json
 import logging
-import urllib.error
-import urllib.request
+import os
+import threading
+import time
 
 log = logging.getLogger(__name__)
 
 __virtualname__ = "github_release"
 
+API_URL = "https://api.github.com"
+
+# Concurrent /user checks in find_valid_token
+TOKEN_CHECK_WORKERS = 4
+
+# Concurrent REST lookups in latest_many when GraphQL isn't available
+RELEASE_WORKERS = 8
+
 _token_cache = None
+# release key -> (tag, resolved at) for this process (latest / latest_many)
+_release_memo = {}
+# Serializes read-modify-write of the on-disk caches
+_cache_lock = threading.Lock()
 
 
 def __virtual__():
@@ -33,11 +81,101 @@ def _collect_tokens():
   return tokens
 
 
+def _api_url():
+  return __opts__.get("github_release.api_url", API_URL).rstrip("/")
+
+
+def _request(path, token="", headers=None, **kwargs):
+  """API call through the shared keep-alive client (httpclient utils)."""
+  headers = {"Accept": "application/vnd.github+json", **(headers or {})}
+  if token:
+    headers["Authorization"] = f"Bearer {token}"
+  # called while rendering: one attempt, so an unreachable API costs one timeout
+  kwargs.setdefault("retries", __opts__.get("github_release.retries", 0))
+  url = _api_url() + path
+  return __utils__["httpclient.request"](
+    url,
+    headers=headers,
+    ca_file=__opts__.get("ca_bundle"),
+    proxy=__utils__["httpclient.proxy_for"](url, __opts__),
+    **kwargs,
+  )
+
+
+def _cache_path(name):
+  return os.path.join(
+    __opts__.get("cachedir", "/var/cache/salt/minion"), "github_release", name
+  )
+
+
+def _load_json(path):
+  try:
+    with open(path, encoding="utf-8") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def _save_json(path, data):
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+      json.dump(data, f)
+    os.replace(tmp, path)
+  except OSError as exc:
+    log.debug("github_release: can't write %s: %s", path, exc)
+
+
+def _token_key(token):
+  """Tokens are cached by hash only, never in plain text."""
+  return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _check_token(token):
+  """
+  Ask /user whether token is accepted.
+
+  GitHub answers 403 both for a token that lacks access and for primary
+  (x-ratelimit-remaining: 0) and secondary (retry-after) rate limits;
+  only the former is a verdict on the token.
+
+  Returns:
+      bool: True/False for a definite answer, None on network errors and
+      rate limits (not cached, the token may be fine)
+  """
+  try:
+    resp = _request("/user", token, timeout=5)
+  except OSError:
+    return None
+  status, headers = resp["status"], resp["headers"]
+  if status == 200:
+    return True
+  if status == 401:
+    return False
+  if status == 403:
+    limited = headers.get("x-ratelimit-remaining") == "0" or "retry-after" in headers
+    return None if limited else False
+  return None
+
+
+def _record_token(token, valid):
+  """Persist one token check result in the on-disk cache."""
+  path = _cache_path("tokens.json")
+  with _cache_lock:
+    entries = _load_json(path)
+    entries[_token_key(token)] = {"valid": valid, "checked": time.time()}
+    _save_json(path, entries)
+
+
 def find_valid_token():
   """
   Return the first github token that passes a basic auth check. Result is cached per run.
 
   Reads tokens from all per-user pillar files via slsutil.renderer.
+  Unchecked candidates are validated concurrently and the first accepted
+  one wins; results (including rejected tokens) are kept in an on-disk
+  TTL cache under the minion cachedir.
   Returns empty string if none are valid.
 
   CLI Example::
@@ -48,27 +186,78 @@ def find_valid_token():
   if _token_cache is not None:
     return _token_cache
 
-  candidates = _collect_tokens()
+  candidates = list(dict.fromkeys(_collect_tokens()))
+  entries = _load_json(_cache_path("tokens.json"))
+  now = time.time()
+  ttl = {
+    True: __opts__.get("github_release.token_ttl", 3600),
+    False: __opts__.get("github_release.token_negative_ttl", 86400),
+  }
 
+  unchecked = []
   for candidate in candidates:
-    req = urllib.request.Request("https://api.github.com/user")
-    req.add_header("Authorization", f"Bearer {candidate}")
-    req.add_header("Accept", "application/vnd.github+json")
-    try:
-      with urllib.request.urlopen(req, timeout=5) as resp:
-        if resp.status == 200:
-          _token_cache = candidate
-          return _token_cache
-    except Exception:  # noqa: BLE001
+    entry = entries.get(_token_key(candidate))
+    if entry and now - entry.get("checked", 0) < ttl[bool(entry.get("valid"))]:
+      if entry["valid"]:
+        _token_cache = candidate
+        return _token_cache
       continue
+    unchecked.append(candidate)
+
   _token_cache = ""
+  if not unchecked:
+    return _token_cache
+
+  def _check(candidate):
+    valid = _check_token(candidate)
+    if valid is not None:
+      _record_token(candidate, valid)
+    return valid
+
+  pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=min(TOKEN_CHECK_WORKERS, len(unchecked))
+  )
+  # each check runs in its own copy of this context: __opts__/__utils__
+  # resolve through the loader's contextvar, which new threads lack
+  futures = {
+    pool.submit(contextvars.copy_context().run, _check, c): c for c in unchecked
+  }
+  try:
+    for future in concurrent.futures.as_completed(futures):
+      if future.result():
+        _token_cache = futures[future]
+        break
+  finally:
+    # the rest finish in the background and still record their result
+    pool.shutdown(wait=False, cancel_futures=True)
   return _token_cache
 
 
+def _release_key(repo, prerelease):
+  return f"{repo}|{'pre' if prerelease else 'stable'}"
+
+
+def _store_release(key, entry):
+  _store_releases({key: entry})
+
+
+def _store_releases(updates):
+  path = _cache_path("releases.json")
+  with _cache_lock:
+    entries = _load_json(path)
+    entries.update(updates)
+    _save_json(path, entries)
+
+
 def latest(repo, fallback=None, prerelease=False):
   """
   Get the latest release tag for a GitHub repo.
 
+  Answers from the github_releases pillar published by the master, then
+  from the on-disk release cache while it is younger than
+  github_release.release_ttl, then revalidates with If-None-Match /
+  If-Modified-Since.
+
   :param repo: GitHub repo in owner/name format (e.g. 'Nonary/vibeshine')
   :param fallback: Value to return if the API call fails
   :param prerelease: If True, include pre-release builds (default: False)
@@ -79,22 +268,188 @@ def latest(repo, fallback=None, prerelease=False):
       salt '*' github_release.latest Nonary/vibeshine
       salt '*' github_release.latest microsoft/winget-cli prerelease=True
   """
-  token = find_valid_token()
-  if prerelease:
-    url = f"https://api.github.com/repos/{repo}/releases"
-  else:
-    url = f"https://api.github.com/repos/{repo}/releases/latest"
-  req = urllib.request.Request(url)
-  req.add_header("Accept", "application/vnd.github+json")
-  if token:
-    req.add_header("Authorization", f"Bearer {token}")
+  key = _release_key(repo, prerelease)
+  tag = _pillar_tag(repo, prerelease) or _memo_get(key)
+  if tag is not None:
+    return tag
+  tag = _latest(repo, key, prerelease)
+  if tag is None:
+    return fallback
+  _release_memo[key] = (tag, time.time())
+  return tag
+
+
+def _pillar_tag(repo, prerelease):
+  """Tag published by the master's releases.resolve runner, if any."""
+  flag = "prerelease" if prerelease else "stable"
+  try:
+    return __salt__["pillar.get"](f"github_releases:{flag}", {}).get(repo)  # noqa: F821
+  except Exception:  # noqa: BLE001
+    return None
+
+
+def _memo_get(key):
+  """Tag resolved by this process within release_ttl, else None."""
+  tag, resolved = _release_memo.get(key, (None, 0))
+  if time.time() - resolved < __opts__.get("github_release.release_ttl", 900):
+    return tag
+  return None
+
+
+def _latest(repo, key, prerelease):
+  """Resolve one tag via the disk cache and REST; None if unavailable."""
+  cached = _load_json(_cache_path("releases.json")).get(key)
+  ttl = __opts__.get("github_release.release_ttl", 900)
+  if cached and time.time() - cached.get("fetched", 0) < ttl:
+    return cached["tag"]
+
+  path = f"/repos/{repo}/releases" + ("" if prerelease else "/latest")
+  headers = {}
+  if cached and cached.get("etag"):
+    headers["If-None-Match"] = cached["etag"]
+  if cached and cached.get("last_modified"):
+    headers["If-Modified-Since"] = cached["last_modified"]
 
   try:
-    with urllib.request.urlopen(req, timeout=5) as resp:
-      data = json.loads(resp.read())
-      if prerelease:
-        return data[0]["tag_name"]
-      return data["tag_name"]
-  except Exception as exc:  # noqa: BLE001
+    resp = _request(path, find_valid_token(), headers, timeout=5)
+    if resp["status"] == 304 and cached:
+      _store_release(key, {**cached, "fetched": time.time()})
+      return cached["tag"]
+    if resp["status"] != 200:
+      raise ValueError(f"HTTP {resp['status']}")
+    data = resp["json"]
+    tag = data[0]["tag_name"] if prerelease else data["tag_name"]
+    _store_release(
+      key,
+      {
+        "tag": tag,
+        "etag": resp["headers"].get("etag"),
+        "last_modified": resp["headers"].get("last-modified"),
+        "fetched": time.time(),
+      },
+    )
+    return tag
+  except (OSError, ValueError, LookupError, TypeError) as exc:
     log.warning("github_release.latest(%s) failed: %s", repo, exc)
-    return fallback
+
+  if cached:
+    log.info("github_release.latest(%s): serving stale %s", repo, cached["tag"])
+    return cached["tag"]
+  return None
+
+
+def _graphql_latest(repos, prerelease, token):
+  """
+  Resolve many repos in one GraphQL request.
+
+  Returns:
+      dict: repo -> tag (None for repos without releases), or None if the
+      query itself failed
+  """
+  fields = (
+    "releases(first: 1, orderBy: {field: CREATED_AT, direction: DESC})"
+    " { nodes { tagName } }"
+    if prerelease
+    else "latestRelease { tagName }"
+  )
+  aliases = {}
+  parts = []
+  for i, repo in enumerate(repos):
+    owner, _, name = repo.partition("/")
+    aliases[f"r{i}"] = repo
+    parts.append(
+      f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {fields} }}"
+    )
+  query = {"query": "query { " + " ".join(parts) + " }"}
+
+  try:
+    resp = _request("/graphql", token, method="POST", json_body=query, timeout=10)
+    if resp["status"] != 200:
+      raise ValueError(f"HTTP {resp['status']}")
+    data = (resp["json"] or {}).get("data") or {}
+  except (OSError, ValueError, AttributeError) as exc:
+    log.warning("github_release: GraphQL batch failed, using REST: %s", exc)
+    return None
+
+  tags = {}
+  for alias, repo in aliases.items():
+    node = data.get(alias) or {}
+    if prerelease:
+      nodes = (node.get("releases") or {}).get("nodes") or []
+      tags[repo] = nodes[0]["tagName"] if nodes else None
+    else:
+      tags[repo] = (node.get("latestRelease") or {}).get("tagName")
+  return tags
+
+
+def latest_many(repos, prerelease=False):
+  """
+  Get the latest release tags for many repos at once.
+
+  Repos in the github_releases pillar, already resolved by this process
+  or fresh in the on-disk cache are answered locally; the rest go out as one GraphQL query when a valid
+  token is available, otherwise as parallel REST lookups. Every result
+  warms the memo latest() reads first.
+
+  :param repos: List of repos in owner/name format
+  :param prerelease: If True, include pre-release builds (default: False)
+  :returns: Dict of repo -> tag (None where no release could be resolved)
+
+  CLI Example::
+
+      salt '*' github_release.latest_many '[ipfs/kubo, nvm-sh/nvm]'
+      salt '*' github_release.latest_many '[Nonary/vibeshine]' prerelease=True
+  """
+  repos = list(dict.fromkeys(repos))
+  ttl = __opts__.get("github_release.release_ttl", 900)
+  cached = _load_json(_cache_path("releases.json"))
+  now = time.time()
+
+  tags = {}
+  pending = []
+  for repo in repos:
+    key = _release_key(repo, prerelease)
+    entry = cached.get(key)
+    memo = _pillar_tag(repo, prerelease) or _memo_get(key)
+    if memo is not None:
+      tags[repo] = memo
+    elif entry and now - entry.get("fetched", 0) < ttl:
+      tags[repo] = entry["tag"]
+      _release_memo[key] = (entry["tag"], now)
+    else:
+      pending.append(repo)
+
+  token = find_valid_token() if pending else ""
+  resolved = _graphql_latest(pending, prerelease, token) if pending and token else None
+  if resolved is not None:
+    updates = {}
+    for repo, tag in resolved.items():
+      key = _release_key(repo, prerelease)
+      if tag is None:
+        # no release, or the repo is gone: leave it to the REST path below
+        continue
+      previous = cached.get(key) or {}
+      if previous.get("tag") != tag:
+        previous = {}
+      updates[key] = {**previous, "tag": tag, "fetched": now}
+      tags[repo] = tag
+      _release_memo[key] = (tag, now)
+    _store_releases(updates)
+    pending = [repo for repo in pending if repo not in tags]
+
+  if pending:
+    with concurrent.futures.ThreadPoolExecutor(
+      max_workers=min(RELEASE_WORKERS, len(pending))
+    ) as pool:
+      # latest() reads __salt__/__opts__/__utils__, which resolve through the
+      # loader's contextvar: give every lookup its own copy of this context
+      futures = {
+        pool.submit(
+          contextvars.copy_context().run, latest, repo, None, prerelease
+        ): repo
+        for repo in pending
+      }
+      for future in concurrent.futures.as_completed(futures):
+        tags[futures[future]] = future.result()
+
+  return {repo: tags.get(repo) for repo in repos}
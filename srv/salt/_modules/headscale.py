@@ -4,14 +4,57 @@ Salt execution module for querying the Headscale API.
 Pillar keys (from srv/pillar/secrets/tailscale.sls):
   headscale:api-key       - API key for authentication
   headscale:login-server  - Base URL (e.g. https://headscale.example.com)
+
+Requests go through the shared keep-alive client (_utils/httpclient.py)
+and honour the salt proxy_host/proxy_port options. Lookups run while
+states render, so each request is one attempt of headscale.timeout
+seconds (minion options, default 5) plus headscale.retries extra
+attempts (default 0).
+
+The node list is fetched once per run: the first lookup builds an
+inventory (nodes plus name, givenName, tag and IP indexes) in __context__
+and every later call answers from it. Between runs the node list is kept
+in <cachedir>/headscale/nodes.json for headscale.cache_ttl seconds
+(minion option, default 60; 0 disables it). Pass refresh=True to any
+lookup to go to the API regardless.
+
+distcc_hosts() probes the tagged nodes' distccd ports concurrently and
+orders DISTCC_HOSTS by round-trip time, with a /limit per host from
+pillar distcc:limits:<node>, the node's distcc_jobs mine entry
+(srv/salt/linux/distcc.sls) or distcc:default_limit. The mine is asked
+once for all reachable nodes, by name: a node's headscale givenName is
+assumed to be its minion id, and a node named otherwise just gets the
+pillar or default limit. Probe results are kept in
+<cachedir>/headscale/probes.json for headscale.probe_ttl seconds
+(default 30).
 """
 
+import concurrent.futures
+import json
 import logging
+import os
+import socket
+import time
+
+try:
+  from salt.exceptions import SaltException
+except ImportError:
+  # loaded outside Salt (unit tests): nothing raises it then
+  class SaltException(Exception):
+    pass
+
 
 log = logging.getLogger(__name__)
 
 __virtualname__ = "headscale"
 
+_CONTEXT_KEY = "headscale.inventory"
+
+DISTCC_PORT = 3632
+
+# Concurrent distccd probes
+PROBE_WORKERS = 16
+
 
 def __virtual__():
   return __virtualname__
@@ -27,41 +70,145 @@ def _base_url():
 
 def _get(path):
   """Make a GET request to the headscale API."""
-  import salt.utils.http
-
   base = _base_url()
   if not base:
     return {}
   url = base + path
-  result = salt.utils.http.query(
-    url,
-    method="GET",
-    header_dict={"Authorization": f"Bearer {_api_key()}"},
-    decode=True,
-    decode_type="json",
-    verify_ssl=True,
+  try:
+    resp = __utils__["httpclient.request"](
+      url,
+      headers={"Authorization": f"Bearer {_api_key()}"},
+      timeout=__opts__.get("headscale.timeout", 5),
+      retries=__opts__.get("headscale.retries", 0),
+      ca_file=__opts__.get("ca_bundle"),
+      proxy=__utils__["httpclient.proxy_for"](url, __opts__),
+    )
+  except OSError as exc:
+    log.error("headscale API error for %s: %s", path, exc)
+    return None
+  if resp["status"] != 200 or not isinstance(resp["json"], dict):
+    log.error("headscale API error for %s: HTTP %s", path, resp["status"])
+    return None
+  return resp["json"]
+
+
+def _cache_path(name):
+  return os.path.join(
+    __opts__.get("cachedir", "/var/cache/salt/minion"), "headscale", name
   )
-  if "error" in result:
-    log.error("headscale API error for %s: %s", path, result["error"])
+
+
+def _load_json(name):
+  try:
+    with open(_cache_path(name), encoding="utf-8") as f:
+      return json.load(f)
+  except (OSError, ValueError):
     return None
-  return result.get("dict")
 
 
-def get_nodes():
+def _save_json(name, data):
+  path = _cache_path(name)
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+      json.dump(data, f)
+    os.replace(tmp, path)
+  except OSError as exc:
+    log.debug("headscale: can't write %s: %s", path, exc)
+
+
+def _load_cache():
+  cached = _load_json("nodes.json")
+  if isinstance(cached, dict) and isinstance(cached.get("nodes"), list):
+    return cached
+  return None
+
+
+def _save_cache(nodes):
+  _save_json("nodes.json", {"fetched": time.time(), "nodes": nodes})
+
+
+def _index(nodes):
+  """Inventory dict: the node list plus lookup indexes."""
+  inventory = {"nodes": nodes, "name": {}, "givenName": {}, "tag": {}, "ip": {}}
+  for node in nodes:
+    for field in ("name", "givenName"):
+      if node.get(field):
+        inventory[field].setdefault(node[field], node)
+    for tag in node.get("tags", []):
+      inventory["tag"].setdefault(tag, []).append(node)
+    for ip in node.get("ipAddresses", []):
+      inventory["ip"].setdefault(ip, node)
+  return inventory
+
+
+def _inventory(refresh=False):
+  """
+  Node inventory for this run: __context__, then the disk cache within
+  headscale.cache_ttl, then the API. A failed fetch falls back to the stale
+  disk copy (or no nodes) and is not retried until refresh=True.
+  """
+  if not refresh and _CONTEXT_KEY in __context__:
+    return __context__[_CONTEXT_KEY]
+
+  ttl = __opts__.get("headscale.cache_ttl", 60)
+  cached = _load_cache() if ttl else None
+  if not refresh and cached and time.time() - cached.get("fetched", 0) < ttl:
+    nodes = cached["nodes"]
+  else:
+    data = _get("/api/v1/node")
+    if data is not None:
+      nodes = data.get("nodes", [])
+      if ttl:
+        _save_cache(nodes)
+    elif cached:
+      log.warning("headscale: API unavailable, using cached node list")
+      nodes = cached["nodes"]
+    else:
+      nodes = []
+
+  __context__[_CONTEXT_KEY] = _index(nodes)
+  return __context__[_CONTEXT_KEY]
+
+
+def get_nodes(refresh=False):
   """
   Return all nodes as a list of dicts.
 
+  refresh
+      If True, fetch from the API even if the node list is cached.
+
   CLI example::
 
       salt 'guava' headscale.get_nodes
+      salt 'guava' headscale.get_nodes refresh=True
+  """
+  return list(_inventory(refresh)["nodes"])
+
+
+def get_node(name, refresh=False):
   """
-  data = _get("/api/v1/node")
-  if data is None:
-    return []
-  return data.get("nodes", [])
+  Return one node by givenName, name or tailscale IP.
 
+  name
+      The node's givenName / hostname, or one of its IPs.
+  refresh
+      If True, fetch from the API even if the node list is cached.
+
+  CLI example::
 
-def get_node_ip(name, ipv6=False):
+      salt 'guava' headscale.get_node papaya
+      salt 'guava' headscale.get_node 100.64.0.2
+  """
+  inventory = _inventory(refresh)
+  for index in ("givenName", "name", "ip"):
+    if name in inventory[index]:
+      return inventory[index][name]
+  return None
+
+
+def get_node_ip(name, ipv6=False, refresh=False):
   """
   Return the tailscale IP for a node by name.
 
@@ -69,37 +216,42 @@ def get_node_ip(name, ipv6=False):
       The node's givenName / hostname.
   ipv6
       If True, return the IPv6 address instead. Default False.
+  refresh
+      If True, fetch from the API even if the node list is cached.
 
   CLI example::
 
       salt 'guava' headscale.get_node_ip papaya
   """
   idx = 1 if ipv6 else 0
-  for node in get_nodes():
-    if node.get("givenName") == name or node.get("name") == name:
-      ips = node.get("ipAddresses", [])
-      if len(ips) > idx:
-        return ips[idx]
-  return None
+  inventory = _inventory(refresh)
+  node = inventory["givenName"].get(name) or inventory["name"].get(name)
+  ips = node.get("ipAddresses", []) if node else []
+  return ips[idx] if len(ips) > idx else None
 
 
-def get_online_nodes():
+def get_online_nodes(refresh=False):
   """
   Return only currently online nodes.
 
+  refresh
+      If True, fetch from the API even if the node list is cached.
+
   CLI example::
 
       salt 'guava' headscale.get_online_nodes
   """
-  return [n for n in get_nodes() if n.get("online")]
+  return [n for n in _inventory(refresh)["nodes"] if n.get("online")]
 
 
-def node_map(ipv6=False):
+def node_map(ipv6=False, refresh=False):
   """
   Return a dict mapping node name to tailscale IP.
 
   ipv6
       If True, return IPv6 addresses. Default False.
+  refresh
+      If True, fetch from the API even if the node list is cached.
 
   CLI example::
 
@@ -107,7 +259,7 @@ def node_map(ipv6=False):
   """
   idx = 1 if ipv6 else 0
   result = {}
-  for node in get_nodes():
+  for node in _inventory(refresh)["nodes"]:
     name = node.get("givenName") or node.get("name")
     ips = node.get("ipAddresses", [])
     if name and len(ips) > idx:
@@ -115,7 +267,7 @@ def node_map(ipv6=False):
   return result
 
 
-def get_nodes_by_tag(tag, online_only=True):
+def get_nodes_by_tag(tag, online_only=True, refresh=False):
   """
   Return nodes with a specific tag.
 
@@ -123,18 +275,20 @@ def get_nodes_by_tag(tag, online_only=True):
       Tag to filter by (e.g. "tag:distcc_x86_64")
   online_only
       If True, only return online nodes. Default True.
+  refresh
+      If True, fetch from the API even if the node list is cached.
 
   CLI example::
 
       salt 'guava' headscale.get_nodes_by_tag tag:distcc_x86_64
   """
-  nodes = get_online_nodes() if online_only else get_nodes()
   # Tags may include "tag:" prefix or not
   tag_normalized = tag if tag.startswith("tag:") else f"tag:{tag}"
-  return [n for n in nodes if tag_normalized in n.get("tags", [])]
+  nodes = _inventory(refresh)["tag"].get(tag_normalized, [])
+  return [n for n in nodes if n.get("online") or not online_only]
 
 
-def get_distcc_hosts(tag="distcc", online_only=True):
+def get_distcc_hosts(tag="distcc", online_only=True, refresh=False):
   """
   Return space-separated hostnames for DISTCC_HOSTS.
 
@@ -142,12 +296,138 @@ def get_distcc_hosts(tag="distcc", online_only=True):
       Tag name without 'tag:' prefix (e.g. "distcc", "distcc-arm64"). Default "distcc".
   online_only
       If True, only return online nodes. Default True.
+  refresh
+      If True, fetch from the API even if the node list is cached.
 
   CLI example::
 
       salt 'guava' headscale.get_distcc_hosts
       salt 'guava' headscale.get_distcc_hosts tag=distcc-arm64
   """
-  nodes = get_nodes_by_tag(f"tag:{tag}", online_only=online_only)
+  nodes = get_nodes_by_tag(f"tag:{tag}", online_only=online_only, refresh=refresh)
   hostnames = [n.get("givenName") or n.get("name") for n in nodes]
   return " ".join(hostnames)
+
+
+def _probe(address, port, timeout):
+  """Seconds to open a TCP connection to address:port, or None."""
+  start = time.monotonic()
+  try:
+    with socket.create_connection((address, port), timeout=timeout):
+      return time.monotonic() - start
+  except OSError:
+    return None
+
+
+def _probe_all(addresses, port, timeout, refresh=False):
+  """
+  RTT per address (None = unreachable), from probes.json within
+  headscale.probe_ttl, probing the rest concurrently.
+  """
+  ttl = __opts__.get("headscale.probe_ttl", 30)
+  now = time.time()
+  cached = (_load_json("probes.json") or {}) if ttl else {}
+  results = {}
+  pending = []
+  for address in addresses:
+    entry = cached.get(f"{address}:{port}")
+    if not refresh and entry and now - entry["probed"] < ttl:
+      results[address] = entry["rtt"]
+    else:
+      pending.append(address)
+
+  if pending:
+    with concurrent.futures.ThreadPoolExecutor(
+      max_workers=min(PROBE_WORKERS, len(pending))
+    ) as pool:
+      rtts = pool.map(lambda a: _probe(a, port, timeout), pending)
+      for address, rtt in zip(pending, rtts):
+        results[address] = rtt
+        cached[f"{address}:{port}"] = {"rtt": rtt, "probed": now}
+    if ttl:
+      _save_json(
+        "probes.json", {k: v for k, v in cached.items() if now - v["probed"] < ttl}
+      )
+  return results
+
+
+def _job_limits(names):
+  """
+  distcc /limit per node: pillar, then its mined job count, then default.
+
+  One mine.get for every node without a pillar limit, targeting the
+  givenNames as minion ids.
+  """
+  limits = {
+    name: __salt__["pillar.get"](f"distcc:limits:{name}", None) for name in names
+  }
+  unset = sorted(name for name, limit in limits.items() if limit is None)
+  if unset:
+    try:
+      mined = __salt__["mine.get"](unset, "distcc_jobs", tgt_type="list")
+    except SaltException as exc:
+      log.warning("headscale.distcc_hosts: mine.get failed: %s", exc)
+      mined = {}
+    if isinstance(mined, dict):
+      limits.update({name: mined.get(name) for name in unset})
+
+  default = int(__salt__["pillar.get"]("distcc:default_limit", 4))
+  result = {}
+  for name, limit in limits.items():
+    try:
+      result[name] = max(1, int(limit))
+    except (TypeError, ValueError):
+      result[name] = default
+  return result
+
+
+def distcc_hosts(
+  tag="distcc", port=DISTCC_PORT, timeout=0.5, with_limits=True, refresh=False
+):
+  """
+  Return DISTCC_HOSTS for the online tagged nodes, nearest first.
+
+  Each node's tailscale IPv4 is probed on the distccd port concurrently;
+  nodes that don't answer within timeout are left out and the rest are
+  ordered by connect time.
+
+  tag
+      Tag name without 'tag:' prefix (e.g. "distcc", "distcc-arm64"). Default "distcc".
+  port
+      distccd port to probe. Default 3632.
+  timeout
+      Seconds to wait for each connection. Default 0.5.
+  with_limits
+      Append /limit job counts (pillar distcc:limits, the distcc_jobs mine
+      entry of the minion whose id is the node's name, else
+      distcc:default_limit). Default True.
+  refresh
+      If True, ignore cached node lists and probe results.
+
+  CLI example::
+
+      salt 'guava' headscale.distcc_hosts
+      salt 'guava' headscale.distcc_hosts tag=distcc-arm64 timeout=1
+  """
+  nodes = get_nodes_by_tag(f"tag:{tag}", online_only=True, refresh=refresh)
+  candidates = {}
+  for node in nodes:
+    ips = node.get("ipAddresses", [])
+    if ips:
+      candidates[node.get("givenName") or node.get("name")] = ips[0]
+  rtts = _probe_all(sorted(set(candidates.values())), port, timeout, refresh)
+
+  reachable = sorted(
+    (rtts[ip], name) for name, ip in candidates.items() if rtts.get(ip) is not None
+  )
+  if len(reachable) < len(candidates):
+    log.info(
+      "headscale.distcc_hosts: %d of %d hosts unreachable on port %d",
+      len(candidates) - len(reachable),
+      len(candidates),
+      port,
+    )
+  if with_limits:
+    limits = _job_limits([name for _, name in reachable])
+    return " ".join(f"{name}/{limits[name]}" for _, name in reachable)
+  return " ".join(name for _, name in reachable)
@@ -1,40 +1,216 @@
 """
 Salt execution module for WAN and gateway discovery.
 
-Pillar keys: none — uses grains and public ipify API.
+Pillar keys: none — uses grains and public IP echo services.
+
+wan_info() looks up the IPv4 and IPv6 WAN address concurrently, each
+family trying its providers in order (each for at most its timeout,
+default 1.5s) until one answers, all within netinfo.wan_deadline seconds
+(default 3). Providers are http (JSON with
+an "ip" key, or the address as plain text) or stun (RFC 5389 binding
+request over UDP); override the list with the netinfo:providers config
+key (minion config, grains or pillar), e.g.
+
+  netinfo:
+    providers:
+      v4:
+        - {name: lan-echo, type: http, url: "http://10.0.0.1/ip"}
+        - {name: google, type: stun, host: stun.l.google.com, port: 19302}
+
+Answers are kept in <cachedir>/netinfo/wan.json for netinfo.wan_ttl
+seconds (default 60) so a burst of network beacons costs one lookup.
 """
 
+import concurrent.futures
+import contextvars
+import ipaddress
+import json
 import logging
+import os
+import secrets
+import socket
+import struct
+import time
 
 log = logging.getLogger(__name__)
 
 __virtualname__ = "netinfo"
 
+DEFAULT_PROVIDERS = {
+  "v4": [
+    {"name": "ipify", "type": "http", "url": "https://api.ipify.org?format=json"},
+    {"name": "icanhazip", "type": "http", "url": "https://ipv4.icanhazip.com"},
+    {"name": "google-stun", "type": "stun", "host": "stun.l.google.com", "port": 19302},
+  ],
+  "v6": [
+    {"name": "ipify", "type": "http", "url": "https://api6.ipify.org?format=json"},
+    {"name": "icanhazip", "type": "http", "url": "https://ipv6.icanhazip.com"},
+    {"name": "google-stun", "type": "stun", "host": "stun.l.google.com", "port": 19302},
+  ],
+}
+
+STUN_MAGIC = 0x2112A442
+
+# Longest one provider may take before the next is tried (seconds)
+PROVIDER_TIMEOUT = 1.5
+
 
 def __virtual__():
   return __virtualname__
 
 
-def wan_ips():
+def _http_ip(provider, family, timeout):
+  resp = __utils__["httpclient.request"](
+    provider["url"], timeout=timeout, retries=0, ca_file=__opts__.get("ca_bundle")
+  )
+  if resp["status"] != 200:
+    raise ValueError(f"HTTP {resp['status']}")
+  if isinstance(resp["json"], dict):
+    return resp["json"].get("ip")
+  return resp["body"].decode(errors="replace").strip()
+
+
+def _stun_ip(provider, family, timeout):
+  """Mapped address from a STUN binding response."""
+  af = socket.AF_INET if family == "v4" else socket.AF_INET6
+  addr = socket.getaddrinfo(
+    provider["host"], provider.get("port", 3478), af, socket.SOCK_DGRAM
+  )[0][4]
+  txid = secrets.token_bytes(12)
+  with socket.socket(af, socket.SOCK_DGRAM) as sock:
+    sock.settimeout(timeout)
+    # connected, so an ICMP port unreachable fails fast instead of timing out
+    sock.connect(addr)
+    sock.send(struct.pack("!HHI", 0x0001, 0, STUN_MAGIC) + txid)
+    data = sock.recv(2048)
+  msg_type, length, cookie = struct.unpack("!HHI", data[:8])
+  if msg_type != 0x0101 or cookie != STUN_MAGIC or data[8:20] != txid:
+    raise ValueError("not a STUN binding response")
+  pos = 20
+  while pos + 4 <= min(len(data), 20 + length):
+    attr, size = struct.unpack("!HH", data[pos : pos + 4])
+    value = data[pos + 4 : pos + 4 + size]
+    pos += 4 + size + (-size % 4)
+    if attr not in (0x0020, 0x0001):
+      continue
+    raw = value[4:]
+    if attr == 0x0020:  # XOR-MAPPED-ADDRESS
+      mask = struct.pack("!I", STUN_MAGIC) + txid
+      raw = bytes(b ^ m for b, m in zip(raw, mask))
+    return str(ipaddress.ip_address(raw))
+  raise ValueError("no mapped address in STUN response")
+
+
+_PROVIDER_TYPES = {"http": _http_ip, "stun": _stun_ip}
+
+
+def _lookup(family, providers, deadline):
+  """First provider answering with an address of family, or None."""
+  for provider in providers:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      break
+    timeout = min(remaining, provider.get("timeout", PROVIDER_TIMEOUT))
+    start = time.monotonic()
+    try:
+      ip = _PROVIDER_TYPES[provider.get("type", "http")](provider, family, timeout)
+      parsed = ipaddress.ip_address(ip)
+    except (OSError, ValueError, KeyError, TypeError, struct.error) as exc:
+      log.debug("netinfo: %s provider %s failed: %s", family, provider.get("name"), exc)
+      continue
+    if parsed.version != (4 if family == "v4" else 6):
+      continue
+    return {
+      "ip": str(parsed),
+      "provider": provider.get("name") or provider.get("url") or provider.get("host"),
+      "seconds": round(time.monotonic() - start, 3),
+    }
+  return None
+
+
+def _cache_path():
+  return os.path.join(
+    __opts__.get("cachedir", "/var/cache/salt/minion"), "netinfo", "wan.json"
+  )
+
+
+def wan_info(refresh=False):
+  """
+  Return the WAN addresses with the provider that answered for each family.
+
+  refresh
+      If True, ignore the cached answer.
+
+  Returns a dict: ips (sorted list), v4 / v6 (ip, provider, seconds, or
+  None if no provider answered in time), fetched (epoch) and cached.
+
+  CLI example::
+
+      salt 'guava' netinfo.wan_info
+      salt 'guava' netinfo.wan_info refresh=True
+  """
+  path = _cache_path()
+  ttl = __opts__.get("netinfo.wan_ttl", 60)
+  if not refresh and ttl:
+    try:
+      with open(path, encoding="utf-8") as f:
+        cached = json.load(f)
+      if time.time() - cached["fetched"] < ttl:
+        return {**cached, "cached": True}
+    except (OSError, ValueError, KeyError, TypeError):
+      pass
+
+  providers = __salt__["config.get"]("netinfo:providers", {}) or DEFAULT_PROVIDERS
+  deadline = time.monotonic() + __opts__.get("netinfo.wan_deadline", 3)
+  pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+  # each worker runs in a copy of this context so the loader dunders
+  # (__opts__, __utils__) resolve in it
+  futures = {
+    family: pool.submit(
+      contextvars.copy_context().run,
+      _lookup,
+      family,
+      providers.get(family, []),
+      deadline,
+    )
+    for family in ("v4", "v6")
+  }
+  concurrent.futures.wait(futures.values(), timeout=max(0, deadline - time.monotonic()))
+  # a lookup stuck past the deadline finishes in the background, unused
+  pool.shutdown(wait=False, cancel_futures=True)
+
+  result = {"ips": [], "fetched": time.time()}
+  for family, future in futures.items():
+    answer = future.result() if future.done() else None
+    result[family] = answer
+    if answer:
+      result["ips"].append(answer["ip"])
+  result["ips"].sort()
+
+  if ttl and result["ips"]:
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      tmp = f"{path}.{os.getpid()}.tmp"
+      with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+      os.replace(tmp, path)
+    except OSError as exc:
+      log.debug("netinfo: can't write %s: %s", path, exc)
+  return {**result, "cached": False}
+
+
+def wan_ips(refresh=False):
   """
   Return public WAN IPs (v4 + v6, deduplicated).
 
+  refresh
+      If True, ignore the cached answer.
+
   CLI example::
 
       salt 'guava' netinfo.wan_ips
   """
-  import salt.utils.http
-
-  result = set()
-  for url in (
-    "https://api.ipify.org?format=json",
-    "https://api64.ipify.org?format=json",
-  ):
-    r = salt.utils.http.query(url, decode=True, decode_type="json", verify_ssl=True)
-    ip = r.get("dict", {}).get("ip")
-    if ip:
-      result.add(ip)
-  return sorted(result)
+  return wan_info(refresh)["ips"]
 
 
 def default_gw():
@@ -17,12 +17,24 @@ Usage from states (or use Salt's built-in pkg module):
           - git
 """
 
+import json
 import logging
+import os
+import time
 
 log = logging.getLogger(__name__)
 
 __virtualname__ = "pacman"
 
+# __context__ key for the per-run `pacman -Q` snapshot (name -> version)
+_INDEX_KEY = "pacman.installed_index"
+
+# __context__ key for per-command instrumentation records (see stats())
+_STATS_KEY = "pacman.cmdstats"
+
+# pacman -T verdicts (target -> satisfied) for the current snapshot
+_DEPTEST_KEY = "pacman.deptest"
+
 
 def __virtual__():
   """
@@ -41,83 +53,108 @@ def __virtual__():
 
 def _clean_env(runas=None):
   """
-  Build a sanitized environment for package operations.
+  Return the sanitized environment for package operations.
 
   Strips user shell pollution (custom PATH, env vars) that can
-  interfere with package operations and post-install scripts.
+  interfere with package operations and post-install scripts. Shared with
+  the yay module via the pkgenv utils; extra variables can be let through
+  with the pkgenv.passthrough minion option.
 
   Args:
       runas: Optional username for home directory paths (defaults to root)
 
   Returns:
-      dict: Clean environment variables
+      mappingproxy: Clean environment variables (read-only, memoized)
   """
-  if runas:
-    home = f"/home/{runas}"
-  else:
-    home = "/root"
+  return __utils__["pkgenv.clean_env"](runas, __opts__.get("pkgenv.passthrough", ()))
 
-  return {
-    # identity
-    "HOME": home,
-    "USER": runas,
-    "LOGNAME": runas,
-    "SHELL": "/bin/bash",
-    # locale
-    "LANG": "en_US.UTF-8",
-    "LC_ALL": "en_US.UTF-8",
-    # path — system only
-    "PATH": "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin",
-    # xdg
-    "XDG_CACHE_HOME": f"{home}/.cache",
-    "XDG_CONFIG_HOME": f"{home}/.config",
-    "XDG_DATA_HOME": f"{home}/.local/share",
-    "GNUPGHOME": f"{home}/.gnupg",
-    # python — prevent conda/venv bleed
-    "PYTHON": "/usr/bin/python",
-    "PYTHONHOME": "",
-    "PYTHONPATH": "",
-    "CONDA_PREFIX": "",
-    "CONDA_DEFAULT_ENV": "",
-    "CONDA_EXE": "",
-    # node
-    "NVM_DIR": "",
-    "NODE_PATH": "",
-    "npm_config_prefix": "",
-    # rust — prevent /opt/rust fallback
-    "CARGO_HOME": "",
-    "RUSTUP_HOME": "",
-    # go
-    "GOPATH": "",
-    "GOROOT": "",
-    # ruby
-    "GEM_HOME": "",
-    "GEM_PATH": "",
-    # perl
-    "PERL5LIB": "",
-    "PERL_LOCAL_LIB_ROOT": "",
-    "PERL_MB_OPT": "",
-    "PERL_MM_OPT": "",
-    # java
-    "JAVA_HOME": "",
-    # qt
-    "QT_PLUGIN_PATH": "",
-    "QT_QPA_PLATFORMTHEME": "",
-    "QT_STYLE_OVERRIDE": "",
-    # compiler overrides — let makepkg use its own defaults
-    "CC": "",
-    "CXX": "",
-    "LD": "",
-    "AR": "",
-    "NM": "",
-    "STRIP": "",
-    "OBJCOPY": "",
-    "OBJDUMP": "",
-    "CFLAGS": "",
-    "CXXFLAGS": "",
-    "LDFLAGS": "",
-    "CPPFLAGS": "",
-  }
+
+def _dbpath():
+  """pacman DBPath, overridable via the pacman.dbpath minion option."""
+  return __opts__.get("pacman.dbpath", "/var/lib/pacman")
+
+
+def _local_versions():
+  """
+  Read installed packages straight from the local database.
+
+  Returns:
+      dict: Package names mapped to versions, or None when the alpm utils
+      module isn't synced or the database can't be read
+  """
+  reader = __utils__.get("alpm.local_versions")
+  if reader is None:
+    return None
+  return reader(_dbpath())
+
+
+def _local_provides():
+  """
+  Read the names installed packages provide from the local database.
+
+  Returns:
+      dict: Provided names mapped to provider package names, or None when
+      the alpm utils module isn't synced or the database can't be read
+  """
+  reader = __utils__.get("alpm.local_provides")
+  if reader is None:
+    return None
+  return reader(_dbpath())
+
+
+def _conf():
+  """pacman.conf path, overridable via the pacman.conf minion option."""
+  return __opts__.get("pacman.conf", "/etc/pacman.conf")
+
+
+def _prefetch_jobs():
+  """Concurrent downloads for prefetch (pacman.prefetch_jobs, 0 disables)."""
+  return int(__opts__.get("pacman.prefetch_jobs", 4))
+
+
+def _local_packages():
+  """
+  Read full installed package records (version, size, groups) from the
+  local database.
+
+  Returns:
+      dict: Package names mapped to records, or None if unavailable
+  """
+  reader = __utils__.get("alpm.local_packages")
+  if reader is None:
+    return None
+  return reader(_dbpath())
+
+
+def _sync_index():
+  """
+  Return the indexed sync databases.
+
+  Returns:
+      dict: alpm sync index, or None when the alpm utils module isn't
+      synced or the sync databases can't be read
+  """
+  reader = __utils__.get("alpm.sync_index")
+  if reader is None:
+    return None
+  cachedir = os.path.join(__opts__.get("cachedir", "/var/cache/salt/minion"), "alpm")
+  return reader(_dbpath(), cachedir, conf=_conf())
+
+
+def _run_all(cmd, **kwargs):
+  """
+  cmd.run_all with per-call instrumentation.
+
+  Records command class, wall time, exit code and output sizes in
+  __context__ for pacman.stats() when the cmdstats utils are synced.
+  """
+  start = time.monotonic()
+  result = __salt__["cmd.run_all"](cmd, **kwargs)
+  recorder = __utils__.get("cmdstats.record")
+  if recorder is not None:
+    calls = __context__.setdefault(_STATS_KEY, [])
+    recorder(calls, cmd, result, time.monotonic() - start)
+  return result
 
 
 def _run_pacman(cmd, runas=None, **kwargs):
@@ -132,13 +169,14 @@ def _run_pacman(cmd, runas=None, **kwargs):
   Returns:
       dict: Command result with stdout, stderr, retcode
   """
-  run_kwargs = {"python_shell": True, "env": _clean_env(runas)}
+  # cmd.run_all wants a plain dict, not the shared read-only mapping
+  run_kwargs = {"python_shell": True, "env": _clean_env(runas).copy()}
   if runas:
     run_kwargs["runas"] = runas
 
   run_kwargs.update(kwargs)
 
-  result = __salt__["cmd.run_all"](cmd, **run_kwargs)
+  result = _run_all(cmd, **run_kwargs)
   return result
 
 
@@ -172,16 +210,81 @@ def is_installed(name, runas=None):
   CLI Example:
       salt '*' pacman.is_installed firefox
   """
+  local = _local_versions()
+  if local is not None:
+    return not _unsatisfied([name], runas=runas, index=local)
+
   result = _run_pacman(f"pacman -Q {name}", runas=runas, ignore_retcode=True)
   return result["retcode"] == 0
 
 
-def list_installed(runas=None):
+def _unsatisfied(pkgs, runas=None, index=None):
+  """
+  Return the targets no installed package satisfies.
+
+  Like `pacman -Q`, a target is satisfied by a package of that name or by
+  one that provides it (a -git/-bin replacement, a virtual name). Names
+  missing from the snapshot are looked up in the local database's
+  provides, or confirmed with a single `pacman -T` when the database
+  can't be read directly.
+
+  Args:
+      pkgs: Package names to check
+      runas: Optional user to run as
+      index: Installed-package snapshot (defaults to the per-run one)
+
+  Returns:
+      list: The targets from pkgs that aren't installed, in order
+  """
+  if index is None:
+    index = _installed_index(runas=runas)
+  misses = [pkg for pkg in pkgs if pkg not in index]
+  if not misses:
+    return []
+
+  provides = _local_provides()
+  if provides is not None:
+    return [pkg for pkg in misses if pkg not in provides]
+
+  verdicts = __context__.setdefault(_DEPTEST_KEY, {})
+  unknown = [pkg for pkg in misses if pkg not in verdicts]
+  if unknown:
+    # pacman -T prints the targets it can't satisfy and exits 127
+    result = _run_pacman(
+      f"pacman -T {' '.join(unknown)}", runas=runas, ignore_retcode=True
+    )
+    if result["retcode"] in (0, 127):
+      unsatisfied = set(result["stdout"].split())
+      verdicts.update({pkg: pkg not in unsatisfied for pkg in unknown})
+    else:
+      return misses
+  return [pkg for pkg in misses if not verdicts[pkg]]
+
+
+def missing(pkgs, runas=None):
+  """
+  Return the packages that aren't installed, resolving provides.
+
+  Args:
+      pkgs: List of package names
+      runas: Optional user to run as
+
+  Returns:
+      list: Names from pkgs that no installed package satisfies
+
+  CLI Example:
+      salt '*' pacman.missing '[git, vim]'
+  """
+  return _unsatisfied(list(pkgs), runas=runas)
+
+
+def list_installed(runas=None, cached=False):
   """
   List all installed packages.
 
   Args:
       runas: Optional user to run as
+      cached: Reuse the per-run snapshot instead of querying pacman again
 
   Returns:
       dict: Package names mapped to versions
@@ -189,6 +292,13 @@ def list_installed(runas=None):
   CLI Example:
       salt '*' pacman.list_installed
   """
+  if cached:
+    return dict(_installed_index(runas=runas))
+
+  local = _local_versions()
+  if local is not None:
+    return dict(local)
+
   result = _run_pacman("pacman -Q", runas=runas)
 
   if result["retcode"] != 0:
@@ -204,6 +314,38 @@ def list_installed(runas=None):
   return packages
 
 
+def _installed_index(runas=None, refresh=False):
+  """
+  Return the per-run snapshot of installed packages.
+
+  Served from the local database reader when available (it tracks the
+  database mtime itself). Otherwise one `pacman -Q` fills __context__ for
+  the whole state run; callers pass refresh=True after a transaction that
+  changed the local database.
+
+  Args:
+      runas: Optional user to run as
+      refresh: Discard the current snapshot and take a new one
+
+  Returns:
+      dict: Package names mapped to versions
+  """
+  local = _local_versions()
+  if local is not None:
+    return local
+
+  if refresh or _INDEX_KEY not in __context__:
+    __context__.pop(_DEPTEST_KEY, None)
+    __context__[_INDEX_KEY] = list_installed(runas=runas)
+  return __context__[_INDEX_KEY]
+
+
+def _invalidate_index():
+  """Drop the installed-package snapshot after a transaction."""
+  __context__.pop(_INDEX_KEY, None)
+  __context__.pop(_DEPTEST_KEY, None)
+
+
 def install(name, runas=None, refresh=False):
   """
   Install a single package using pacman.
@@ -237,6 +379,7 @@ def install(name, runas=None, refresh=False):
   result = _run_pacman(cmd, runas=runas)
 
   if result["retcode"] == 0:
+    _invalidate_index()
     return {
       "success": True,
       "changes": {name: {"old": "", "new": "installed"}},
@@ -294,17 +437,12 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
 
   # Track results
   installed_pkgs = []
-  already_installed = []
   failed_pkgs = []
   errors = []
 
-  # Check which packages need installation
-  to_install = []
-  for pkg in packages:
-    if is_installed(pkg, runas=runas):
-      already_installed.append(pkg)
-    else:
-      to_install.append(pkg)
+  # Check which packages need installation against a single snapshot
+  to_install = _unsatisfied(packages, runas=runas)
+  already_installed = [pkg for pkg in packages if pkg not in to_install]
 
   # If nothing to install, we're done
   if not to_install:
@@ -312,9 +450,14 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
     return ret
 
   # Install all needed packages in one pacman call
-  cmd = "pacman -S --needed --noconfirm"
-  if refresh:
-    cmd = "pacman -Sy --needed --noconfirm"
+  base_cmd = "pacman -S --needed --noconfirm"
+  cmd = "pacman -Sy --needed --noconfirm" if refresh else base_cmd
+
+  # Download outside the lock-holding transaction
+  if _prefetch_jobs() > 0:
+    if refresh and sync(runas=runas)["retcode"] == 0:
+      cmd = base_cmd
+    prefetch(pkgs=to_install)
 
   pkg_str = " ".join(to_install)
   cmd = f"{cmd} {pkg_str}"
@@ -322,25 +465,35 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
   result = _run_pacman(cmd, runas=runas, timeout=600)
 
   if result["retcode"] == 0:
-    # Verify what actually got installed
+    # Verify what actually got installed - one fresh snapshot, not one fork per pkg
+    if "there is nothing to do" in result["stdout"].lower():
+      index = _installed_index(runas=runas)
+    else:
+      index = _installed_index(runas=runas, refresh=True)
+    still_missing = _unsatisfied(to_install, runas=runas, index=index)
     for pkg in to_install:
-      if is_installed(pkg, runas=runas):
+      if pkg not in still_missing:
         installed_pkgs.append(pkg)
         ret["changes"][pkg] = {"old": "", "new": "installed"}
       else:
         failed_pkgs.append(pkg)
   else:
-    # Batch install failed - try individually
-    log.warning(f"Batch install failed, trying packages individually: {to_install}")
+    # Batch install failed - bisect to isolate the failing package(s)
+    log.warning(f"Batch install failed, bisecting to find failures: {to_install}")
 
-    for pkg in to_install:
-      single_result = install(pkg, runas=runas, refresh=refresh)
-      if single_result["success"]:
-        installed_pkgs.append(pkg)
-        ret["changes"][pkg] = {"old": "", "new": "installed"}
-      else:
-        failed_pkgs.append(pkg)
-        errors.append(f"{pkg}: {single_result.get('stderr', 'unknown error')}")
+    def _run_batch(batch):
+      return _run_pacman(f"{base_cmd} {' '.join(batch)}", runas=runas, timeout=600)
+
+    good, bad = __utils__["pkgbatch.bisect"](to_install, _run_batch, result)
+    if good:
+      _invalidate_index()
+
+    for pkg in good:
+      installed_pkgs.append(pkg)
+      ret["changes"][pkg] = {"old": "", "new": "installed"}
+    for pkg, single_result in bad.items():
+      failed_pkgs.append(pkg)
+      errors.append(f"{pkg}: {single_result.get('stderr', 'unknown error')}")
 
   # Build summary comment
   comments = []
@@ -388,6 +541,7 @@ def remove(name, runas=None):
   result = _run_pacman(f"pacman -R --noconfirm {name}", runas=runas)
 
   if result["retcode"] == 0:
+    _invalidate_index()
     return {
       "success": True,
       "changes": {name: {"old": "installed", "new": ""}},
@@ -417,7 +571,14 @@ def upgrade(runas=None, refresh=True):
   """
   cmd = "pacman -Syu --noconfirm" if refresh else "pacman -Su --noconfirm"
 
+  # Download outside the lock-holding transaction
+  if _prefetch_jobs() > 0:
+    if refresh and sync(runas=runas)["retcode"] == 0:
+      cmd = "pacman -Su --noconfirm"
+    prefetch(upgrade=True)
+
   result = _run_pacman(cmd, runas=runas, timeout=1800)
+  _invalidate_index()
 
   return {
     "success": result["retcode"] == 0,
@@ -427,6 +588,225 @@ def upgrade(runas=None, refresh=True):
   }
 
 
+def _parse_query_upgrades(stdout):
+  """Parse `pacman -Qu` output ("name old -> new") into plan entries."""
+  plan = {}
+  for line in stdout.splitlines():
+    parts = line.split()
+    if len(parts) >= 4 and parts[2] == "->" and "[ignored]" not in line:
+      plan[parts[0]] = {
+        "old": parts[1],
+        "new": parts[3],
+        "repo": None,
+        "download_size": None,
+        "installed_size_delta": None,
+      }
+  return plan
+
+
+def plan_upgrade(runas=None):
+  """
+  List the upgrades `pacman -Su` would apply, without running it.
+
+  Diffs the local database against the sync databases as they were last
+  synced; run pacman.sync first for a fresh view.
+
+  Args:
+      runas: Optional user to run as
+
+  Returns:
+      dict: Package names mapped to ``old``/``new`` versions, ``repo``,
+      ``download_size`` and ``installed_size_delta`` in bytes (sizes are
+      None when falling back to `pacman -Qu`)
+
+  CLI Example:
+      salt '*' pacman.plan_upgrade
+  """
+  local = _local_packages()
+  index = _sync_index() if local is not None else None
+  if index is not None:
+    return __utils__["alpm.upgrade_plan"](local, index, _conf())
+
+  # -Qu exits 1 when there is nothing to upgrade
+  result = _run_pacman("pacman -Qu", runas=runas, ignore_retcode=True)
+  return _parse_query_upgrades(result["stdout"])
+
+
+def _fleet_cache():
+  """
+  Fleet package cache settings from config.get (minion config, grains or
+  pillar).
+
+  Returns:
+      dict: push flag and stats file; None when disabled
+  """
+  conf = __salt__["config.get"]("pacman_fleet_cache", {})
+  if not conf or not conf.get("enabled", False):
+    return None
+  cachedir = __opts__.get("cachedir", "/var/cache/salt/minion")
+  return {
+    "push": conf.get("push", True),
+    "stats": os.path.join(cachedir, "pacman-fleet-stats.json"),
+  }
+
+
+def _fleet_prefix():
+  return f"pacman-cache/{__grains__.get('cpuarch', 'x86_64')}/"
+
+
+def _fleet_fetch(targets, cachedir):
+  """
+  Copy targets the master's salt://pacman-cache holds into the pacman cache.
+
+  Runs serially through the fileclient; anything missing or failing the
+  sha256 check is left for the upstream mirrors.
+
+  Returns:
+      tuple: (list of filenames served by the master, bytes served)
+  """
+  listing = set(__salt__["cp.list_master"](prefix=_fleet_prefix()))
+  served = []
+  size = 0
+  for target in targets:
+    path = f"{_fleet_prefix()}{target['filename']}"
+    if path not in listing or os.path.exists(
+      os.path.join(cachedir, target["filename"])
+    ):
+      continue
+    local = __salt__["cp.cache_file"](f"salt://{path}")
+    if not local:
+      continue
+    copied = __utils__["pkgfetch.adopt"](local, target, cachedir)
+    # the fileclient copy is no longer needed once it's in the pacman cache
+    try:
+      os.unlink(local)
+    except OSError:
+      pass
+    if copied is not None:
+      served.append(target["filename"])
+      size += copied
+  return served, size
+
+
+def _fleet_push(filenames, cachedir):
+  """Upload upstream downloads to the master for pacmancache.collect."""
+  for filename in filenames:
+    upload = f"/{_fleet_prefix()}{filename}"
+    if not __salt__["cp.push"](os.path.join(cachedir, filename), upload_path=upload):
+      log.debug("pacman fleet cache: cp.push %s refused (file_recv off?)", filename)
+
+
+def _fleet_record(fleet, hits, misses, bytes_saved, bytes_downloaded):
+  """Add one prefetch to the cumulative fleet cache stats on disk."""
+  stats = fleet_cache_stats()
+  for key, value in (
+    ("hits", hits),
+    ("misses", misses),
+    ("bytes_saved", bytes_saved),
+    ("bytes_downloaded", bytes_downloaded),
+  ):
+    stats[key] += value
+  stats.pop("hit_rate")
+  try:
+    tmp = f"{fleet['stats']}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+      json.dump(stats, f)
+    os.replace(tmp, fleet["stats"])
+  except OSError as exc:
+    log.debug("pacman fleet cache: can't write stats: %s", exc)
+
+
+def fleet_cache_stats():
+  """
+  Cumulative fleet package cache statistics for this minion.
+
+  Returns:
+      dict: hits and misses (files served by the master vs upstream),
+      bytes_saved, bytes_downloaded and hit_rate (0.0-1.0)
+
+  CLI Example:
+      salt '*' pacman.fleet_cache_stats
+  """
+  stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "bytes_downloaded": 0}
+  path = os.path.join(
+    __opts__.get("cachedir", "/var/cache/salt/minion"), "pacman-fleet-stats.json"
+  )
+  try:
+    with open(path, encoding="utf-8") as f:
+      stats.update(json.load(f))
+  except (OSError, ValueError):
+    pass
+  total = stats["hits"] + stats["misses"]
+  stats["hit_rate"] = round(stats["hits"] / total, 3) if total else 0.0
+  return stats
+
+
+def prefetch(pkgs=None, upgrade=False):
+  """
+  Download package files into the pacman cache ahead of a transaction.
+
+  Resolves the targets (and their missing dependencies) against the sync
+  databases and downloads them concurrently from the servers in
+  pacman.conf, without taking the pacman database lock. installed() and
+  upgrade() call this automatically; calling it from an earlier state lets
+  downloads overlap with other work.
+
+  With the pacman_fleet_cache config enabled, files the master already
+  serves from salt://pacman-cache/<arch>/ are taken from there first, and
+  upstream downloads are pushed back for pacmancache.collect.
+
+  Args:
+      pkgs: Package names to fetch
+      upgrade: Also fetch everything plan_upgrade() reports
+
+  Returns:
+      dict: ``fetched``/``cached``/``fleet`` filenames, ``failed``
+      (filename -> error) and ``bytes`` downloaded upstream; empty when
+      the databases can't be read
+
+  CLI Example:
+      salt '*' pacman.prefetch pkgs='[firefox, thunderbird]'
+      salt '*' pacman.prefetch upgrade=True
+  """
+  ret = {"fetched": [], "cached": [], "fleet": [], "failed": {}, "bytes": 0}
+  fetcher = __utils__.get("pkgfetch.fetch")
+  local = _local_packages()
+  index = _sync_index() if local is not None else None
+  if fetcher is None or index is None:
+    return ret
+
+  names = list(pkgs or [])
+  if upgrade:
+    names += list(__utils__["alpm.upgrade_plan"](local, index, _conf()))
+  targets = __utils__["alpm.download_set"](index, names, local)
+  if not targets:
+    return ret
+
+  cachedir = __opts__.get("pacman.cachedir", "/var/cache/pacman/pkg")
+  fleet = _fleet_cache()
+  served, saved = _fleet_fetch(targets, cachedir) if fleet else ([], 0)
+
+  servers = __utils__["alpm.repo_servers"](_conf(), __grains__.get("cpuarch"))
+  ret.update(fetcher(targets, cachedir, servers, jobs=max(1, _prefetch_jobs())))
+  ret["cached"] = [f for f in ret["cached"] if f not in served]
+  ret["fleet"] = served
+
+  if fleet:
+    if fleet["push"]:
+      _fleet_push(ret["fetched"], cachedir)
+    _fleet_record(fleet, len(served), len(ret["fetched"]), saved, ret["bytes"])
+
+  log.info(
+    "pacman.prefetch: %d fetched (%d bytes), %d from fleet cache, %d cached, %d failed",
+    len(ret["fetched"]),
+    ret["bytes"],
+    len(served),
+    len(ret["cached"]),
+    len(ret["failed"]),
+  )
+  return ret
+
+
 def search(query, runas=None):
   """
   Search for packages in repos.
@@ -441,6 +821,10 @@ def search(query, runas=None):
   CLI Example:
       salt '*' pacman.search firefox
   """
+  index = _sync_index()
+  if index is not None:
+    return __utils__["alpm.sync_search"](index, query)
+
   result = _run_pacman(f"pacman -Ss {query}", runas=runas)
 
   if result["retcode"] != 0:
@@ -474,6 +858,10 @@ def info(name, runas=None):
   CLI Example:
       salt '*' pacman.info firefox
   """
+  index = _sync_index()
+  if index is not None:
+    return __utils__["alpm.sync_info"](index, name)
+
   result = _run_pacman(f"pacman -Si {name}", runas=runas)
 
   if result["retcode"] != 0:
@@ -486,3 +874,45 @@ def info(name, runas=None):
       info_dict[key.strip()] = value.strip()
 
   return info_dict
+
+
+def info_many(names, runas=None):
+  """
+  Get detailed info about many packages at once.
+
+  Args:
+      names: List of package names
+      runas: Optional user to run as
+
+  Returns:
+      dict: Package names mapped to info() results ({} if not found)
+
+  CLI Example:
+      salt '*' pacman.info_many '[firefox, git]'
+  """
+  index = _sync_index()
+  if index is not None:
+    return __utils__["alpm.sync_info_many"](index, names)
+
+  return {name: info(name, runas=runas) for name in names}
+
+
+def stats(since=0):
+  """
+  Summarize the pacman commands run by this process (e.g. this highstate).
+
+  Args:
+      since: Only count commands after this ``seq`` (from an earlier call)
+
+  Returns:
+      dict: ``seq``, ``calls``, ``seconds`` and per-class (query, install,
+      remove, upgrade, sync, build) count, failures, latency percentiles
+      and stdout/stderr bytes
+
+  CLI Example:
+      salt '*' pacman.stats
+  """
+  summarize = __utils__.get("cmdstats.summarize")
+  if summarize is None:
+    return {"seq": since, "calls": 0, "seconds": 0, "classes": {}}
+  return summarize(__context__.get(_STATS_KEY, []), since=int(since))
@@ -18,13 +18,22 @@ Usage from states:
         - runas: cozy-salt-svc
 """
 
+import concurrent.futures
+import contextvars
 import logging
 import os
+import time
+import urllib.parse
 
 log = logging.getLogger(__name__)
 
 __virtualname__ = "yay"
 
+AUR_URL = "https://aur.archlinux.org"
+
+# __context__ key for per-command instrumentation records (see stats())
+_STATS_KEY = "yay.cmdstats"
+
 
 def __virtual__():
   """
@@ -43,75 +52,29 @@ def __virtual__():
 
 def _clean_env(runas):
   """
-  Build a sanitized environment for package operations.
+  Return the sanitized environment for package operations.
 
   Explicitly zeroes tool-specific vars so PKGBUILD scripts can't fall back
-  to paths like /opt/rust. Empty string != unset for many build systems.
+  to paths like /opt/rust. Same environment as the pacman module (pkgenv
+  utils), including the distcc PATH and DISTCC_HOSTS passthrough.
   """
-  home = f"/home/{runas}"
-  return {
-    # identity
-    "HOME": home,
-    "USER": runas,
-    "LOGNAME": runas,
-    "SHELL": "/bin/bash",
-    # locale
-    "LANG": "en_US.UTF-8",
-    "LC_ALL": "en_US.UTF-8",
-    # path — system + distcc for distributed builds
-    "PATH": "/usr/lib/distcc/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin",
-    # distcc
-    "DISTCC_HOSTS": os.environ.get("DISTCC_HOSTS", ""),
-    # xdg
-    "XDG_CACHE_HOME": f"{home}/.cache",
-    "XDG_CONFIG_HOME": f"{home}/.config",
-    "XDG_DATA_HOME": f"{home}/.local/share",
-    "GNUPGHOME": f"{home}/.gnupg",
-    # python — prevent conda/venv bleed
-    "PYTHON": "/usr/bin/python",
-    "PYTHONHOME": "",
-    "PYTHONPATH": "",
-    "CONDA_PREFIX": "",
-    "CONDA_DEFAULT_ENV": "",
-    "CONDA_EXE": "",
-    # node
-    "NVM_DIR": "",
-    "NODE_PATH": "",
-    "npm_config_prefix": "",
-    # rust — prevent /opt/rust fallback
-    "CARGO_HOME": "",
-    "RUSTUP_HOME": "",
-    # go
-    "GOPATH": "",
-    "GOROOT": "",
-    # ruby
-    "GEM_HOME": "",
-    "GEM_PATH": "",
-    # perl
-    "PERL5LIB": "",
-    "PERL_LOCAL_LIB_ROOT": "",
-    "PERL_MB_OPT": "",
-    "PERL_MM_OPT": "",
-    # java
-    "JAVA_HOME": "",
-    # qt
-    "QT_PLUGIN_PATH": "",
-    "QT_QPA_PLATFORMTHEME": "",
-    "QT_STYLE_OVERRIDE": "",
-    # compiler overrides — let makepkg use its own defaults
-    "CC": "",
-    "CXX": "",
-    "LD": "",
-    "AR": "",
-    "NM": "",
-    "STRIP": "",
-    "OBJCOPY": "",
-    "OBJDUMP": "",
-    "CFLAGS": "",
-    "CXXFLAGS": "",
-    "LDFLAGS": "",
-    "CPPFLAGS": "",
-  }
+  return __utils__["pkgenv.clean_env"](runas, __opts__.get("pkgenv.passthrough", ()))
+
+
+def _run_all(cmd, **kwargs):
+  """
+  cmd.run_all with per-call instrumentation.
+
+  Records command class, wall time, exit code and output sizes in
+  __context__ for yay.stats() when the cmdstats utils are synced.
+  """
+  start = time.monotonic()
+  result = __salt__["cmd.run_all"](cmd, **kwargs)
+  recorder = __utils__.get("cmdstats.record")
+  if recorder is not None:
+    calls = __context__.setdefault(_STATS_KEY, [])
+    recorder(calls, cmd, result, time.monotonic() - start)
+  return result
 
 
 def _run_yay(cmd, runas, clean_env=True, **kwargs):
@@ -137,11 +100,11 @@ def _run_yay(cmd, runas, clean_env=True, **kwargs):
       "stderr": "yay cannot run as root - runas parameter is required",
     }
 
-  result = __salt__["cmd.run_all"](
+  result = _run_all(
     cmd,
     runas=runas,
     python_shell=True,
-    env=_clean_env(runas),
+    env=_clean_env(runas).copy(),
     clean_env=clean_env,
     **kwargs,
   )
@@ -149,6 +112,59 @@ def _run_yay(cmd, runas, clean_env=True, **kwargs):
   return result
 
 
+def _dbpath():
+  """pacman DBPath, overridable via the pacman.dbpath minion option."""
+  return __opts__.get("pacman.dbpath", "/var/lib/pacman")
+
+
+def _conf():
+  """pacman.conf path, overridable via the pacman.conf minion option."""
+  return __opts__.get("pacman.conf", "/etc/pacman.conf")
+
+
+def _local_versions():
+  """
+  Read installed packages straight from the pacman local database.
+
+  Avoids the runas hop and yay startup for read-only queries.
+
+  Returns:
+      dict: Package names mapped to versions, or None when the alpm utils
+      module isn't synced or the database can't be read
+  """
+  reader = __utils__.get("alpm.local_versions")
+  if reader is None:
+    return None
+  return reader(_dbpath())
+
+
+def _local_packages():
+  """
+  Read full installed package records from the local database.
+
+  Returns:
+      dict: Package names mapped to records, or None if unavailable
+  """
+  reader = __utils__.get("alpm.local_packages")
+  if reader is None:
+    return None
+  return reader(_dbpath())
+
+
+def _sync_index():
+  """
+  Return the indexed sync databases (see pacman._sync_index).
+
+  Returns:
+      dict: alpm sync index, or None if unavailable
+  """
+  reader = __utils__.get("alpm.sync_index")
+  if reader is None:
+    return None
+  cachedir = os.path.join(__opts__.get("cachedir", "/var/cache/salt/minion"), "alpm")
+  return reader(_dbpath(), cachedir, conf=_conf())
+
+
 def is_installed(name, runas=None):
   """
   Check if a package is installed via pacman/yay.
@@ -163,11 +179,19 @@ def is_installed(name, runas=None):
   CLI Example:
       salt '*' yay.is_installed firefox runas=admin
   """
+  local = _local_versions()
+  if local is not None:
+    if name in local:
+      return True
+    # satisfied by a provider, as yay -Q would resolve it
+    provides = __utils__["alpm.local_provides"](_dbpath())
+    return bool(provides) and name in provides
+
   # yay -Q queries local database, works as any user
   # but we still use runas for consistency
   user = runas or "nobody"
 
-  result = __salt__["cmd.run_all"](
+  result = _run_all(
     f"yay -Q {name}", runas=user, python_shell=True, ignore_retcode=True
   )
 
@@ -187,9 +211,13 @@ def list_installed(runas=None):
   CLI Example:
       salt '*' yay.list_installed runas=admin
   """
+  local = _local_versions()
+  if local is not None:
+    return dict(local)
+
   user = runas or "nobody"
 
-  result = __salt__["cmd.run_all"]("yay -Q", runas=user, python_shell=True)
+  result = _run_all("yay -Q", runas=user, python_shell=True)
 
   if result["retcode"] != 0:
     return {}
@@ -264,7 +292,384 @@ def install(name, runas=None, refresh=False):
     }
 
 
-def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
+def _aur_info(names):
+  """
+  Query the AUR RPC for package metadata in one request.
+
+  Args:
+      names: Package names to look up
+
+  Returns:
+      dict: Package names mapped to AUR RPC result dicts
+  """
+  import salt.utils.http
+
+  if not names:
+    return {}
+  query = "&".join(f"arg[]={urllib.parse.quote(n)}" for n in names)
+  result = salt.utils.http.query(
+    f"{AUR_URL}/rpc/v5/info?{query}", decode=True, decode_type="json", verify_ssl=True
+  )
+  if "error" in result:
+    log.error("AUR RPC error for %s: %s", names, result["error"])
+    return {}
+  return {r["Name"]: r for r in result.get("dict", {}).get("results", [])}
+
+
+def _plan_aur(names):
+  """
+  Split packages into repo and AUR sets and resolve the AUR dependency graph.
+
+  Args:
+      names: Package names to install
+
+  Returns:
+      dict: ``repo`` (requested repo packages), ``repo_deps`` (repo packages
+      AUR builds need), ``aur`` (name -> AUR info for requested packages and
+      their AUR deps), ``provided`` (AUR-provided name -> package name) and
+      ``missing`` (name -> reason for anything that can't be resolved), or
+      None if the sync databases can't be read
+  """
+  sync = _sync_index()
+  if sync is None:
+    return None
+  dep_name = __utils__["alpm.dep_name"]
+  local = __utils__["alpm.local_packages"](_dbpath()) or {}
+  satisfied = set(local)
+  for pkg in local.values():
+    satisfied.update(dep_name(p) for p in pkg["provides"])
+
+  def _in_repo(pkg):
+    return pkg in sync["by_name"] or pkg in sync["provides"]
+
+  plan = {
+    "repo": [n for n in names if _in_repo(n)],
+    "repo_deps": set(),
+    "aur": {},
+    "provided": {},
+    "missing": {},
+  }
+  pending = [n for n in names if not _in_repo(n)]
+  while pending:
+    found = _aur_info(pending)
+    wanted = []
+    for pkg in pending:
+      if pkg not in found:
+        plan["missing"][pkg] = "not found in sync databases or AUR"
+        continue
+      plan["aur"][pkg] = found[pkg]
+      for provided in found[pkg].get("Provides") or []:
+        plan["provided"].setdefault(dep_name(provided), pkg)
+      deps = (
+        (found[pkg].get("Depends") or [])
+        + (found[pkg].get("MakeDepends") or [])
+        + (found[pkg].get("CheckDepends") or [])
+      )
+      for dep in map(dep_name, deps):
+        if dep in satisfied or dep in plan["aur"] or dep in wanted:
+          continue
+        if _in_repo(dep):
+          plan["repo_deps"].add(dep)
+        else:
+          wanted.append(dep)
+    pending = [d for d in wanted if d not in plan["aur"] and d not in plan["missing"]]
+
+  # A dep the AUR didn't know by name may be provided by another AUR package
+  for dep in [d for d in plan["missing"] if d in plan["provided"]]:
+    del plan["missing"][dep]
+  return plan
+
+
+def _build_cache():
+  """
+  AUR build cache settings from config.get (minion config, grains or pillar).
+
+  Returns:
+      dict: dir, max_bytes, max_age_days, fleet and sign; None when disabled
+  """
+  conf = __salt__["config.get"]("aur_build_cache", {})
+  if not conf or not conf.get("enabled", False):
+    return None
+  cachedir = __opts__.get("cachedir", "/var/cache/salt/minion")
+  return {
+    "dir": conf.get("dir") or os.path.join(cachedir, "aur-builds"),
+    "max_bytes": int(conf.get("max_mb", 10240)) * 1024 * 1024,
+    "max_age_days": conf.get("max_age_days", 60),
+    "fleet": conf.get("fleet", False),
+    "sign": conf.get("sign", False),
+  }
+
+
+def _arch():
+  return __grains__.get("cpuarch", "x86_64")
+
+
+def _build_cache_key(builddir):
+  """Hash PKGBUILD + .SRCINFO + arch for a cloned package base."""
+  try:
+    with open(os.path.join(builddir, "PKGBUILD"), "rb") as f:
+      pkgbuild = f.read()
+    with open(os.path.join(builddir, ".SRCINFO"), "rb") as f:
+      srcinfo = f.read()
+  except OSError as exc:
+    log.debug("AUR build cache: can't hash %s: %s", builddir, exc)
+    return None
+  return __utils__["aurcache.cache_key"](pkgbuild, srcinfo, _arch())
+
+
+def _build_cache_fetch(cache, key):
+  """Look a build up locally, then in the master's salt://aur-cache root."""
+  files = __utils__["aurcache.lookup"](cache["dir"], key)
+  if files or not cache["fleet"]:
+    return files
+
+  prefix = f"aur-cache/{_arch()}/{key}/"
+  remote = [p for p in __salt__["cp.list_master"](prefix=prefix) if ".pkg.tar" in p]
+  if not remote:
+    return None
+  local = [__salt__["cp.cache_file"](f"salt://{p}") for p in remote]
+  if not all(local):
+    return None
+  log.info("AUR build cache: fetched %s from master", key)
+  return __utils__["aurcache.store"](cache["dir"], key, local)
+
+
+def _build_cache_store(cache, key, built):
+  """Cache a successful build, share it with the fleet and trim the cache."""
+  files = __utils__["aurcache.store"](cache["dir"], key, built.values())
+  if cache["fleet"]:
+    # packages, their signatures and the SHA256SUMS the master checks
+    entry = os.path.join(cache["dir"], key)
+    for name in sorted(os.listdir(entry)):
+      path = os.path.join(entry, name)
+      upload = f"/aur-cache/{_arch()}/{key}/{name}"
+      if not __salt__["cp.push"](path, upload_path=upload):
+        log.debug("AUR build cache: cp.push %s refused (file_recv off?)", path)
+  __utils__["aurcache.evict"](cache["dir"], cache["max_bytes"], cache["max_age_days"])
+  return files
+
+
+def _aur_build(base, runas, cache=None):
+  """
+  Clone/update and build one AUR package base with makepkg as runas.
+
+  With a build cache, a base whose PKGBUILD + .SRCINFO + arch hash is
+  already cached (locally or on the master) is not rebuilt.
+
+  Args:
+      base: AUR PackageBase
+      runas: Build user
+      cache: _build_cache() settings, or None
+
+  Returns:
+      tuple: (files, error) - pkgname -> built package path on success,
+      or None and the failing cmd.run_all result
+  """
+  builddir = f"{_clean_env(runas)['HOME']}/.cache/yay/{base}"
+  # reset rather than pull: an AUR force-push leaves a diverged clone that
+  # --ff-only can never update; anything unusable is removed and re-cloned
+  fetch = _run_yay(
+    f"if ! (test -d {builddir}/.git && git -C {builddir} fetch -q origin"
+    f" && git -C {builddir} reset -q --hard origin/HEAD); then"
+    f" rm -rf {builddir} && git clone {AUR_URL}/{base}.git {builddir}; fi",
+    runas=runas,
+  )
+  if fetch["retcode"] != 0:
+    return None, fetch
+
+  key = _build_cache_key(builddir) if cache else None
+  if key:
+    files = _build_cache_fetch(cache, key)
+    if files:
+      log.info("AUR build cache hit for %s (%s)", base, key)
+      return files, None
+
+  sign = " --sign" if cache and cache["sign"] else ""
+  build = _run_yay(
+    f"cd {builddir} && makepkg --noconfirm --force --cleanbuild{sign}",
+    runas=runas,
+    timeout=3600,
+  )
+  if build["retcode"] != 0:
+    return None, build
+
+  listing = _run_yay(f"cd {builddir} && makepkg --packagelist", runas=runas)
+  if listing["retcode"] != 0:
+    return None, listing
+
+  files = {}
+  for path in listing["stdout"].split():
+    files[os.path.basename(path).rsplit("-", 3)[0]] = path
+
+  if key:
+    try:
+      files = _build_cache_store(cache, key, files)
+    except OSError as exc:
+      log.warning("AUR build cache: can't store %s: %s", base, exc)
+  return files, None
+
+
+def _install_parallel(to_install, runas, build_jobs, cache=None):
+  """
+  Install packages by building AUR packages concurrently.
+
+  Repo packages and the repo deps of AUR builds are installed up front so
+  makepkg never has to take the pacman lock. Independent AUR package bases
+  then build in a pool of build_jobs workers, each a separate makepkg run
+  as runas. AUR packages other AUR builds depend on are installed once
+  their level finishes (as deps, unless they were requested themselves);
+  everything requested goes in one final `yay -U` (pacman -U) transaction.
+
+  Args:
+      to_install: Package names not yet installed
+      runas: Build user
+      build_jobs: Maximum concurrent makepkg runs
+      cache: _build_cache() settings, or None
+
+  Returns:
+      tuple: (installed, failed) - package names, and name -> error string;
+      or None if the dependency graph can't be resolved (caller falls back
+      to a single yay -S)
+  """
+  plan = _plan_aur(to_install)
+  if plan is None:
+    return None
+
+  installed = []
+  failed = dict(plan["missing"])
+
+  def _fail_all(pkgs, result):
+    for pkg in pkgs:
+      failed.setdefault(pkg, result.get("stderr", "unknown error"))
+
+  # requested packages keep their explicit install reason, even when
+  # another target depends on them
+  requested = set(to_install)
+  repo_deps = plan["repo_deps"] - requested
+  if repo_deps:
+    deps = " ".join(sorted(repo_deps))
+    result = _run_yay(f"yay -S --needed --noconfirm --asdeps {deps}", runas=runas)
+    if result["retcode"] != 0:
+      _fail_all([n for n in to_install if n in plan["aur"]], result)
+      plan["aur"] = {}
+  if plan["repo"]:
+    repo = " ".join(plan["repo"])
+    result = _run_yay(f"yay -S --needed --noconfirm {repo}", runas=runas)
+    if result["retcode"] == 0:
+      installed.extend(plan["repo"])
+    else:
+      _fail_all(plan["repo"], result)
+
+  # Build graph over package bases
+  base_of = {pkg: info["PackageBase"] for pkg, info in plan["aur"].items()}
+  dep_name = __utils__["alpm.dep_name"]
+  base_deps = {base: set() for base in base_of.values()}
+  for pkg, info in plan["aur"].items():
+    deps = (
+      (info.get("Depends") or [])
+      + (info.get("MakeDepends") or [])
+      + (info.get("CheckDepends") or [])
+    )
+    for dep in map(dep_name, deps):
+      dep = plan["provided"].get(dep, dep)
+      if dep in failed:
+        base_deps[base_of[pkg]].add(f"!{dep}")
+      elif dep in base_of and base_of[dep] != base_of[pkg]:
+        base_deps[base_of[pkg]].add(base_of[dep])
+
+  files = {}
+  failed_bases = {}
+  remaining = set(base_deps)
+  with concurrent.futures.ThreadPoolExecutor(max_workers=build_jobs) as pool:
+    while remaining:
+      # Anything depending on a failed base (transitively) can't build
+      blocked = True
+      while blocked:
+        blocked = {
+          b
+          for b in remaining
+          if any(d in failed_bases or d.startswith("!") for d in base_deps[b])
+        }
+        for base in blocked:
+          failed_bases[base] = "dependency failed: " + ", ".join(
+            sorted(
+              d.lstrip("!")
+              for d in base_deps[base]
+              if d.startswith("!") or d in failed_bases
+            )
+          )
+        remaining -= blocked
+
+      ready = sorted(b for b in remaining if not base_deps[b] & remaining)
+      if not ready:
+        for base in remaining:
+          failed_bases[base] = "dependency cycle"
+        break
+
+      # one context copy per task: the loader dunders __salt__, __opts__,
+      # __utils__ and __context__ resolve through it, and a new thread
+      # starts without one
+      builds = [
+        pool.submit(contextvars.copy_context().run, _aur_build, b, runas, cache)
+        for b in ready
+      ]
+      for base, (built, error) in zip(ready, (f.result() for f in builds)):
+        if built is None:
+          failed_bases[base] = error.get("stderr", "unknown error")
+        else:
+          files.update(built)
+      remaining -= set(ready)
+
+      # Install this level's packages that later builds depend on
+      needed = sorted(
+        pkg
+        for pkg, base in base_of.items()
+        if base in ready
+        and base not in failed_bases
+        and any(base in base_deps[r] for r in remaining)
+        and pkg in files
+      )
+      for flags, pkgs in (
+        ("--asdeps ", [pkg for pkg in needed if pkg not in requested]),
+        ("", [pkg for pkg in needed if pkg in requested]),
+      ):
+        if not pkgs:
+          continue
+        paths = " ".join(files[pkg] for pkg in pkgs)
+        result = _run_yay(f"yay -U --needed --noconfirm {flags}{paths}", runas=runas)
+        if result["retcode"] != 0:
+          for pkg in pkgs:
+            failed_bases[base_of[pkg]] = result.get("stderr", "unknown error")
+
+  for pkg in to_install:
+    if pkg in base_of and base_of[pkg] in failed_bases:
+      failed.setdefault(pkg, failed_bases[base_of[pkg]])
+    elif pkg in base_of and pkg not in files:
+      failed.setdefault(pkg, f"makepkg did not produce a package for {pkg}")
+
+  # One final transaction for everything requested
+  targets = [pkg for pkg in to_install if pkg in files and pkg not in failed]
+  if targets:
+
+    def _run_batch(batch):
+      paths = " ".join(files[pkg] for pkg in batch)
+      return _run_yay(f"yay -U --needed --noconfirm {paths}", runas=runas)
+
+    result = _run_batch(targets)
+    if result["retcode"] == 0:
+      installed.extend(targets)
+    else:
+      good, bad = __utils__["pkgbatch.bisect"](targets, _run_batch, result)
+      installed.extend(good)
+      for pkg, single_result in bad.items():
+        failed[pkg] = single_result.get("stderr", "unknown error")
+
+  return installed, failed
+
+
+def installed(
+  name=None, pkgs=None, runas=None, refresh=False, build_jobs=None, **kwargs
+):
   """
   Ensure packages are installed using yay.
 
@@ -276,6 +681,11 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
       pkgs: List of package names
       runas: User to run as (REQUIRED - yay cannot run as root)
       refresh: Whether to refresh package database first
+      build_jobs: Concurrent AUR builds (defaults to the yay.build_jobs minion
+          option, else 1). Above 1, AUR packages are built in parallel with
+          makepkg and installed in one final transaction. The same pipeline
+          is used when the aur_build_cache config is enabled, so cached
+          builds (keyed by PKGBUILD + .SRCINFO + arch) are reused
 
   Returns:
       dict: State-compatible result with name, result, changes, comment
@@ -287,6 +697,7 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
             - firefox
             - chromium
           - runas: vegcom
+          - build_jobs: 4
 
       single_package:
         yay.installed:
@@ -331,35 +742,64 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
     ret["comment"] = f"All {len(already_installed)} package(s) already installed"
     return ret
 
+  if build_jobs is None:
+    build_jobs = __opts__.get("yay.build_jobs", 1)
+
+  # The makepkg pipeline runs for parallel builds and whenever the AUR build
+  # cache is on (a plain yay -S can't consult the cache)
+  cache = _build_cache()
+  parallel = None
+  if int(build_jobs) > 1 or cache:
+    if refresh:
+      _run_yay("yay -Sy --noconfirm", runas=runas)
+    parallel = _install_parallel(to_install, runas, max(1, int(build_jobs)), cache)
+    if parallel is None:
+      log.warning("Can't resolve AUR dependency graph, falling back to yay -S")
+
   # Install all needed packages in one yay call (more efficient)
-  cmd = "yay -S --needed --noconfirm"
-  if refresh:
-    cmd = "yay -Sy --needed --noconfirm"
+  base_cmd = "yay -S --needed --noconfirm"
+  cmd = "yay -Sy --needed --noconfirm" if refresh else base_cmd
 
   pkg_str = " ".join(to_install)
   cmd = f"{cmd} {pkg_str}"
 
-  result = _run_yay(cmd, runas=runas, timeout=600)
-
-  if result["retcode"] == 0:
-    # Verify what actually got installed
+  if parallel is not None:
+    # The build pipeline already attributed every package
+    result = {}
+    good, bad = parallel
     for pkg in to_install:
-      if is_installed(pkg, runas=runas):
+      if pkg in bad:
+        failed_pkgs.append(pkg)
+        errors.append(f"{pkg}: {bad[pkg]}")
+      elif pkg in good:
         installed_pkgs.append(pkg)
         ret["changes"][pkg] = {"old": "", "new": "installed"}
-      else:
-        # Package didn't install despite success retcode (weird but possible)
-        failed_pkgs.append(pkg)
   else:
-    # Batch install failed - try individually to see what works
-    log.warning(f"Batch install failed, trying packages individually: {to_install}")
+    result = _run_yay(cmd, runas=runas, timeout=600)
+
+    if result["retcode"] == 0:
+      # Verify what actually got installed
+      for pkg in to_install:
+        if is_installed(pkg, runas=runas):
+          installed_pkgs.append(pkg)
+          ret["changes"][pkg] = {"old": "", "new": "installed"}
+        else:
+          # Package didn't install despite success retcode (weird but possible)
+          failed_pkgs.append(pkg)
+    else:
+      # Batch install failed - bisect to isolate the failing package(s)
+      # instead of one AUR build + transaction per package
+      log.warning(f"Batch install failed, bisecting to find failures: {to_install}")
 
-    for pkg in to_install:
-      single_result = install(pkg, runas=runas, refresh=refresh)
-      if single_result["success"]:
+      def _run_batch(batch):
+        return _run_yay(f"{base_cmd} {' '.join(batch)}", runas=runas, timeout=600)
+
+      good, bad = __utils__["pkgbatch.bisect"](to_install, _run_batch, result)
+
+      for pkg in good:
         installed_pkgs.append(pkg)
         ret["changes"][pkg] = {"old": "", "new": "installed"}
-      else:
+      for pkg, single_result in bad.items():
         failed_pkgs.append(pkg)
         errors.append(f"{pkg}: {single_result.get('stderr', 'unknown error')}")
 
@@ -462,6 +902,78 @@ def upgrade(runas=None, refresh=True):
   }
 
 
+def _parse_query_upgrades(stdout):
+  """Parse `yay -Qu` output ("name old -> new") into plan entries."""
+  plan = {}
+  for line in stdout.splitlines():
+    parts = line.split()
+    if len(parts) >= 4 and parts[2] == "->" and "[ignored]" not in line:
+      plan[parts[0]] = {
+        "old": parts[1],
+        "new": parts[3],
+        "repo": None,
+        "download_size": None,
+        "installed_size_delta": None,
+      }
+  return plan
+
+
+def plan_upgrade(runas=None):
+  """
+  List the upgrades `yay -Su` would apply, without running it.
+
+  Repo packages are diffed against the sync databases as last synced
+  (see pacman.plan_upgrade); foreign packages are checked against the AUR
+  in one RPC request. AUR entries have repo "aur" and no sizes.
+
+  Args:
+      runas: User to run as (only needed for the `yay -Qu` fallback)
+
+  Returns:
+      dict: Package names mapped to ``old``/``new`` versions, ``repo``,
+      ``download_size`` and ``installed_size_delta`` in bytes
+
+  CLI Example:
+      salt '*' yay.plan_upgrade runas=admin
+  """
+  local = _local_packages()
+  index = _sync_index() if local is not None else None
+  if index is None:
+    # -Qu exits 1 when there is nothing to upgrade
+    result = _run_yay("yay -Qu", runas=runas, ignore_retcode=True)
+    return _parse_query_upgrades(result["stdout"])
+
+  plan = __utils__["alpm.upgrade_plan"](local, index, _conf())
+  foreign = [name for name in local if name not in index["by_name"]]
+  for name, aur in _aur_info(foreign).items():
+    old = local[name]["version"]
+    if __utils__["alpm.vercmp"](aur["Version"], old) > 0:
+      plan[name] = {
+        "old": old,
+        "new": aur["Version"],
+        "repo": "aur",
+        "download_size": None,
+        "installed_size_delta": None,
+      }
+  return plan
+
+
+def sync(runas=None):
+  """
+  Synchronize package databases (yay -Sy).
+
+  Args:
+      runas: User to run as (REQUIRED)
+
+  Returns:
+      dict: Command result
+
+  CLI Example:
+      salt '*' yay.sync runas=admin
+  """
+  return _run_yay("yay -Sy --noconfirm", runas=runas)
+
+
 def search(query, runas=None):
   """
   Search for packages in repos and AUR.
@@ -478,7 +990,7 @@ def search(query, runas=None):
   """
   user = runas or "nobody"
 
-  result = __salt__["cmd.run_all"](f"yay -Ss {query}", runas=user, python_shell=True)
+  result = _run_all(f"yay -Ss {query}", runas=user, python_shell=True)
 
   if result["retcode"] != 0:
     return []
@@ -514,7 +1026,7 @@ def info(name, runas=None):
   """
   user = runas or "nobody"
 
-  result = __salt__["cmd.run_all"](f"yay -Si {name}", runas=user, python_shell=True)
+  result = _run_all(f"yay -Si {name}", runas=user, python_shell=True)
 
   if result["retcode"] != 0:
     return {}
@@ -527,3 +1039,24 @@ def info(name, runas=None):
       info_dict[key.strip()] = value.strip()
 
   return info_dict
+
+
+def stats(since=0):
+  """
+  Summarize the yay commands run by this process (e.g. this highstate).
+
+  Args:
+      since: Only count commands after this ``seq`` (from an earlier call)
+
+  Returns:
+      dict: ``seq``, ``calls``, ``seconds`` and per-class (query, install,
+      remove, upgrade, sync, build) count, failures, latency percentiles
+      and stdout/stderr bytes
+
+  CLI Example:
+      salt '*' yay.stats
+  """
+  summarize = __utils__.get("cmdstats.summarize")
+  if summarize is None:
+    return {"seq": since, "calls": 0, "seconds": 0, "classes": {}}
+  return summarize(__context__.get(_STATS_KEY, []), since=int(since))
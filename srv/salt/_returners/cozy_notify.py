@@ -1,20 +1,100 @@
 """
 cozy_notify returner — desktop toast after highstate/orchestrate
+
+returner() only summarises the run, spools it and puts a flush request on
+a bounded queue; a background worker thread delivers, so the minion's
+return path never waits on a desktop. When the queue is full the request
+is dropped (and logged) rather than blocking; its run stays spooled and
+goes out with the next toast for the same minion and job family.
+
+Returns are coalesced per minion and job family: runs started by one
+orchestration (the orchestration_jid Salt passes to each state job), runs
+of one schedule entry, or otherwise a single job. Each return is appended
+to a spool file under {cachedir}/cozy_notify; whichever process holds the
+family's lock waits out the coalescing window and shows one toast for
+everything spooled meanwhile ("12 runs, 3 failed"). A minion gets at most
+one toast per min_interval; runs arriving sooner wait and are merged. The
+time of the last toast per minion is kept in {cachedir}/cozy_notify/last,
+so the limit survives minion restarts. Minion config:
+
+  cozy_notify.window: 10        seconds to gather a family's runs
+  cozy_notify.min_interval: 30  seconds between toasts for one minion
+
+On Linux the worker finds session buses by scanning /run/user/*/bus
+(cached for BUS_TTL seconds) and calls org.freedesktop.Notifications.Notify
+on each one over the bus socket itself: no who, sudo, bash or notify-send.
+The minion runs as root, which session buses accept by default. Windows
+toasts still go through BurntToast.
+
+The worker is not a daemon thread, so a job process waits for its queued
+toasts before exiting; the worker stops after IDLE_TIMEOUT seconds without
+work and is started again by the next toast.
 """
 
+import json
 import logging
+import os
 import platform
+import queue
+import socket
+import stat
+import struct
 import subprocess
+import threading
+import time
+import urllib.parse
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+  import msvcrt
 
 log = logging.getLogger(__name__)
 
 WATCHED_FUNS = {"state.highstate", "state.orchestrate", "state.sls"}
 
+QUEUE_SIZE = 64
+IDLE_TIMEOUT = 2
+RUN_USER = "/run/user"
+BUS_TTL = 60
+DBUS_TIMEOUT = 2
+MIN_UID = 1000
+WINDOW = 10
+MIN_INTERVAL = 30
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_lock = threading.Lock()
+_worker_thread = None
+_buses = {"at": None, "paths": []}
+
 
 def __virtual__():
   return "cozy_notify"
 
 
+def _reset_after_fork():
+  # a fork can happen while the parent's worker holds the lock
+  global _lock, _queue, _worker_thread
+  _lock = threading.Lock()
+  _queue = queue.Queue(maxsize=QUEUE_SIZE)
+  _worker_thread = None
+
+
+if hasattr(os, "register_at_fork"):
+  os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _family(ret):
+  """Which runs of one minion are coalesced into a single toast."""
+  for arg in ret.get("fun_args") or []:
+    if isinstance(arg, dict) and arg.get("orchestration_jid"):
+      return f"orch-{arg['orchestration_jid']}"
+  if ret.get("schedule"):
+    return f"schedule-{ret['schedule']}"
+  return f"job-{ret.get('jid', '')}"
+
+
 def returner(ret):
   fun = ret.get("fun", "")
   if fun not in WATCHED_FUNS:
@@ -22,10 +102,9 @@ def returner(ret):
 
   success = ret.get("success", False)
   minion_id = ret.get("id", "unknown")
-  status = "OK" if success else "FAILED"
-  title = f"Salt {status} — {minion_id}"
 
-  fun_args = ret.get("fun_args", [])
+  # kwargs (orchestration_jid, pillar, ...) come through as a trailing dict
+  fun_args = [a for a in ret.get("fun_args") or [] if not isinstance(a, dict)]
   sls = fun_args[0] if fun_args else "highstate"
 
   retdata = ret.get("return", {})
@@ -40,35 +119,380 @@ def returner(ret):
   else:
     body = sls
 
+  conf = _settings()
+  key = (minion_id, _family(ret))
+  try:
+    _spool(
+      conf["spool"], key, {"at": time.time(), "body": body, "success": bool(success)}
+    )
+  except OSError as exc:
+    log.critical("cozy_notify: cannot spool notification: %s", exc)
+    return
+  _enqueue(key, conf)
+
+
+def _settings():
+  """
+  Spool dir, window and rate limit, read in the job's thread.
+
+  __opts__ resolves through the loader context, which the worker thread
+  doesn't have, so they travel with each queued flush request.
+  """
+  return {
+    "spool": os.path.join(
+      __opts__.get("cachedir", "/var/cache/salt/minion"), "cozy_notify"
+    ),
+    "window": float(__opts__.get("cozy_notify.window", WINDOW)),
+    "interval": float(__opts__.get("cozy_notify.min_interval", MIN_INTERVAL)),
+  }
+
+
+def _enqueue(key, conf):
+  global _worker_thread
+  with _lock:
+    try:
+      _queue.put_nowait((*key, conf))
+    except queue.Full:
+      log.warning("cozy_notify: delivery queue full, deferring %s", key[0])
+      return
+    if _worker_thread is None:
+      _worker_thread = threading.Thread(target=_worker, name="cozy_notify")
+      _worker_thread.start()
+
+
+def _worker():
+  global _worker_thread
+  while True:
+    try:
+      item = _queue.get(timeout=IDLE_TIMEOUT)
+    except queue.Empty:
+      with _lock:
+        if _queue.empty():
+          _worker_thread = None
+          return
+      continue
+    try:
+      _flush(*item)
+    except Exception as exc:
+      log.critical("cozy_notify: notification failed: %s", exc)
+
+
+# --- spool, coalescing and rate limit, shared by all job processes ---
+
+
+def _spool_path(spool, minion_id, family, suffix):
+  name = urllib.parse.quote(f"{minion_id}@{family}", safe="@")
+  return os.path.join(spool, f"{name}.{suffix}")
+
+
+def _spool(spool, key, entry):
+  os.makedirs(spool, exist_ok=True)
+  # one short O_APPEND write per run, so concurrent processes don't interleave
+  fd = os.open(
+    _spool_path(spool, *key, "pending"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600
+  )
   try:
-    if platform.system() == "Windows":
-      _notify_windows(title, body)
+    os.write(fd, (json.dumps(entry) + "\n").encode())
+  finally:
+    os.close(fd)
+
+
+def _lock_file(f, blocking):
+  """Lock an open file against other processes; False if busy."""
+  try:
+    if fcntl:
+      fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
     else:
-      _notify_linux(title, body)
-  except Exception as exc:
-    log.critical("cozy_notify: notification failed: %s", exc)
+      f.seek(0)
+      msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+  except OSError:
+    if blocking:
+      raise
+    return False
+  return True
+
 
+def _read_entries(path):
+  entries = []
+  try:
+    with open(path) as f:
+      for line in f:
+        try:
+          entries.append(json.loads(line))
+        except ValueError:
+          continue
+  except OSError:
+    pass
+  return entries
+
+
+def _last_notified(spool, minion_id):
+  try:
+    with open(os.path.join(spool, "last", urllib.parse.quote(minion_id, safe=""))) as f:
+      return float(f.read())
+  except (OSError, ValueError):
+    return 0.0
+
+
+def _mark_notified(spool, minion_id, at):
+  os.makedirs(os.path.join(spool, "last"), exist_ok=True)
+  path = os.path.join(spool, "last", urllib.parse.quote(minion_id, safe=""))
+  tmp = f"{path}.{os.getpid()}.tmp"
+  with open(tmp, "w") as f:
+    f.write(repr(at))
+  os.replace(tmp, path)
+
+
+def _summary(minion_id, entries):
+  """(title, body, success) for one or more runs of a minion."""
+  failed = sum(1 for e in entries if not e["success"])
+  title = f"Salt {'FAILED' if failed else 'OK'} — {minion_id}"
+  if len(entries) == 1:
+    return title, entries[0]["body"], not failed
+  return title, f"{len(entries)} runs, {failed} failed", not failed
+
+
+def _flush(minion_id, family, conf):
+  """
+  Show one toast for everything spooled for (minion, family), unless
+  another process is already gathering it. conf is _settings().
+  """
+  spool = conf["spool"]
+  pending = _spool_path(spool, minion_id, family, "pending")
+  while True:
+    with open(_spool_path(spool, minion_id, family, "lock"), "a+") as lock:
+      if not _lock_file(lock, blocking=False):
+        return
+      entries = _read_entries(pending)
+      if not entries:
+        return
+      # this minion's families take turns on its rate limit
+      with open(os.path.join(spool, "last.lock"), "a+") as minion_lock:
+        _lock_file(minion_lock, blocking=True)
+        due = max(
+          min(e["at"] for e in entries) + conf["window"],
+          _last_notified(spool, minion_id) + conf["interval"],
+        )
+        # runs spooled while waiting are picked up below
+        time.sleep(max(0.0, due - time.time()))
+        taken = _spool_path(spool, minion_id, family, f"{os.getpid()}.taking")
+        try:
+          os.replace(pending, taken)
+        except FileNotFoundError:
+          return
+        entries = _read_entries(taken)
+        os.unlink(taken)
+        _mark_notified(spool, minion_id, time.time())
+      _deliver(*_summary(minion_id, entries))
+    # a run spooled between the take and the unlock would wait for the next one
+    if not os.path.exists(pending):
+      return
 
-def _notify_linux(title, body):
-  import pwd
 
+def _deliver(title, body, success):
+  if platform.system() == "Windows":
+    _notify_windows(title, body)
+  else:
+    _notify_linux(title, body, success)
+
+
+def _session_buses():
+  """Paths of the session bus sockets under /run/user, for regular users."""
+  now = time.monotonic()
+  if _buses["at"] is not None and now - _buses["at"] < BUS_TTL:
+    return _buses["paths"]
+
+  paths = []
   try:
-    result = subprocess.check_output(["who", "-q"], text=True, timeout=5)
-    users = list(set(result.split("\n")[0].split()))
-  except Exception:
-    users = []
+    names = os.listdir(RUN_USER)
+  except OSError:
+    names = []
+  for name in sorted(names):
+    if not name.isdigit() or int(name) < MIN_UID:
+      continue
+    path = os.path.join(RUN_USER, name, "bus")
+    try:
+      if stat.S_ISSOCK(os.stat(path).st_mode):
+        paths.append(path)
+    except OSError:
+      continue
+  _buses.update(at=now, paths=paths)
+  return paths
 
-  for user in users:
+
+def _notify_linux(title, body, success=True):
+  for path in _session_buses():
     try:
-      uid = pwd.getpwnam(user).pw_uid
-      dbus_addr = f"unix:path=/run/user/{uid}/bus"
-      cmd = (
-        f"DBUS_SESSION_BUS_ADDRESS={dbus_addr} DISPLAY=:0 "
-        f"notify-send -a Salt -i dialog-information '{title}' '{body}'"
-      )
-      subprocess.run(["sudo", "-u", user, "bash", "-c", cmd], timeout=5, check=False)
-    except Exception as exc:
-      log.debug("cozy_notify linux %s: %s", user, exc)
+      _dbus_notify(path, title, body, urgency=1 if success else 2)
+    except OSError as exc:
+      log.debug("cozy_notify linux %s: %s", path, exc)
+      # the session may have ended; look again next time
+      _buses["at"] = None
+
+
+# --- minimal D-Bus client: EXTERNAL auth, Hello, one method call ---
+
+_ALIGN = {"y": 1, "g": 1, "v": 1, "u": 4, "i": 4, "s": 4, "o": 4, "a": 4}
+
+
+def _pad(buf, n):
+  buf.extend(b"\0" * (-len(buf) % n))
+
+
+def _marshal(buf, sig, value):
+  """Append value of the single complete type sig, little-endian."""
+  code = sig[0]
+  if code == "y":
+    buf.append(value)
+  elif code in "ui":
+    _pad(buf, 4)
+    buf.extend(struct.pack("<I" if code == "u" else "<i", value))
+  elif code in "so":
+    data = value.encode()
+    _pad(buf, 4)
+    buf.extend(struct.pack("<I", len(data)) + data + b"\0")
+  elif code == "g":
+    data = value.encode()
+    buf.append(len(data))
+    buf.extend(data + b"\0")
+  elif code == "v":
+    inner_sig, inner = value
+    _marshal(buf, "g", inner_sig)
+    _marshal(buf, inner_sig, inner)
+  elif code == "a":
+    elem = sig[1:]
+    _pad(buf, 4)
+    at = len(buf)
+    buf.extend(b"\0\0\0\0")
+    _pad(buf, 8 if elem[0] in "({" else _ALIGN[elem[0]])
+    start = len(buf)
+    if elem[0] == "{":
+      items = [(elem[1], elem[2:-1], k, v) for k, v in value.items()]
+    elif elem[0] == "(":
+      # structs of single-character types only, e.g. (yv)
+      items = [tuple(elem[1:-1]) + tuple(item) for item in value]
+    else:
+      items = None
+      for item in value:
+        _marshal(buf, elem, item)
+    for key_sig, val_sig, key, val in items or ():
+      _pad(buf, 8)
+      _marshal(buf, key_sig, key)
+      _marshal(buf, val_sig, val)
+    struct.pack_into("<I", buf, at, len(buf) - start)
+  else:
+    raise ValueError(f"cannot marshal D-Bus type {sig!r}")
+
+
+def _message(serial, destination, path, interface, member, body=()):
+  """A METHOD_CALL message; body is a sequence of (signature, value)."""
+  payload = bytearray()
+  for sig, value in body:
+    _marshal(payload, sig, value)
+  fields = [
+    (1, ("o", path)),
+    (2, ("s", interface)),
+    (3, ("s", member)),
+    (6, ("s", destination)),
+  ]
+  if body:
+    fields.append((8, ("g", "".join(sig for sig, _ in body))))
+  msg = bytearray(b"l\x01\x00\x01")
+  msg.extend(struct.pack("<II", len(payload), serial))
+  _marshal(msg, "a(yv)", fields)
+  _pad(msg, 8)
+  return bytes(msg + payload)
+
+
+def _recv_exact(sock, n):
+  data = bytearray()
+  while len(data) < n:
+    chunk = sock.recv(n - len(data))
+    if not chunk:
+      raise ConnectionResetError("D-Bus peer closed the connection")
+    data.extend(chunk)
+  return bytes(data)
+
+
+def _recv_line(sock):
+  line = bytearray()
+  while not line.endswith(b"\r\n"):
+    line.extend(_recv_exact(sock, 1))
+  return bytes(line[:-2])
+
+
+def _read_message(sock):
+  """(type, {header field code: value}) of the next message on sock."""
+  head = _recv_exact(sock, 16)
+  order = {b"l": "<", b"B": ">"}.get(head[:1])
+  if order is None:
+    raise OSError("not a D-Bus message")
+  body_len, _, fields_len = struct.unpack(order + "III", head[4:16])
+  fields_end = 16 + fields_len
+  data = head + _recv_exact(sock, fields_len + (-fields_end % 8) + body_len)
+
+  fields, pos = {}, 16
+  while pos < fields_end:
+    pos += -pos % 8
+    code, sig_len = data[pos], data[pos + 1]
+    sig = data[pos + 2 : pos + 2 + sig_len].decode()
+    pos += 3 + sig_len
+    if sig in ("s", "o"):
+      pos += -pos % 4
+      (n,) = struct.unpack_from(order + "I", data, pos)
+      fields[code] = data[pos + 4 : pos + 4 + n].decode()
+      pos += 5 + n
+    elif sig == "g":
+      n = data[pos]
+      fields[code] = data[pos + 1 : pos + 1 + n].decode()
+      pos += 2 + n
+    elif sig == "u":
+      pos += -pos % 4
+      (fields[code],) = struct.unpack_from(order + "I", data, pos)
+      pos += 4
+    else:
+      raise OSError(f"unexpected D-Bus header field type {sig!r}")
+  return head[1], fields
+
+
+def _dbus_notify(path, title, body, urgency=1):
+  """Show a notification through the session bus at path."""
+  hello = _message(
+    1, "org.freedesktop.DBus", "/org/freedesktop/DBus", "org.freedesktop.DBus", "Hello"
+  )
+  notify = _message(
+    2,
+    "org.freedesktop.Notifications",
+    "/org/freedesktop/Notifications",
+    "org.freedesktop.Notifications",
+    "Notify",
+    [
+      ("s", "Salt"),
+      ("u", 0),
+      ("s", "dialog-information"),
+      ("s", title),
+      ("s", body),
+      ("as", []),
+      ("a{sv}", {"urgency": ("y", urgency)}),
+      ("i", -1),
+    ],
+  )
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    sock.settimeout(DBUS_TIMEOUT)
+    sock.connect(path)
+    uid = str(os.geteuid()).encode().hex().encode()
+    sock.sendall(b"\0AUTH EXTERNAL " + uid + b"\r\n")
+    reply = _recv_line(sock)
+    if not reply.startswith(b"OK"):
+      raise OSError(f"D-Bus auth rejected: {reply.decode(errors='replace')}")
+    sock.sendall(b"BEGIN\r\n" + hello + notify)
+    while True:
+      msg_type, fields = _read_message(sock)
+      # 2 = METHOD_RETURN, 3 = ERROR; 5 = REPLY_SERIAL, 4 = ERROR_NAME
+      if fields.get(5) == 2:
+        if msg_type == 3:
+          raise OSError(fields.get(4, "D-Bus error"))
+        return
 
 
 def _notify_windows(title, body):
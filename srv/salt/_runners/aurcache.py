@@ -0,0 +1,97 @@
+"""
+Salt runner — publishes AUR builds pushed by minions as a fleet-wide cache.
+
+Minions with aur_build_cache:fleet enabled cp.push each built package to
+the master (file_recv). collect() moves those uploads into
+/srv/data/fileroot/aur-cache/{arch}/{key}/, which the fileserver serves as
+salt://aur-cache/... so other minions can skip the build.
+
+Whatever is published here gets installed fleet-wide, so file_recv is off
+unless srv/master.d/file_recv.conf turns it on, and collect() only takes
+uploads that pass these master options:
+
+  aurcache.builders  minion ids (globs) allowed to publish builds; uploads
+                     from any other minion are deleted (default: none)
+  aurcache.keyring   keyring of the builders' public signing keys (gpg
+                     --export); when set, every package needs a detached
+                     signature gpgv accepts (aur_build_cache:sign)
+
+Every entry must also match the SHA256SUMS manifest pushed with it.
+
+Runs from the master schedule (srv/master.d/schedule.conf).
+"""
+
+import fnmatch
+import glob
+import logging
+import os
+import shutil
+
+log = logging.getLogger(__name__)
+
+__virtualname__ = "aurcache"
+
+
+def __virtual__():
+  return __virtualname__
+
+
+def collect(dest="/srv/data/fileroot/aur-cache", max_mb=51200, max_age_days=90):
+  """
+  Move minion-pushed AUR builds into the fleet cache and trim it.
+
+  Uploads from minions outside aurcache.builders, or that fail the
+  manifest/signature check, are deleted and listed under "rejected".
+
+  dest
+      Fleet cache root, served as salt://aur-cache
+  max_mb
+      Size cap per arch (LRU eviction past it). Default 50 GiB.
+  max_age_days
+      Drop builds not published or re-pushed for this long. Default 90.
+
+  CLI example::
+
+      salt-run aurcache.collect
+  """
+  pattern = os.path.join(
+    __opts__["cachedir"], "minions", "*", "files", "aur-cache", "*", "*"
+  )
+  builders = __opts__.get("aurcache.builders") or []
+  keyring = __opts__.get("aurcache.keyring")
+  published = []
+  rejected = []
+  for upload in glob.glob(pattern):
+    minion_id = upload.split(os.sep)[-5]
+    arch, key = upload.split(os.sep)[-2:]
+    if not any(fnmatch.fnmatch(minion_id, b) for b in builders):
+      reason = "not in aurcache.builders"
+    else:
+      reason = __utils__["aurcache.verify"](upload, keyring)
+    if reason:
+      log.warning(
+        "aurcache.collect: refused %s/%s from %s: %s", arch, key, minion_id, reason
+      )
+      rejected.append(f"{minion_id}: {arch}/{key}: {reason}")
+      shutil.rmtree(upload, ignore_errors=True)
+      continue
+    entry = os.path.join(dest, arch, key)
+    if os.path.isdir(entry):
+      os.utime(entry)
+    else:
+      os.makedirs(os.path.dirname(entry), exist_ok=True)
+      staging = f"{entry}.{os.getpid()}.tmp"
+      shutil.copytree(upload, staging)
+      os.rename(staging, entry)
+      published.append(f"{arch}/{key}")
+    shutil.rmtree(upload, ignore_errors=True)
+
+  evicted = []
+  for arch_dir in glob.glob(os.path.join(dest, "*")):
+    evicted += __utils__["aurcache.evict"](
+      arch_dir, int(max_mb) * 1024 * 1024, max_age_days
+    )
+
+  if published:
+    log.info("aurcache.collect: published %s", ", ".join(published))
+  return {"published": published, "rejected": rejected, "evicted": evicted}
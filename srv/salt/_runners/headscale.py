@@ -0,0 +1,165 @@
+"""
+Salt runner — turns headscale node changes into Salt events.
+
+poll() fetches the node list (If-None-Match with the last ETag; an
+unchanged body is recognised by its hash too), diffs it against the
+snapshot in /srv/data/headscale/nodes.json and fires one event per change:
+
+  cozy/headscale/node/online        node came online (or joined online)
+  cozy/headscale/node/offline       node went offline (or was removed)
+  cozy/headscale/node/tags-changed  node's tags changed
+  cozy/headscale/node/ips-changed   node's tailnet addresses changed
+
+Event data: node (givenName), name, ips, old_ips, tags, old_tags. The
+first poll only records a snapshot. Reactors (srv/master.d/reactor.conf)
+can then update just the affected minions instead of waiting for a
+highstate.
+
+Runs from the master schedule (srv/master.d/schedule.conf). Master config,
+same keys as the headscale pillar:
+
+  headscale:
+    login-server: https://vpn.example.com
+    api-key: ...
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+__virtualname__ = "headscale"
+
+TAG_PREFIX = "cozy/headscale/node/"
+
+
+def __virtual__():
+  return __virtualname__
+
+
+def _fire(tag, data):
+  import salt.utils.event
+
+  with salt.utils.event.get_master_event(
+    __opts__, __opts__["sock_dir"], listen=False
+  ) as event:
+    event.fire_event(data, tag)
+
+
+def _summary(node):
+  """The fields the feed diffs on."""
+  return {
+    "node": node.get("givenName") or node.get("name"),
+    "name": node.get("name"),
+    "online": bool(node.get("online")),
+    "ips": node.get("ipAddresses", []),
+    "tags": sorted(node.get("tags", [])),
+  }
+
+
+def _diff(old, new):
+  """(tag suffix, data) for each change between two snapshots."""
+  events = []
+  for key in sorted(old.keys() | new.keys()):
+    before, after = old.get(key), new.get(key)
+    current = after or before
+    data = {
+      "node": current["node"],
+      "name": current["name"],
+      "ips": current["ips"],
+      "old_ips": before["ips"] if before else [],
+      "tags": after["tags"] if after else [],
+      "old_tags": before["tags"] if before else [],
+    }
+    was_online = bool(before and before["online"])
+    is_online = bool(after and after["online"])
+    if is_online != was_online:
+      events.append(("online" if is_online else "offline", data))
+    if before and after and before["tags"] != after["tags"]:
+      events.append(("tags-changed", data))
+    if before and after and sorted(before["ips"]) != sorted(after["ips"]):
+      events.append(("ips-changed", data))
+  return events
+
+
+def _read(path):
+  try:
+    with open(path, encoding="utf-8") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+
+def _write(path, data):
+  tmp = f"{path}.{os.getpid()}.tmp"
+  with open(tmp, "w", encoding="utf-8") as f:
+    json.dump(data, f, indent=2, sort_keys=True)
+  os.replace(tmp, path)
+
+
+def poll(data_dir="/srv/data/headscale"):
+  """
+  Fetch the headscale node list and fire events for what changed.
+
+  data_dir
+      Where the last snapshot is kept
+
+  CLI example::
+
+      salt-run headscale.poll
+  """
+  config = __opts__.get("headscale", {})
+  base = config.get("login-server", "").rstrip("/")
+  if not base:
+    return {"error": "headscale:login-server not set in the master config"}
+
+  path = os.path.join(data_dir, "nodes.json")
+  snapshot = _read(path)
+  headers = {"Authorization": f"Bearer {config.get('api-key', '')}"}
+  if snapshot and snapshot.get("etag"):
+    headers["If-None-Match"] = snapshot["etag"]
+  try:
+    url = base + "/api/v1/node"
+    resp = __utils__["httpclient.request"](
+      url,
+      headers=headers,
+      ca_file=__opts__.get("ca_bundle"),
+      proxy=__utils__["httpclient.proxy_for"](url, __opts__),
+    )
+  except OSError as exc:
+    log.warning("headscale.poll: %s", exc)
+    return {"error": str(exc)}
+  if resp["status"] == 304:
+    return {"changed": False, "events": []}
+  if resp["status"] != 200 or not isinstance(resp["json"], dict):
+    log.warning("headscale.poll: API answered HTTP %s", resp["status"])
+    return {"error": f"HTTP {resp['status']}"}
+
+  digest = hashlib.sha256(resp["body"]).hexdigest()
+  if snapshot and snapshot.get("digest") == digest:
+    return {"changed": False, "events": []}
+
+  nodes = {}
+  for node in resp["json"].get("nodes", []):
+    key = str(node.get("id") or node.get("name"))
+    nodes[key] = _summary(node)
+
+  if snapshot and snapshot["nodes"] == nodes:
+    # only fields the feed ignores moved (lastSeen, expiry, ...)
+    return {"changed": False, "events": []}
+
+  events = _diff(snapshot["nodes"], nodes) if snapshot else []
+  for suffix, data in events:
+    _fire(TAG_PREFIX + suffix, data)
+  if events:
+    log.info("headscale.poll: fired %d node events", len(events))
+
+  os.makedirs(data_dir, exist_ok=True)
+  _write(path, {"etag": resp["headers"].get("etag"), "digest": digest, "nodes": nodes})
+  return {
+    "changed": True,
+    "initial": snapshot is None,
+    "events": [{"tag": TAG_PREFIX + s, **d} for s, d in events],
+  }
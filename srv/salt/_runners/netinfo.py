@@ -1,70 +1,438 @@
 """
-Salt runner — collects netinfo from a minion and writes /srv/data/network/{id}.json.
+Salt runner — collects netinfo from minions into a network inventory.
 
 Called by reactor on salt/beacon/*/network_settings/* events.
+
+collect_many() sends one job running both netinfo.default_gw and
+netinfo.wan_ips refresh=True (bypassing the minion's WAN cache) to every
+listed minion and streams the returns with cmd_iter. collect() with a
+window queues the minion instead: the first caller waits window seconds,
+then collects everything queued meanwhile in one job, so a burst of
+beacons from many minions becomes a single publish.
+
+Returns go into an SQLite database (WAL mode) at {data_dir}/inventory.db:
+
+  minions   current gateway / interface / WAN list per minion
+  wan       one row per (minion, WAN address), indexed by address
+  history   append-only, one row each time a minion's network changed
+
+Each batch is one transaction, so readers never see half an update.
+query() answers cross-minion questions from the indexes; history() shows a
+minion's changes. A changed minion is also exported to the old per-minion
+layout, {data_dir}/{id}.json, and export() rewrites all of them. Those
+files are replaced atomically (temp file, fsync, rename) under a
+per-minion lock in {data_dir}/.locks, so a reader or a crash never sees a
+torn file. An existing directory of JSON files is imported the first time
+the database is created.
 """
 
+import contextlib
 import datetime
+import fcntl
 import json
 import logging
 import os
+import sqlite3
+import time
 
 log = logging.getLogger(__name__)
 
 __virtualname__ = "netinfo"
 
+FUNCTIONS = ["netinfo.default_gw", "netinfo.wan_ips"]
+# A collect follows a network change, so the minion's cached WAN answer
+# (netinfo.wan_ttl) is stale by definition
+ARGS = [[], ["refresh=True"]]
+
 
 def __virtual__():
   return __virtualname__
 
 
-def collect(minion_id, data_dir="/srv/data/network"):
-  """
-  Collect wan_ips + default_gw from minion, write timestamped JSON to data_dir.
+def _client():
+  import salt.client
 
-  CLI example::
+  return salt.client.LocalClient()
 
-      salt-run netinfo.collect guava
-  """
-  import salt.client
 
-  client = salt.client.LocalClient()
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS minions (
+  minion_id TEXT PRIMARY KEY,
+  gateway TEXT,
+  interface TEXT,
+  wan TEXT NOT NULL,
+  changed TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS minions_gateway ON minions (gateway);
+CREATE INDEX IF NOT EXISTS minions_interface ON minions (interface);
+CREATE TABLE IF NOT EXISTS wan (
+  ip TEXT NOT NULL,
+  minion_id TEXT NOT NULL,
+  PRIMARY KEY (ip, minion_id)
+);
+CREATE INDEX IF NOT EXISTS wan_minion ON wan (minion_id);
+CREATE TABLE IF NOT EXISTS history (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  minion_id TEXT NOT NULL,
+  gateway TEXT,
+  interface TEXT,
+  wan TEXT NOT NULL,
+  changed TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_minion ON history (minion_id, id);
+"""
+
+FIELDS = ("gateway", "interface", "wan")
+
+
+def _connect(data_dir):
+  """Open (creating and importing on first use) the inventory database."""
+  os.makedirs(data_dir, exist_ok=True)
+  path = os.path.join(data_dir, "inventory.db")
+  # autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+  conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+  conn.row_factory = sqlite3.Row
+  conn.execute("PRAGMA journal_mode=WAL")
+  conn.execute("PRAGMA synchronous=NORMAL")
+  conn.executescript(SCHEMA)
+  if not conn.execute("PRAGMA user_version").fetchone()[0]:
+    _import_json(conn, data_dir)
+  return conn
+
 
-  gw = client.cmd(minion_id, "netinfo.default_gw", timeout=15)
-  wan = client.cmd(minion_id, "netinfo.wan_ips", timeout=15)
+@contextlib.contextmanager
+def _transaction(conn):
+  """A write transaction, taking the database write lock up front."""
+  conn.execute("BEGIN IMMEDIATE")
+  try:
+    yield
+  except BaseException:
+    conn.execute("ROLLBACK")
+    raise
+  conn.execute("COMMIT")
 
-  gw_data = gw.get(minion_id) or {}
-  wan_data = wan.get(minion_id) or []
 
-  result = {
-    "gateway": gw_data.get("gateway"),
-    "interface": gw_data.get("interface"),
-    "wan": wan_data,
-    "__changed__": datetime.datetime.utcnow().isoformat() + "Z",
+def _import_json(conn, data_dir):
+  """Seed a new database from an existing {id}.json directory."""
+  with _transaction(conn):
+    # checked again under the write lock: another collect may have won
+    if conn.execute("PRAGMA user_version").fetchone()[0]:
+      return
+    conn.execute("PRAGMA user_version = 1")
+    for name in sorted(os.listdir(data_dir)):
+      if not name.endswith(".json"):
+        continue
+      try:
+        with open(os.path.join(data_dir, name)) as f:
+          data = json.load(f)
+      except (OSError, ValueError):
+        continue
+      if isinstance(data, dict):
+        _upsert(conn, name[: -len(".json")], _row(data))
+
+
+def _row(data):
+  """The stored shape of one minion's network."""
+  wan = data.get("wan")
+  return {
+    "gateway": data.get("gateway"),
+    "interface": data.get("interface"),
+    "wan": sorted(wan) if isinstance(wan, list) else [],
+    "__changed__": data.get("__changed__")
+    or datetime.datetime.utcnow().isoformat() + "Z",
   }
 
-  os.makedirs(data_dir, exist_ok=True)
+
+def _current(conn, minion_id):
+  row = conn.execute(
+    "SELECT gateway, interface, wan, changed FROM minions WHERE minion_id = ?",
+    (minion_id,),
+  ).fetchone()
+  return _decode(row) if row else None
+
+
+def _decode(row):
+  return {
+    "gateway": row["gateway"],
+    "interface": row["interface"],
+    "wan": json.loads(row["wan"]),
+    "__changed__": row["changed"],
+  }
+
+
+def _upsert(conn, minion_id, result):
+  """Store result as minion_id's current state and append it to history."""
+  wan = json.dumps(result["wan"])
+  values = (minion_id, result["gateway"], result["interface"], wan)
+  conn.execute(
+    "INSERT INTO minions (minion_id, gateway, interface, wan, changed)"
+    " VALUES (?, ?, ?, ?, ?)"
+    " ON CONFLICT (minion_id) DO UPDATE SET gateway = excluded.gateway,"
+    " interface = excluded.interface, wan = excluded.wan,"
+    " changed = excluded.changed",
+    values + (result["__changed__"],),
+  )
+  conn.execute("DELETE FROM wan WHERE minion_id = ?", (minion_id,))
+  conn.executemany(
+    "INSERT OR IGNORE INTO wan (ip, minion_id) VALUES (?, ?)",
+    [(ip, minion_id) for ip in result["wan"]],
+  )
+  conn.execute(
+    "INSERT INTO history (minion_id, gateway, interface, wan, changed)"
+    " VALUES (?, ?, ?, ?, ?)",
+    values + (result["__changed__"],),
+  )
+
+
+def _write_atomic(path, data):
+  """Replace path with data so readers see the old file or the new one."""
+  tmp = f"{path}.{os.getpid()}.tmp"
+  try:
+    with open(tmp, "w") as f:
+      json.dump(data, f, indent=2)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp, path)
+  except BaseException:
+    with contextlib.suppress(OSError):
+      os.unlink(tmp)
+    raise
+  # make the rename itself durable
+  fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+
+@contextlib.contextmanager
+def _minion_lock(data_dir, minion_id):
+  """Exclusive lock on one minion's output across processes."""
+  lock_dir = os.path.join(data_dir, ".locks")
+  os.makedirs(lock_dir, exist_ok=True)
+  with open(os.path.join(lock_dir, f"{minion_id}.lock"), "w") as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    yield
+
+
+def _export(data_dir, minion_id, result):
+  """Write one minion in the per-minion JSON layout."""
   path = os.path.join(data_dir, f"{minion_id}.json")
+  _write_atomic(path, {k: result[k] for k in (*FIELDS, "__changed__")})
+  return path
 
-  existing = {}
-  if os.path.exists(path):
-    try:
-      with open(path) as f:
-        existing = json.load(f)
-    except Exception:
-      pass
-
-  changed = (
-    existing.get("gateway") != result["gateway"]
-    or existing.get("interface") != result["interface"]
-    or existing.get("wan") != result["wan"]
+
+def _record(conn, minion_id, returns):
+  """Store one minion's returns if its network changed; return the result."""
+  gw_data = returns.get("netinfo.default_gw")
+  wan_data = returns.get("netinfo.wan_ips")
+  result = _row(
+    {
+      "gateway": gw_data.get("gateway") if isinstance(gw_data, dict) else None,
+      "interface": gw_data.get("interface") if isinstance(gw_data, dict) else None,
+      "wan": wan_data,
+    }
   )
 
+  existing = _current(conn, minion_id) or {}
+  changed = any(existing.get(k) != result[k] for k in FIELDS)
   if changed:
-    with open(path, "w") as f:
-      json.dump(result, f, indent=2)
-    log.info("netinfo.collect: %s network changed, wrote %s", minion_id, path)
+    _upsert(conn, minion_id, result)
+    log.info("netinfo.collect: %s network changed", minion_id)
   else:
     log.debug("netinfo.collect: %s no change, skipping write", minion_id)
+    result = existing
 
   return {"changed": changed, **result}
+
+
+def collect_many(minions, data_dir="/srv/data/network", timeout=15):
+  """
+  Collect wan_ips + default_gw from many minions in one job.
+
+  minions
+      List (or comma-separated string) of minion ids
+  timeout
+      Seconds to wait for the slowest minion
+
+  CLI example::
+
+      salt-run netinfo.collect_many guava,papaya
+  """
+  if isinstance(minions, str):
+    minions = minions.split(",")
+  minions = sorted(set(minions))
+  if not minions:
+    return {}
+
+  returns = {}
+  for chunk in _client().cmd_iter(
+    minions, FUNCTIONS, ARGS, tgt_type="list", timeout=timeout
+  ):
+    for minion_id, data in chunk.items():
+      ret = data.get("ret") if isinstance(data, dict) else None
+      returns[minion_id] = ret if isinstance(ret, dict) else {}
+
+  conn = _connect(data_dir)
+  try:
+    with _transaction(conn):
+      # minions that didn't answer are recorded as before: no gateway, no WAN
+      results = {m: _record(conn, m, returns.get(m, {})) for m in minions}
+
+    for minion_id, result in results.items():
+      if result["changed"]:
+        # a concurrent collect may have committed a newer state since; export
+        # whatever is current so the last writer never leaves a stale file
+        with _minion_lock(data_dir, minion_id):
+          _export(data_dir, minion_id, _current(conn, minion_id))
+  finally:
+    conn.close()
+  return results
+
+
+def _drain(pending_dir):
+  """Take every queued minion id out of pending_dir."""
+  taken = []
+  try:
+    names = os.listdir(pending_dir)
+  except OSError:
+    return taken
+  for name in names:
+    try:
+      os.unlink(os.path.join(pending_dir, name))
+    except OSError:
+      continue
+    taken.append(name)
+  return taken
+
+
+def collect(minion_id, data_dir="/srv/data/network", window=0):
+  """
+  Collect wan_ips + default_gw from minion, write timestamped JSON to data_dir.
+
+  window
+      Seconds to coalesce events over. 0 (default) collects this minion
+      right away; otherwise the minion is queued and whichever call holds
+      the collector lock sends one job for everything queued. Batches are
+      at least window seconds apart, so a minion is written at most once
+      per window however often its beacon fires.
+
+  CLI example::
+
+      salt-run netinfo.collect guava
+  """
+  if not window:
+    return collect_many([minion_id], data_dir)[minion_id]
+
+  pending_dir = os.path.join(data_dir, ".pending")
+  os.makedirs(pending_dir, exist_ok=True)
+  with open(os.path.join(pending_dir, minion_id), "w"):
+    pass
+
+  collected = {}
+  lock_path = os.path.join(data_dir, ".collect.lock")
+  while True:
+    with open(lock_path, "w") as lock:
+      try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except BlockingIOError:
+        # another collect is gathering the batch and will pick this up
+        return {"queued": minion_id, "collected": collected}
+      while True:
+        time.sleep(float(window))
+        batch = _drain(pending_dir)
+        log.info("netinfo.collect: collecting %d minions in one job", len(batch))
+        collected.update(collect_many(batch, data_dir))
+        if not os.listdir(pending_dir):
+          break
+    # an id queued after the last drain but before the unlock would be lost
+    if not os.listdir(pending_dir):
+      return {"collected": collected}
+
+
+def query(
+  wan=None, gateway=None, interface=None, minion=None, data_dir="/srv/data/network"
+):
+  """
+  Look minions up in the inventory. Filters combine with AND; with none,
+  every minion is returned.
+
+  wan
+      WAN address the minion reports (e.g. which minions share a NAT)
+  gateway
+      Default gateway address
+  interface
+      Default route interface
+  minion
+      Minion id
+
+  CLI example::
+
+      salt-run netinfo.query wan=203.0.113.7
+      salt-run netinfo.query gateway=10.0.0.1 interface=eth0
+  """
+  where, params = [], []
+  if wan is not None:
+    where.append("minion_id IN (SELECT minion_id FROM wan WHERE ip = ?)")
+    params.append(wan)
+  for column, value in (
+    ("gateway", gateway),
+    ("interface", interface),
+    ("minion_id", minion),
+  ):
+    if value is not None:
+      where.append(f"{column} = ?")
+      params.append(value)
+
+  sql = "SELECT minion_id, gateway, interface, wan, changed FROM minions"
+  if where:
+    sql += " WHERE " + " AND ".join(where)
+  conn = _connect(data_dir)
+  try:
+    rows = conn.execute(sql + " ORDER BY minion_id", params).fetchall()
+  finally:
+    conn.close()
+  return {row["minion_id"]: _decode(row) for row in rows}
+
+
+def history(minion_id, limit=20, data_dir="/srv/data/network"):
+  """
+  A minion's recorded network changes, newest first.
+
+  limit
+      How many changes to return
+
+  CLI example::
+
+      salt-run netinfo.history guava limit=5
+  """
+  conn = _connect(data_dir)
+  try:
+    rows = conn.execute(
+      "SELECT gateway, interface, wan, changed FROM history"
+      " WHERE minion_id = ? ORDER BY id DESC LIMIT ?",
+      (minion_id, int(limit)),
+    ).fetchall()
+  finally:
+    conn.close()
+  return [_decode(row) for row in rows]
+
+
+def export(data_dir="/srv/data/network", dest=None):
+  """
+  Write every minion in the inventory as {dest}/{id}.json, the layout
+  collect() used before the database.
+
+  dest
+      Output directory (default: data_dir)
+
+  CLI example::
+
+      salt-run netinfo.export
+  """
+  dest = dest or data_dir
+  os.makedirs(dest, exist_ok=True)
+  return sorted(
+    _export(dest, minion_id, result)
+    for minion_id, result in query(data_dir=data_dir).items()
+  )
@@ -0,0 +1,168 @@
+"""
+Salt runner — maintains the fleet pacman package cache on the master.
+
+Minions with pacman_fleet_cache enabled take package files from
+salt://pacman-cache/{arch}/ before falling back to their upstream mirrors,
+and cp.push what they had to download themselves (file_recv). collect()
+moves those uploads into /srv/data/fileroot/pacman-cache/{arch}/, one copy
+per filename, and trims the cache to a size cap in least-recently-used
+order (file atime, which the fileserver's reads bump under relatime).
+
+file_recv is off unless srv/master.d/file_recv.conf turns it on, and
+collect() only publishes uploads from the minion ids (globs) in the
+pacmancache.pushers master option (default: none); the rest are deleted.
+Minions still check every file they take from the cache against the
+sha256 in their sync database before pacman sees it.
+
+Runs from the master schedule (srv/master.d/schedule.conf).
+"""
+
+import fnmatch
+import glob
+import logging
+import os
+import shutil
+
+log = logging.getLogger(__name__)
+
+__virtualname__ = "pacmancache"
+
+
+def __virtual__():
+  return __virtualname__
+
+
+def _files(dest):
+  """(last used, size, path) for every cached package file."""
+  entries = []
+  for path in glob.glob(os.path.join(dest, "*", "*.pkg.tar*")):
+    try:
+      st = os.stat(path)
+    except OSError:
+      continue
+    entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+  return entries
+
+
+def _discard(path):
+  if os.path.isdir(path) and not os.path.islink(path):
+    shutil.rmtree(path, ignore_errors=True)
+  else:
+    os.unlink(path)
+
+
+def collect(dest="/srv/data/fileroot/pacman-cache", max_mb=20480):
+  """
+  Move minion-pushed package files into the fleet cache and trim it.
+
+  Uploads from minions outside pacmancache.pushers are deleted and
+  listed under "rejected".
+
+  dest
+      Fleet cache root, served as salt://pacman-cache
+  max_mb
+      Size cap for the whole cache (LRU eviction past it). Default 20 GiB.
+
+  CLI example::
+
+      salt-run pacmancache.collect
+  """
+  pattern = os.path.join(
+    __opts__["cachedir"], "minions", "*", "files", "pacman-cache", "*", "*.pkg.tar*"
+  )
+  pushers = __opts__.get("pacmancache.pushers") or []
+  published = []
+  rejected = []
+  duplicates = 0
+  for upload in glob.glob(pattern):
+    minion_id = upload.split(os.sep)[-5]
+    arch, filename = upload.split(os.sep)[-2:]
+    if not any(fnmatch.fnmatch(minion_id, p) for p in pushers):
+      reason = "not in pacmancache.pushers"
+    elif os.path.islink(upload) or not os.path.isfile(upload):
+      reason = "not a regular file"
+    else:
+      reason = None
+    if reason:
+      log.warning(
+        "pacmancache.collect: refused %s/%s from %s: %s",
+        arch,
+        filename,
+        minion_id,
+        reason,
+      )
+      rejected.append(f"{minion_id}: {arch}/{filename}: {reason}")
+      _discard(upload)
+      continue
+    entry = os.path.join(dest, arch, filename)
+    if os.path.exists(entry):
+      duplicates += 1
+      os.unlink(upload)
+      continue
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    staging = f"{entry}.{os.getpid()}.tmp"
+    shutil.move(upload, staging)
+    os.rename(staging, entry)
+    published.append(f"{arch}/{filename}")
+
+  entries = sorted(_files(dest))
+  total = sum(size for _, size, _ in entries)
+  cap = int(max_mb) * 1024 * 1024
+  evicted = []
+  for _, size, path in entries:
+    if total <= cap:
+      break
+    os.unlink(path)
+    total -= size
+    evicted.append(os.path.relpath(path, dest))
+
+  if published or evicted:
+    log.info(
+      "pacmancache.collect: published %d, evicted %d", len(published), len(evicted)
+    )
+  return {
+    "published": published,
+    "rejected": rejected,
+    "duplicates": duplicates,
+    "evicted": evicted,
+  }
+
+
+def stats(dest="/srv/data/fileroot/pacman-cache", tgt="G@os_family:Arch"):
+  """
+  Report fleet cache size and the minions' cumulative hit statistics.
+
+  dest
+      Fleet cache root
+  tgt
+      Compound target for the minions to ask (pacman.fleet_cache_stats)
+
+  CLI example::
+
+      salt-run pacmancache.stats
+  """
+  import salt.client
+
+  entries = _files(dest)
+  ret = {
+    "files": len(entries),
+    "bytes": sum(size for _, size, _ in entries),
+    "hits": 0,
+    "misses": 0,
+    "bytes_saved": 0,
+    "bytes_downloaded": 0,
+    "minions": {},
+  }
+
+  client = salt.client.LocalClient()
+  replies = client.cmd(tgt, "pacman.fleet_cache_stats", tgt_type="compound", timeout=15)
+  for minion_id, minion_stats in replies.items():
+    if not isinstance(minion_stats, dict):
+      continue
+    ret["minions"][minion_id] = minion_stats
+    for key in ("hits", "misses", "bytes_saved", "bytes_downloaded"):
+      ret[key] += minion_stats.get(key, 0)
+
+  total = ret["hits"] + ret["misses"]
+  ret["hit_rate"] = round(ret["hits"] / total, 3) if total else 0.0
+  return ret
@@ -0,0 +1,217 @@
+"""
+Salt runner — resolves the GitHub release tags the state tree asks for.
+
+Scans the state tree for salt['github_release.latest'](...) calls.
+resolve() looks the tags up once on the master and writes
+/srv/data/releases/tags.json, which srv/pillar/common/releases.sls
+publishes as the github_releases pillar; github_release.latest() answers
+from that pillar before going to the network. prefetch() instead asks the
+targeted minions to resolve them all with one github_release.latest_many
+call per prerelease flag.
+
+resolve() runs from the master schedule (srv/master.d/schedule.conf),
+prefetch() from the highstate orchestrations (srv/salt/orch/). Master
+options:
+
+  github_release.api_url   API base (default https://api.github.com)
+  github_release.token     token for resolve() (or GITHUB_TOKEN)
+"""
+
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import re
+
+log = logging.getLogger(__name__)
+
+__virtualname__ = "releases"
+
+API_URL = "https://api.github.com"
+
+# Concurrent lookups in resolve()
+RESOLVE_WORKERS = 8
+
+# salt['github_release.latest']('owner/name', ..., prerelease=True)
+_LATEST_RE = re.compile(
+  r"github_release\.latest['\"]\]\(\s*['\"]([\w.-]+/[\w.-]+)['\"]([^)]*)\)"
+)
+
+
+def __virtual__():
+  return __virtualname__
+
+
+def referenced(saltenv="base"):
+  """
+  List the repos the state tree passes to github_release.latest.
+
+  saltenv
+      file_roots environment to scan
+
+  CLI example::
+
+      salt-run releases.referenced
+  """
+  repos = {"stable": set(), "prerelease": set()}
+  for root in __opts__.get("file_roots", {}).get(saltenv, []):
+    for dirpath, _dirnames, filenames in os.walk(root):
+      for filename in filenames:
+        if not filename.endswith((".sls", ".jinja")):
+          continue
+        try:
+          with open(os.path.join(dirpath, filename), encoding="utf-8") as f:
+            text = f.read()
+        except (OSError, UnicodeDecodeError):
+          continue
+        for repo, args in _LATEST_RE.findall(text):
+          flag = "prerelease" if re.search(r"prerelease\s*=\s*True", args) else "stable"
+          repos[flag].add(repo)
+  return {flag: sorted(names) for flag, names in repos.items()}
+
+
+def prefetch(tgt="*", tgt_type="glob", saltenv="base"):
+  """
+  Resolve every referenced repo on the targeted minions in one batch.
+
+  tgt / tgt_type
+      Minions to warm
+
+  CLI example::
+
+      salt-run releases.prefetch tgt='G@os_family:Arch' tgt_type=compound
+  """
+  import salt.client
+
+  client = salt.client.LocalClient()
+  repos = referenced(saltenv)
+  ret = {}
+  for flag, names in repos.items():
+    if not names:
+      continue
+    replies = client.cmd(
+      tgt,
+      "github_release.latest_many",
+      arg=[names],
+      kwarg={"prerelease": flag == "prerelease"},
+      tgt_type=tgt_type,
+      timeout=60,
+    )
+    for minion_id, tags in replies.items():
+      ret.setdefault(minion_id, {}).update(tags if isinstance(tags, dict) else {})
+  log.info(
+    "releases.prefetch: warmed %d repos on %d minions",
+    sum(map(len, repos.values())),
+    len(ret),
+  )
+  return ret
+
+
+def _lookup(repo, prerelease, previous):
+  """
+  Fetch one tag, revalidating with the ETag from the last run.
+
+  Returns:
+      dict: tag, etag and last_modified, or None if GitHub couldn't answer
+  """
+  api = __opts__.get("github_release.api_url", API_URL).rstrip("/")
+  url = f"{api}/repos/{repo}/releases" + ("" if prerelease else "/latest")
+  headers = {"Accept": "application/vnd.github+json"}
+  token = __opts__.get("github_release.token") or os.environ.get("GITHUB_TOKEN")
+  if token:
+    headers["Authorization"] = f"Bearer {token}"
+  if previous.get("etag"):
+    headers["If-None-Match"] = previous["etag"]
+  if previous.get("last_modified"):
+    headers["If-Modified-Since"] = previous["last_modified"]
+  try:
+    resp = __utils__["httpclient.request"](
+      url,
+      headers=headers,
+      timeout=10,
+      ca_file=__opts__.get("ca_bundle"),
+      proxy=__utils__["httpclient.proxy_for"](url, __opts__),
+    )
+    if resp["status"] == 304 and previous.get("tag"):
+      return previous
+    if resp["status"] != 200:
+      raise ValueError(f"HTTP {resp['status']}")
+    data = resp["json"]
+    return {
+      "tag": data[0]["tag_name"] if prerelease else data["tag_name"],
+      "etag": resp["headers"].get("etag"),
+      "last_modified": resp["headers"].get("last-modified"),
+    }
+  except (OSError, ValueError, LookupError, TypeError) as exc:
+    log.warning("releases.resolve: %s failed: %s", repo, exc)
+  return None
+
+
+def _read(path):
+  try:
+    with open(path, encoding="utf-8") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def _write(path, data):
+  tmp = f"{path}.{os.getpid()}.tmp"
+  with open(tmp, "w", encoding="utf-8") as f:
+    json.dump(data, f, indent=2, sort_keys=True)
+  os.replace(tmp, path)
+
+
+def resolve(data_dir="/srv/data/releases", saltenv="base"):
+  """
+  Resolve every referenced repo on the master and publish the tags.
+
+  Writes {data_dir}/tags.json ({stable: {repo: tag}, prerelease: {...}})
+  when a tag changed. Repos GitHub can't answer for keep their last tag.
+
+  data_dir
+      Output directory (read by srv/pillar/common/releases.sls)
+
+  CLI example::
+
+      salt-run releases.resolve
+  """
+  path = os.path.join(data_dir, "tags.json")
+  meta_path = os.path.join(data_dir, "etags.json")
+  existing = _read(path)
+  meta = _read(meta_path)
+
+  jobs = [(flag, repo) for flag, names in referenced(saltenv).items() for repo in names]
+  result = {"stable": {}, "prerelease": {}}
+  failed = []
+  with concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(1, min(RESOLVE_WORKERS, len(jobs)))
+  ) as pool:
+    futures = {
+      pool.submit(
+        _lookup, repo, flag == "prerelease", meta.get(f"{repo}|{flag}", {})
+      ): (flag, repo)
+      for flag, repo in jobs
+    }
+    for future in concurrent.futures.as_completed(futures):
+      flag, repo = futures[future]
+      entry = future.result()
+      if entry:
+        result[flag][repo] = entry["tag"]
+        meta[f"{repo}|{flag}"] = entry
+      else:
+        failed.append(repo)
+        if repo in existing.get(flag, {}):
+          result[flag][repo] = existing[flag][repo]
+
+  os.makedirs(data_dir, exist_ok=True)
+  _write(meta_path, meta)
+  changed = any(existing.get(flag) != result[flag] for flag in result)
+  if changed:
+    result["__changed__"] = datetime.datetime.utcnow().isoformat() + "Z"
+    _write(path, result)
+    log.info("releases.resolve: tags changed, wrote %s", path)
+  else:
+    result["__changed__"] = existing.get("__changed__")
+  return {"changed": changed, "failed": sorted(failed), **result}
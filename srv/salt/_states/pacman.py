@@ -25,11 +25,29 @@ Usage in states:
         - name: unwanted-pkg
 """
 
+import functools
 import logging
 
 log = logging.getLogger(__name__)
 
 
+def _with_stats(func):
+  """
+  Attach the pacman commands a state ran to its return as ``stats``
+  (see pacman.stats: per-class counts, latency percentiles, output bytes).
+  """
+
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    since = __salt__["pacman.stats"]()["seq"]
+    ret = func(*args, **kwargs)
+    ret["stats"] = __salt__["pacman.stats"](since=since)
+    return ret
+
+  return wrapper
+
+
+@_with_stats
 def sync(name="pacman.sync", runas=None, **kwargs):
   """
   Synchronize package databases (pacman -Sy).
@@ -79,6 +97,7 @@ def sync(name="pacman.sync", runas=None, **kwargs):
   return ret
 
 
+@_with_stats
 def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
   """
   Ensure packages are installed using pacman.
@@ -122,15 +141,10 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
     ret["comment"] = "No packages specified"
     return ret
 
-  # Check current state
-  to_install = []
-  already_installed = []
-
-  for pkg in packages:
-    if __salt__["pacman.is_installed"](pkg, runas=runas):
-      already_installed.append(pkg)
-    else:
-      to_install.append(pkg)
+  # Check current state against the per-run snapshot (one pacman -Q),
+  # counting packages satisfied through provides as installed
+  to_install = __salt__["pacman.missing"](packages, runas=runas)
+  already_installed = [pkg for pkg in packages if pkg not in to_install]
 
   # Test mode - just report what would happen
   if __opts__["test"]:
@@ -169,6 +183,7 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
   return ret
 
 
+@_with_stats
 def removed(name, runas=None, **kwargs):
   """
   Ensure a package is removed using pacman.
@@ -208,10 +223,22 @@ def removed(name, runas=None, **kwargs):
   return ret
 
 
+def _upgrade_summary(plan):
+  """Summary of an upgrade plan; just the count without the alpm utils."""
+  summarise = __utils__.get("alpm.upgrade_summary")
+  if summarise is not None:
+    return summarise(plan)
+  return f"{len(plan)} package{'s' if len(plan) != 1 else ''}"
+
+
+@_with_stats
 def uptodate(name="pacman.uptodate", runas=None, refresh=True, **kwargs):
   """
   Ensure all packages are up to date.
 
+  Pending upgrades are planned from the package databases first, so test
+  mode reports them as changes and nothing runs when none are pending.
+
   Args:
       name: State name (defaults to pacman.uptodate)
       runas: Optional user to run as
@@ -226,24 +253,37 @@ def uptodate(name="pacman.uptodate", runas=None, refresh=True, **kwargs):
   """
   ret = {"name": name, "result": True, "changes": {}, "comment": ""}
 
+  # Refresh first so the plan sees the current repos (not in test mode,
+  # which plans against the databases as last synced)
+  if refresh and not __opts__["test"]:
+    result = __salt__["pacman.sync"](runas=runas)
+    if result["retcode"] != 0:
+      ret["result"] = False
+      ret["comment"] = f"Failed to sync: {result.get('stderr', 'unknown error')}"
+      return ret
+
+  plan = __salt__["pacman.plan_upgrade"](runas=runas)
+  if not plan:
+    ret["comment"] = "All packages are up to date"
+    return ret
+
+  summary = _upgrade_summary(plan)
+
   # Test mode
   if __opts__["test"]:
     ret["result"] = None
-    ret["comment"] = "Would upgrade all packages"
+    ret["changes"] = plan
+    ret["comment"] = f"Would upgrade {summary}"
     return ret
 
-  # Run upgrade
-  result = __salt__["pacman.upgrade"](runas=runas, refresh=refresh)
+  # Run upgrade (databases were refreshed above)
+  result = __salt__["pacman.upgrade"](runas=runas, refresh=False)
 
   ret["result"] = result.get("success", False)
 
   if ret["result"]:
-    stdout = result.get("stdout", "")
-    if "there is nothing to do" in stdout.lower():
-      ret["comment"] = "All packages are up to date"
-    else:
-      ret["changes"]["upgraded"] = "System packages upgraded"
-      ret["comment"] = "Packages upgraded successfully"
+    ret["changes"] = plan
+    ret["comment"] = f"Upgraded {summary}"
   else:
     ret["comment"] = f"Upgrade failed: {result.get('stderr', 'unknown error')}"
 
@@ -27,12 +27,32 @@ Usage in states:
         - runas: cozy-salt-svc
 """
 
+import functools
 import logging
 
 log = logging.getLogger(__name__)
 
 
-def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
+def _with_stats(func):
+  """
+  Attach the yay commands a state ran to its return as ``stats``
+  (see yay.stats: per-class counts, latency percentiles, output bytes).
+  """
+
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    since = __salt__["yay.stats"]()["seq"]
+    ret = func(*args, **kwargs)
+    ret["stats"] = __salt__["yay.stats"](since=since)
+    return ret
+
+  return wrapper
+
+
+@_with_stats
+def installed(
+  name=None, pkgs=None, runas=None, refresh=False, build_jobs=None, **kwargs
+):
   """
   Ensure packages are installed using yay.
 
@@ -41,6 +61,8 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
       pkgs: List of package names to install
       runas: User to run as (REQUIRED - yay cannot run as root)
       refresh: Whether to refresh package database first
+      build_jobs: Concurrent AUR builds; above 1 builds AUR packages in
+          parallel and installs them in one transaction (see yay.installed)
 
   Returns:
       dict: State result with name, result, changes, comment
@@ -110,7 +132,9 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
     return ret
 
   # Install packages
-  result = __salt__["yay.installed"](pkgs=to_install, runas=runas, refresh=refresh)
+  result = __salt__["yay.installed"](
+    pkgs=to_install, runas=runas, refresh=refresh, build_jobs=build_jobs
+  )
 
   ret["changes"] = result.get("changes", {})
   ret["result"] = result.get("result", False)
@@ -130,6 +154,7 @@ def installed(name=None, pkgs=None, runas=None, refresh=False, **kwargs):
   return ret
 
 
+@_with_stats
 def removed(name, runas=None, **kwargs):
   """
   Ensure a package is removed using yay.
@@ -176,10 +201,22 @@ def removed(name, runas=None, **kwargs):
   return ret
 
 
+def _upgrade_summary(plan):
+  """Summary of an upgrade plan; just the count without the alpm utils."""
+  summarise = __utils__.get("alpm.upgrade_summary")
+  if summarise is not None:
+    return summarise(plan)
+  return f"{len(plan)} package{'s' if len(plan) != 1 else ''}"
+
+
+@_with_stats
 def uptodate(name="yay.uptodate", runas=None, refresh=True, **kwargs):
   """
   Ensure all packages are up to date.
 
+  Pending upgrades are planned from the package databases first, so test
+  mode reports them as changes and nothing runs when none are pending.
+
   Args:
       name: State name (defaults to yay.uptodate)
       runas: User to run as (REQUIRED)
@@ -201,25 +238,37 @@ def uptodate(name="yay.uptodate", runas=None, refresh=True, **kwargs):
     ret["comment"] = "runas parameter is required - yay cannot run as root"
     return ret
 
+  # Refresh first so the plan sees the current repos (not in test mode,
+  # which plans against the databases as last synced)
+  if refresh and not __opts__["test"]:
+    result = __salt__["yay.sync"](runas=runas)
+    if result["retcode"] != 0:
+      ret["result"] = False
+      ret["comment"] = f"Failed to sync: {result.get('stderr', 'unknown error')}"
+      return ret
+
+  plan = __salt__["yay.plan_upgrade"](runas=runas)
+  if not plan:
+    ret["comment"] = "All packages are up to date"
+    return ret
+
+  summary = _upgrade_summary(plan)
+
   # Test mode
   if __opts__["test"]:
     ret["result"] = None
-    ret["comment"] = "Would upgrade all packages"
+    ret["changes"] = plan
+    ret["comment"] = f"Would upgrade {summary}"
     return ret
 
-  # Run upgrade
-  result = __salt__["yay.upgrade"](runas=runas, refresh=refresh)
+  # Run upgrade (databases were refreshed above)
+  result = __salt__["yay.upgrade"](runas=runas, refresh=False)
 
   ret["result"] = result.get("success", False)
 
   if ret["result"]:
-    # Check if anything was upgraded by looking at stdout
-    stdout = result.get("stdout", "")
-    if "there is nothing to do" in stdout.lower():
-      ret["comment"] = "All packages are up to date"
-    else:
-      ret["changes"]["upgraded"] = "System packages upgraded"
-      ret["comment"] = "Packages upgraded successfully"
+    ret["changes"] = plan
+    ret["comment"] = f"Upgraded {summary}"
   else:
     ret["comment"] = f"Upgrade failed: {result.get('stderr', 'unknown error')}"
 
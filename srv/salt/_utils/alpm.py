@@ -0,0 +1,771 @@
+# -*- coding: utf-8 -*-
+"""
+Salt utils module for reading the libalpm local and sync databases.
+
+:maintainer: cozy-salt
+:maturity: production
+:platform: Arch Linux
+
+Parses /var/lib/pacman/local/*/desc directly instead of forking
+`pacman -Q` / `yay -Q` for read-only queries. The parsed index is cached
+per process and rebuilt only when the local/ directory mtime changes
+(pacman adds/removes a package directory on every install, upgrade and
+removal).
+
+The sync databases (/var/lib/pacman/sync/*.db tarballs) are indexed the
+same way for `pacman -Ss` / `-Si` style lookups. Each repo is parsed once
+per db mtime/size and saved as compact JSON under the minion cachedir so
+later salt-call processes skip the tarball entirely.
+
+upgrade_plan() diffs the two (with libalpm's version ordering, see
+vercmp()) to preview what `pacman -Su` would do without running it.
+
+Usage from execution modules:
+    versions = __utils__["alpm.local_versions"]("/var/lib/pacman")
+    if versions is not None and "git" in versions:
+        ...
+
+    index = __utils__["alpm.sync_index"]("/var/lib/pacman", cachedir, repos)
+    if index is not None:
+        __utils__["alpm.sync_search"](index, "firefox")
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import re
+import tarfile
+import time
+
+log = logging.getLogger(__name__)
+
+DEFAULT_DBPATH = "/var/lib/pacman"
+DEFAULT_CONF = "/etc/pacman.conf"
+
+# Bump when the on-disk sync cache layout changes
+SYNC_CACHE_VERSION = 2
+
+# desc fields kept from sync databases
+SYNC_FIELDS = (
+  "name",
+  "version",
+  "desc",
+  "arch",
+  "url",
+  "license",
+  "groups",
+  "provides",
+  "depends",
+  "optdepends",
+  "conflicts",
+  "replaces",
+  "csize",
+  "isize",
+  "packager",
+  "builddate",
+  "filename",
+  "sha256sum",
+)
+
+# dbpath -> (mtime_ns, {name: package record}, {name: version})
+_local_cache = {}
+
+# (dbpath, repos) -> (signature, index)
+_sync_cache = {}
+
+
+def parse_desc(text):
+  """
+  Parse a libalpm desc file into a field dict.
+
+  desc files are blocks of ``%FIELD%`` followed by one value per line and
+  terminated by a blank line.
+
+  Args:
+      text: Contents of a desc file
+
+  Returns:
+      dict: Lower-cased field names mapped to lists of values
+  """
+  fields = {}
+  current = None
+  for line in text.splitlines():
+    if line.startswith("%") and line.endswith("%") and len(line) > 2:
+      current = fields.setdefault(line[1:-1].lower(), [])
+    elif not line:
+      current = None
+    elif current is not None:
+      current.append(line)
+  return fields
+
+
+def _record(fields):
+  """Flatten parsed desc fields into a package record."""
+
+  def _one(key):
+    values = fields.get(key)
+    return values[0] if values else ""
+
+  return {
+    "name": _one("name"),
+    "version": _one("version"),
+    "desc": _one("desc"),
+    "reason": int(_one("reason") or 0),
+    "provides": fields.get("provides", []),
+    "depends": fields.get("depends", []),
+    "groups": fields.get("groups", []),
+    "size": int(_one("size") or 0),
+  }
+
+
+def _scan(local_dir):
+  """Read every package desc under local_dir."""
+  packages = {}
+  with os.scandir(local_dir) as entries:
+    for entry in entries:
+      if not entry.is_dir():
+        continue
+      try:
+        with open(os.path.join(entry.path, "desc"), encoding="utf-8") as f:
+          record = _record(parse_desc(f.read()))
+      except OSError as exc:
+        log.debug("alpm: skipping %s: %s", entry.path, exc)
+        continue
+      if record["name"]:
+        packages[record["name"]] = record
+  return packages
+
+
+def _local_index(dbpath):
+  """
+  Return the cached (packages, versions, provides) triple, rescanning on
+  mtime change.
+  """
+  local_dir = os.path.join(dbpath, "local")
+  try:
+    mtime = os.stat(local_dir).st_mtime_ns
+  except OSError:
+    return None
+
+  cached = _local_cache.get(dbpath)
+  if cached and cached[0] == mtime:
+    return cached[1:]
+
+  try:
+    packages = _scan(local_dir)
+  except OSError as exc:
+    log.warning("alpm: failed to read %s: %s", local_dir, exc)
+    return None
+
+  versions = {name: pkg["version"] for name, pkg in packages.items()}
+  provides = {}
+  for name, pkg in packages.items():
+    for provided in pkg["provides"]:
+      provides.setdefault(dep_name(provided), []).append(name)
+  _local_cache[dbpath] = (mtime, packages, versions, provides)
+  return packages, versions, provides
+
+
+def local_packages(dbpath=DEFAULT_DBPATH):
+  """
+  Return every installed package record from the local database.
+
+  Args:
+      dbpath: pacman DBPath (defaults to /var/lib/pacman)
+
+  Returns:
+      dict: Package names mapped to records, or None if the local
+      database can't be read (caller should fall back to pacman -Q)
+  """
+  index = _local_index(dbpath)
+  return index[0] if index else None
+
+
+def local_versions(dbpath=DEFAULT_DBPATH):
+  """
+  Return installed package names mapped to versions.
+
+  Args:
+      dbpath: pacman DBPath (defaults to /var/lib/pacman)
+
+  Returns:
+      dict: Package names mapped to versions, or None if unreadable
+  """
+  index = _local_index(dbpath)
+  return index[1] if index else None
+
+
+def local_provides(dbpath=DEFAULT_DBPATH):
+  """
+  Return names provided by installed packages mapped to their providers.
+
+  Versions are stripped (``libfoo.so=1-64`` -> ``libfoo.so``), so a
+  target can be matched the way alpm_find_satisfier matches it.
+
+  Args:
+      dbpath: pacman DBPath (defaults to /var/lib/pacman)
+
+  Returns:
+      dict: Provided names mapped to lists of package names, or None if
+      unreadable
+  """
+  index = _local_index(dbpath)
+  return index[2] if index else None
+
+
+def repo_order(conf=DEFAULT_CONF):
+  """
+  Return sync repo names in pacman.conf order (the order pacman resolves in).
+
+  Args:
+      conf: Path to pacman.conf
+
+  Returns:
+      list: Repo section names, excluding [options]
+  """
+  repos = []
+  try:
+    with open(conf, encoding="utf-8") as f:
+      for line in f:
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]") and line != "[options]":
+          repos.append(line[1:-1])
+  except OSError as exc:
+    log.debug("alpm: can't read %s: %s", conf, exc)
+  return repos
+
+
+def _server_lines(path, servers):
+  """Append Server = URLs from an Include'd mirrorlist."""
+  try:
+    with open(path, encoding="utf-8") as f:
+      for line in f:
+        key, sep, value = line.split("#", 1)[0].partition("=")
+        if sep and key.strip() == "Server":
+          servers.append(value.strip())
+  except OSError as exc:
+    log.debug("alpm: can't read %s: %s", path, exc)
+
+
+def repo_servers(conf=DEFAULT_CONF, arch=None):
+  """
+  Return each repo's download servers in pacman.conf order.
+
+  Server lines and Include'd mirrorlists (e.g. the reflector-written
+  /etc/pacman.d/mirrorlist) are expanded in order, with $repo and $arch
+  substituted.
+
+  Args:
+      conf: Path to pacman.conf
+      arch: Value for $arch (defaults to the machine architecture)
+
+  Returns:
+      dict: Repo name mapped to a list of base URLs
+  """
+  arch = arch or os.uname().machine
+  servers = {}
+  repo = None
+  try:
+    with open(conf, encoding="utf-8") as f:
+      for line in f:
+        line = line.split("#", 1)[0].strip()
+        if line.startswith("[") and line.endswith("]"):
+          repo = line[1:-1] if line != "[options]" else None
+          if repo:
+            servers.setdefault(repo, [])
+          continue
+        key, sep, value = line.partition("=")
+        if not (repo and sep):
+          continue
+        if key.strip() == "Server":
+          servers[repo].append(value.strip())
+        elif key.strip() == "Include":
+          _server_lines(value.strip(), servers[repo])
+  except OSError as exc:
+    log.debug("alpm: can't read %s: %s", conf, exc)
+  return {
+    repo: [u.replace("$repo", repo).replace("$arch", arch) for u in urls]
+    for repo, urls in servers.items()
+  }
+
+
+def ignore_rules(conf=DEFAULT_CONF):
+  """
+  Return the IgnorePkg and IgnoreGroup patterns from pacman.conf [options].
+
+  Args:
+      conf: Path to pacman.conf
+
+  Returns:
+      dict: ``packages`` and ``groups`` lists of glob patterns
+  """
+  rules = {"packages": [], "groups": []}
+  keys = {"ignorepkg": "packages", "ignoregroup": "groups"}
+  section = None
+  try:
+    with open(conf, encoding="utf-8") as f:
+      for line in f:
+        line = line.split("#", 1)[0].strip()
+        if line.startswith("[") and line.endswith("]"):
+          section = line[1:-1]
+          continue
+        key, sep, value = line.partition("=")
+        if section == "options" and sep and key.strip().lower() in keys:
+          rules[keys[key.strip().lower()]].extend(value.split())
+  except OSError as exc:
+    log.debug("alpm: can't read %s: %s", conf, exc)
+  return rules
+
+
+def _read_sync_db(path):
+  """Parse every desc entry from a sync db tarball into field dicts."""
+  packages = []
+  with tarfile.open(path, "r:*") as tar:
+    for member in tar:
+      if not member.isfile() or not member.name.endswith("/desc"):
+        continue
+      text = tar.extractfile(member).read().decode("utf-8", "replace")
+      fields = {k: v for k, v in parse_desc(text).items() if k in SYNC_FIELDS}
+      if fields.get("name"):
+        packages.append(fields)
+  return packages
+
+
+def _load_repo(db_file, stat, repo, cachedir):
+  """Load one repo's packages from the on-disk cache or the db tarball."""
+  cache_file = os.path.join(cachedir, f"{repo}.json") if cachedir else None
+  stamp = [SYNC_CACHE_VERSION, stat.st_mtime_ns, stat.st_size]
+
+  if cache_file:
+    try:
+      with open(cache_file, encoding="utf-8") as f:
+        cached = json.load(f)
+      if cached.get("stamp") == stamp:
+        return cached["packages"]
+    except (OSError, ValueError):
+      pass
+
+  packages = _read_sync_db(db_file)
+
+  if cache_file:
+    try:
+      os.makedirs(cachedir, exist_ok=True)
+      tmp = f"{cache_file}.{os.getpid()}.tmp"
+      with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"stamp": stamp, "packages": packages}, f, separators=(",", ":"))
+      os.replace(tmp, cache_file)
+    except OSError as exc:
+      log.debug("alpm: can't write sync cache %s: %s", cache_file, exc)
+
+  return packages
+
+
+def dep_name(dep):
+  """Strip version constraints and descriptions from a depend/provide string."""
+  return re.split(r"[<>=:]", dep, maxsplit=1)[0].strip()
+
+
+def _isalnum(ch):
+  return ch.isascii() and ch.isalnum()
+
+
+def _rpmvercmp(a, b):
+  """Compare two version segments the way libalpm's rpmvercmp does."""
+  if a == b:
+    return 0
+  i = j = 0
+  while i < len(a) and j < len(b):
+    sep_start_a, sep_start_b = i, j
+    while i < len(a) and not _isalnum(a[i]):
+      i += 1
+    while j < len(b) and not _isalnum(b[j]):
+      j += 1
+    if i >= len(a) or j >= len(b):
+      break
+    # different separator lengths decide it
+    if i - sep_start_a != j - sep_start_b:
+      return -1 if i - sep_start_a < j - sep_start_b else 1
+
+    isnum = a[i].isdigit()
+    kind = str.isdigit if isnum else str.isalpha
+    end_a, end_b = i, j
+    while end_a < len(a) and a[end_a].isascii() and kind(a[end_a]):
+      end_a += 1
+    while end_b < len(b) and b[end_b].isascii() and kind(b[end_b]):
+      end_b += 1
+    seg_a, seg_b = a[i:end_a], b[j:end_b]
+    if not seg_b:
+      # numeric segments are newer than alpha ones
+      return 1 if isnum else -1
+    if isnum:
+      seg_a, seg_b = seg_a.lstrip("0"), seg_b.lstrip("0")
+      if len(seg_a) != len(seg_b):
+        return 1 if len(seg_a) > len(seg_b) else -1
+    if seg_a != seg_b:
+      return 1 if seg_a > seg_b else -1
+    i, j = end_a, end_b
+
+  rest_a, rest_b = a[i:], b[j:]
+  if not rest_a and not rest_b:
+    return 0
+  # a remaining alpha segment never beats an empty one: 1.0a < 1.0 < 1.0.1
+  if (not rest_a and not rest_b[:1].isalpha()) or rest_a[:1].isalpha():
+    return -1
+  return 1
+
+
+def _parse_evr(version):
+  """Split [epoch:]version[-release] into its three parts."""
+  epoch, sep, rest = version.partition(":")
+  if not sep or not epoch.isdigit():
+    epoch, rest = "0", version
+  ver, sep, rel = rest.rpartition("-")
+  if not sep:
+    return epoch or "0", rest, None
+  return epoch or "0", ver, rel
+
+
+def vercmp(a, b):
+  """
+  Compare two package versions like `vercmp` / alpm_pkg_vercmp.
+
+  Args:
+      a: Version string ([epoch:]pkgver[-pkgrel])
+      b: Version string
+
+  Returns:
+      int: -1 if a is older than b, 0 if equal, 1 if newer
+  """
+  if a == b:
+    return 0
+  epoch_a, ver_a, rel_a = _parse_evr(a)
+  epoch_b, ver_b, rel_b = _parse_evr(b)
+  ret = _rpmvercmp(epoch_a, epoch_b)
+  if ret == 0:
+    ret = _rpmvercmp(ver_a, ver_b)
+    if ret == 0 and rel_a and rel_b:
+      ret = _rpmvercmp(rel_a, rel_b)
+  return ret
+
+
+def sync_index(dbpath=DEFAULT_DBPATH, cachedir=None, repos=None, conf=DEFAULT_CONF):
+  """
+  Return an index over the sync databases.
+
+  Args:
+      dbpath: pacman DBPath (defaults to /var/lib/pacman)
+      cachedir: Directory for the compact per-repo JSON cache (optional)
+      repos: Repo names in resolution order; defaults to the order in conf,
+          then any other *.db files alphabetically
+      conf: pacman.conf the default repo order is read from
+
+  Returns:
+      dict: ``entries`` (list of (repo, fields) in repo order), ``by_name``
+      (first entry per package name) and ``provides`` (provided name ->
+      package names), or None if no sync db could be read (caller should
+      fall back to pacman -Ss/-Si)
+  """
+  sync_dir = os.path.join(dbpath, "sync")
+  try:
+    available = sorted(f[:-3] for f in os.listdir(sync_dir) if f.endswith(".db"))
+  except OSError:
+    return None
+
+  order = [r for r in (repos or repo_order(conf)) if r in available]
+  order += [r for r in available if r not in order]
+
+  stats = {}
+  for repo in order:
+    try:
+      stats[repo] = os.stat(os.path.join(sync_dir, f"{repo}.db"))
+    except OSError:
+      continue
+  signature = tuple((r, st.st_mtime_ns, st.st_size) for r, st in stats.items())
+  key = (dbpath, tuple(order))
+
+  cached = _sync_cache.get(key)
+  if cached and cached[0] == signature:
+    return cached[1]
+
+  entries = []
+  for repo, stat in stats.items():
+    try:
+      packages = _load_repo(os.path.join(sync_dir, f"{repo}.db"), stat, repo, cachedir)
+    except (OSError, tarfile.TarError) as exc:
+      log.warning("alpm: can't read sync db %s: %s", repo, exc)
+      return None
+    entries.extend((repo, fields) for fields in packages)
+
+  by_name = {}
+  provides = {}
+  for repo, fields in entries:
+    name = fields["name"][0]
+    by_name.setdefault(name, (repo, fields))
+    for provided in fields.get("provides", []):
+      provides.setdefault(dep_name(provided), []).append(name)
+
+  index = {"entries": entries, "by_name": by_name, "provides": provides}
+  _sync_cache[key] = (signature, index)
+  return index
+
+
+def _search_pattern(term):
+  """Case-insensitive regex for one search term; literal if it isn't valid."""
+  try:
+    return re.compile(term, re.IGNORECASE)
+  except re.error:
+    return re.compile(re.escape(term), re.IGNORECASE)
+
+
+def sync_search(index, query):
+  """
+  Search package names and descriptions like `pacman -Ss`.
+
+  Whitespace-separated terms must all match, each in the name or the
+  description. A term that isn't a valid regular expression is matched
+  literally instead of raising.
+
+  Args:
+      index: Result of sync_index()
+      query: Case-insensitive regular expression(s), as a string or list
+
+  Returns:
+      list: Matching package names in repo order
+  """
+  terms = query.split() if isinstance(query, str) else list(query)
+  patterns = [_search_pattern(term) for term in terms]
+  matches = []
+  for _repo, fields in index["entries"]:
+    name = fields["name"][0]
+    desc = fields.get("desc", [""])[0]
+    if all(p.search(name) or p.search(desc) for p in patterns):
+      matches.append(name)
+  return matches
+
+
+def _ignored(pkg, rules):
+  return any(fnmatch.fnmatch(pkg["name"], p) for p in rules["packages"]) or any(
+    fnmatch.fnmatch(g, p) for g in pkg["groups"] for p in rules["groups"]
+  )
+
+
+def upgrade_plan(local, index, conf=DEFAULT_CONF):
+  """
+  Compute the packages `pacman -Su` would upgrade, without a transaction.
+
+  Installed packages are matched to the first sync repo carrying the same
+  name (pacman.conf order) and kept if the sync version is newer. Sync
+  packages that replace an installed one are listed under their own name.
+  IgnorePkg/IgnoreGroup from pacman.conf are honoured; foreign (AUR)
+  packages are left to the caller.
+
+  Args:
+      local: Result of local_packages()
+      index: Result of sync_index()
+      conf: Path to pacman.conf
+
+  Returns:
+      dict: Package name mapped to ``old`` and ``new`` versions, ``repo``,
+      ``download_size`` (bytes) and ``installed_size_delta`` (bytes); a
+      replacement also carries ``replaces`` (list of installed names)
+  """
+  rules = ignore_rules(conf)
+  plan = {}
+  for name, pkg in local.items():
+    match = index["by_name"].get(name)
+    if not match or _ignored(pkg, rules):
+      continue
+    repo, fields = match
+    new = fields["version"][0]
+    if vercmp(new, pkg["version"]) <= 0:
+      continue
+    plan[name] = {
+      "old": pkg["version"],
+      "new": new,
+      "repo": repo,
+      "download_size": int(fields.get("csize", ["0"])[0]),
+      "installed_size_delta": int(fields.get("isize", ["0"])[0]) - pkg["size"],
+    }
+
+  for repo, fields in index["entries"]:
+    name = fields["name"][0]
+    if name in local or name in plan:
+      continue
+    replaced = [
+      local[dep_name(r)]
+      for r in fields.get("replaces", [])
+      if dep_name(r) in local and not _ignored(local[dep_name(r)], rules)
+    ]
+    if not replaced:
+      continue
+    plan[name] = {
+      "old": None,
+      "new": fields["version"][0],
+      "repo": repo,
+      "download_size": int(fields.get("csize", ["0"])[0]),
+      "installed_size_delta": int(fields.get("isize", ["0"])[0])
+      - sum(pkg["size"] for pkg in replaced),
+      "replaces": [pkg["name"] for pkg in replaced],
+    }
+  return plan
+
+
+def download_set(index, names, local):
+  """
+  Resolve the package files a transaction for names would download.
+
+  Follows depends through the sync index (by name, then provides), skipping
+  anything the local database already satisfies at the sync version.
+  Version constraints on dependencies are not evaluated.
+
+  Args:
+      index: Result of sync_index()
+      names: Target package names (repo/name is accepted)
+      local: Result of local_packages()
+
+  Returns:
+      list: Dicts with ``repo``, ``name``, ``filename``, ``size`` and
+      ``sha256`` (None when the db carries no checksum), in resolution order
+  """
+  provided = {dep_name(p) for pkg in local.values() for p in pkg["provides"]}
+  seen = set()
+  targets = []
+  queue = list(names)
+  while queue:
+    name = queue.pop(0).rpartition("/")[2]
+    if name in seen:
+      continue
+    seen.add(name)
+    match = index["by_name"].get(name)
+    if match is None and name not in local and name not in provided:
+      providers = index["provides"].get(name)
+      match = index["by_name"].get(providers[0]) if providers else None
+    if match is None:
+      continue
+    repo, fields = match
+    pkg = fields["name"][0]
+    installed = local.get(pkg)
+    if installed and installed["version"] == fields["version"][0]:
+      continue
+    if not fields.get("filename"):
+      continue
+    targets.append(
+      {
+        "repo": repo,
+        "name": pkg,
+        "filename": fields["filename"][0],
+        "size": int(fields.get("csize", ["0"])[0]),
+        "sha256": fields.get("sha256sum", [None])[0],
+      }
+    )
+    for dep in fields.get("depends", []):
+      dep = dep_name(dep)
+      if dep not in local and dep not in provided:
+        queue.append(dep)
+  return targets
+
+
+def upgrade_summary(plan):
+  """
+  One-line summary of an upgrade plan for state comments.
+
+  Args:
+      plan: Result of upgrade_plan() (sizes may be None when unknown)
+
+  Returns:
+      str: e.g. "3 packages, 12.40 MiB download, +1.20 MiB installed"
+  """
+  count = f"{len(plan)} package{'s' if len(plan) != 1 else ''}"
+  download = [p["download_size"] for p in plan.values()]
+  delta = [p["installed_size_delta"] for p in plan.values()]
+  if None in download or None in delta:
+    return count
+  total = sum(delta)
+  sign = "+" if total >= 0 else "-"
+  return (
+    f"{count}, {human_size(sum(download))} download, "
+    f"{sign}{human_size(abs(total))} installed"
+  )
+
+
+def human_size(value):
+  """Format a byte count the way pacman prints sizes."""
+  size = float(value or 0)
+  for unit in ("B", "KiB", "MiB", "GiB"):
+    if abs(size) < 1024 or unit == "GiB":
+      return f"{size:.2f} {unit}"
+    size /= 1024
+
+
+def sync_info(index, name):
+  """
+  Describe one package with the same keys `pacman -Si` prints.
+
+  Args:
+      index: Result of sync_index()
+      name: Package name (repo/name is accepted)
+
+  Returns:
+      dict: Package information, or {} if not found
+  """
+  repo_hint, _, pkg = name.rpartition("/")
+  if repo_hint:
+    match = next(
+      (
+        (repo, fields)
+        for repo, fields in index["entries"]
+        if repo == repo_hint and fields["name"][0] == pkg
+      ),
+      None,
+    )
+  else:
+    match = index["by_name"].get(pkg)
+  if not match:
+    return {}
+
+  repo, fields = match
+
+  def _one(key):
+    values = fields.get(key)
+    return values[0] if values else ""
+
+  def _many(key):
+    return "  ".join(fields.get(key, [])) or "None"
+
+  builddate = _one("builddate")
+  return {
+    "Repository": repo,
+    "Name": _one("name"),
+    "Version": _one("version"),
+    "Description": _one("desc"),
+    "Architecture": _one("arch"),
+    "URL": _one("url"),
+    "Licenses": _many("license"),
+    "Groups": _many("groups"),
+    "Provides": _many("provides"),
+    "Depends On": _many("depends"),
+    "Optional Deps": _many("optdepends"),
+    "Conflicts With": _many("conflicts"),
+    "Replaces": _many("replaces"),
+    "Download Size": human_size(_one("csize")),
+    "Installed Size": human_size(_one("isize")),
+    "Packager": _one("packager"),
+    "Build Date": time.strftime("%c", time.localtime(int(builddate)))
+    if builddate
+    else "",
+  }
+
+
+def sync_info_many(index, names):
+  """
+  Describe many packages in one pass.
+
+  Args:
+      index: Result of sync_index()
+      names: Iterable of package names
+
+  Returns:
+      dict: Name mapped to sync_info() result ({} for unknown packages)
+  """
+  return {name: sync_info(index, name) for name in names}
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Salt utils module for a content-addressed cache of built AUR packages.
+
+:maintainer: cozy-salt
+:maturity: production
+:platform: Arch Linux
+
+Built .pkg.tar.* files are stored under <cachedir>/<key>/ where key is the
+sha256 of PKGBUILD + .SRCINFO + arch, so an unchanged package base is never
+rebuilt. An entry's directory mtime is its last-used time; evict() drops
+entries past a max age and then least-recently-used entries until the cache
+fits its size cap.
+
+The same layout is used for the fleet cache the master serves from
+salt://aur-cache/<arch>/<key>/ (see _runners/aurcache.py). Every entry
+carries a SHA256SUMS manifest of its package files, plus a detached .sig
+per package when the build was signed; verify() checks both before the
+master publishes a pushed entry.
+
+Usage from execution modules:
+    key = __utils__["aurcache.cache_key"](pkgbuild, srcinfo, arch)
+    files = __utils__["aurcache.lookup"](cachedir, key)
+    if files is None:
+        files = __utils__["aurcache.store"](cachedir, key, built_files)
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+log = logging.getLogger(__name__)
+
+MANIFEST = "SHA256SUMS"
+
+
+def pkgname(path):
+  """Package name from a <name>-<pkgver>-<pkgrel>-<arch>.pkg.tar.* path."""
+  return os.path.basename(path).rsplit("-", 3)[0]
+
+
+def cache_key(pkgbuild, srcinfo, arch):
+  """
+  Content hash identifying one build of a package base.
+
+  Args:
+      pkgbuild: PKGBUILD contents (bytes)
+      srcinfo: .SRCINFO contents (bytes; includes source checksums)
+      arch: Target architecture (e.g. x86_64, aarch64)
+
+  Returns:
+      str: sha256 hex digest
+  """
+  digest = hashlib.sha256()
+  for part in (pkgbuild, srcinfo, arch.encode()):
+    digest.update(part)
+    digest.update(b"\0")
+  return digest.hexdigest()
+
+
+def _entry_files(entry):
+  return {
+    pkgname(f): os.path.join(entry, f)
+    for f in sorted(os.listdir(entry))
+    if ".pkg.tar" in f and not f.endswith(".sig")
+  }
+
+
+def _sha256(path):
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def _write_manifest(entry):
+  lines = [
+    f"{_sha256(path)}  {os.path.basename(path)}\n"
+    for path in _entry_files(entry).values()
+  ]
+  with open(os.path.join(entry, MANIFEST), "w") as f:
+    f.writelines(lines)
+
+
+def verify(entry, keyring=None):
+  """
+  Check a pushed entry before it is published to the fleet.
+
+  The entry may only hold package files, their .sig files and SHA256SUMS.
+  Every package must be listed in SHA256SUMS with a matching hash. With a
+  keyring, every package also needs a detached <file>.sig that gpgv
+  accepts against it.
+
+  Args:
+      entry: Entry directory
+      keyring: Keyring file of the builders' public keys (gpg --export)
+
+  Returns:
+      str: Why the entry was refused, or None if it checks out
+  """
+  listed = {}
+  try:
+    names = sorted(os.listdir(entry))
+    with open(os.path.join(entry, MANIFEST)) as f:
+      for line in f:
+        digest, _, name = line.strip().partition("  ")
+        listed[name] = digest
+  except OSError as exc:
+    return f"no usable {MANIFEST}: {exc}"
+
+  packages = [n for n in names if ".pkg.tar" in n and not n.endswith(".sig")]
+  if not packages:
+    return "no package files"
+  for name in names:
+    path = os.path.join(entry, name)
+    if os.path.islink(path) or not os.path.isfile(path):
+      return f"{name} is not a regular file"
+    signature = name.endswith(".sig") and name[:-4] in packages
+    if name != MANIFEST and name not in packages and not signature:
+      return f"unexpected file {name}"
+
+  for name in packages:
+    path = os.path.join(entry, name)
+    if listed.get(name) != _sha256(path):
+      return f"{name} does not match {MANIFEST}"
+    if keyring is None:
+      continue
+    try:
+      result = subprocess.run(
+        ["gpgv", "--keyring", keyring, path + ".sig", path],
+        capture_output=True,
+        check=False,
+      )
+    except OSError as exc:
+      return f"can't run gpgv: {exc}"
+    if result.returncode != 0:
+      return f"{name}: bad or missing signature"
+  return None
+
+
+def lookup(cachedir, key):
+  """
+  Return cached package files for key and mark the entry as used.
+
+  Args:
+      cachedir: Cache root
+      key: cache_key() result
+
+  Returns:
+      dict: pkgname -> cached file path, or None on a miss
+  """
+  entry = os.path.join(cachedir, key)
+  try:
+    files = _entry_files(entry)
+  except OSError:
+    return None
+  if not files:
+    return None
+  os.utime(entry)
+  return files
+
+
+def store(cachedir, key, files):
+  """
+  Copy built package files into the cache.
+
+  Files are staged in a temp dir and renamed into place so a concurrent
+  lookup never sees a half-written entry. A <file>.sig next to a package
+  is copied with it, and the entry gets a SHA256SUMS manifest.
+
+  Args:
+      cachedir: Cache root
+      key: cache_key() result
+      files: Iterable of built package paths
+
+  Returns:
+      dict: pkgname -> cached file path
+  """
+  entry = os.path.join(cachedir, key)
+  if os.path.isdir(entry):
+    return lookup(cachedir, key)
+
+  os.makedirs(cachedir, exist_ok=True)
+  staging = tempfile.mkdtemp(prefix=f".{key}.", dir=cachedir)
+  try:
+    for path in files:
+      shutil.copy2(path, staging)
+      if os.path.exists(path + ".sig"):
+        shutil.copy2(path + ".sig", staging)
+    _write_manifest(staging)
+    os.rename(staging, entry)
+  except OSError:
+    shutil.rmtree(staging, ignore_errors=True)
+    if not os.path.isdir(entry):
+      raise
+  os.utime(entry)
+  return _entry_files(entry)
+
+
+def evict(cachedir, max_bytes=None, max_age_days=None):
+  """
+  Trim the cache by age, then by least-recent use until under max_bytes.
+
+  Args:
+      cachedir: Cache root
+      max_bytes: Size cap for the whole cache (None = unbounded)
+      max_age_days: Drop entries unused for longer than this (None = keep)
+
+  Returns:
+      list: Evicted keys
+  """
+  entries = []
+  try:
+    names = os.listdir(cachedir)
+  except OSError:
+    return []
+  for name in names:
+    entry = os.path.join(cachedir, name)
+    if name.startswith(".") or not os.path.isdir(entry):
+      continue
+    size = sum(
+      os.path.getsize(os.path.join(entry, f))
+      for f in os.listdir(entry)
+      if os.path.isfile(os.path.join(entry, f))
+    )
+    entries.append((os.stat(entry).st_mtime, size, name))
+
+  entries.sort()
+  total = sum(size for _, size, _ in entries)
+  cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+  evicted = []
+  for used, size, name in entries:
+    too_old = cutoff is not None and used < cutoff
+    too_big = max_bytes is not None and total > max_bytes
+    if not (too_old or too_big):
+      continue
+    shutil.rmtree(os.path.join(cachedir, name), ignore_errors=True)
+    total -= size
+    evicted.append(name)
+
+  if evicted:
+    log.info("aurcache: evicted %d entries from %s", len(evicted), cachedir)
+  return evicted
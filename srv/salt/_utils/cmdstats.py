@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Salt utils module for per-command instrumentation of pacman/yay calls.
+
+:maintainer: cozy-salt
+:maturity: production
+:platform: Arch Linux
+
+The modules append one record per cmd.run_all call (command class, wall
+time, exit code, stdout/stderr bytes) to a list kept in __context__, so a
+highstate accumulates every probe and transaction it ran. summarize()
+turns a slice of those records into per-class counts, byte totals and
+latency percentiles.
+
+Usage from execution modules:
+    calls = __context__.setdefault("pacman.cmdstats", [])
+    __utils__["cmdstats.record"](calls, cmd, result, seconds)
+    __utils__["cmdstats.summarize"](calls)
+"""
+
+import math
+
+# Records kept per module; older ones are dropped (seq keeps counting)
+MAX_CALLS = 5000
+
+CLASSES = ("query", "install", "remove", "upgrade", "sync", "build", "other")
+
+
+def classify(cmd):
+  """
+  Map a pacman/yay/makepkg command line to a command class.
+
+  Args:
+      cmd: Command string as passed to cmd.run_all
+
+  Returns:
+      str: One of CLASSES
+  """
+  words = cmd.split()
+  # programs run: the first word and whatever follows each && or ||
+  programs = words[:1] + [b for a, b in zip(words, words[1:]) if a in ("&&", "||")]
+  if {"makepkg", "git"} & set(programs):
+    return "build"
+  flag = next((w for w in words[1:] if w.startswith("-") and w[1:2].isupper()), "")
+  op, opts = flag[1:2], set(flag[2:])
+  if op in ("Q", "T"):
+    return "query"
+  if op == "R":
+    return "remove"
+  if op == "U":
+    return "install"
+  if op == "S":
+    if opts & {"s", "i", "w", "p"}:
+      return "query"
+    if "u" in opts:
+      return "upgrade"
+    targets = [w for w in words[1:] if not w.startswith("-")]
+    if "y" in opts and not targets:
+      return "sync"
+    return "install"
+  return "other"
+
+
+def record(calls, cmd, result, seconds):
+  """
+  Append one command record.
+
+  Args:
+      calls: Record list (from __context__)
+      cmd: Command string
+      result: cmd.run_all result dict
+      seconds: Wall time of the call
+
+  Returns:
+      dict: The new record
+  """
+  entry = {
+    "seq": calls[-1]["seq"] + 1 if calls else 1,
+    "class": classify(cmd),
+    "seconds": seconds,
+    "retcode": result.get("retcode", 0),
+    "stdout_bytes": len((result.get("stdout") or "").encode()),
+    "stderr_bytes": len((result.get("stderr") or "").encode()),
+  }
+  calls.append(entry)
+  if len(calls) > MAX_CALLS:
+    del calls[: len(calls) - MAX_CALLS]
+  return entry
+
+
+def _percentile(ordered, pct):
+  """Nearest-rank percentile of an ascending list."""
+  return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(calls, since=0):
+  """
+  Aggregate records per command class.
+
+  Args:
+      calls: Record list
+      since: Only include records with seq greater than this
+
+  Returns:
+      dict: ``seq`` (latest record number, pass back as since), ``calls``,
+      ``seconds`` and ``classes`` mapping each class seen to count, failed,
+      total/p50/p90/p99/max seconds and stdout/stderr bytes
+  """
+  selected = [c for c in calls if c["seq"] > since]
+  classes = {}
+  for name in CLASSES:
+    group = [c for c in selected if c["class"] == name]
+    if not group:
+      continue
+    ordered = sorted(c["seconds"] for c in group)
+    classes[name] = {
+      "count": len(group),
+      "failed": sum(1 for c in group if c["retcode"] != 0),
+      "total_s": round(sum(ordered), 3),
+      "p50_s": round(_percentile(ordered, 50), 3),
+      "p90_s": round(_percentile(ordered, 90), 3),
+      "p99_s": round(_percentile(ordered, 99), 3),
+      "max_s": round(ordered[-1], 3),
+      "stdout_bytes": sum(c["stdout_bytes"] for c in group),
+      "stderr_bytes": sum(c["stderr_bytes"] for c in group),
+    }
+  return {
+    "seq": calls[-1]["seq"] if calls else since,
+    "calls": len(selected),
+    "seconds": round(sum(c["seconds"] for c in selected), 3),
+    "classes": classes,
+  }
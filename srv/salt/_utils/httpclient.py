@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+Salt utils module: keep-alive HTTP(S) client shared by the custom modules.
+
+:maintainer: cozy-salt
+:maturity: production
+:platform: all
+
+urllib.request and salt.utils.http open a new connection (and TLS
+handshake) per call. request() keeps idle connections per scheme/host/port
+for the life of the process, so repeated calls to the same API reuse one
+socket. Every call gets the same timeout/retry/backoff policy and is
+counted in per-host metrics.
+
+Usage from execution modules:
+    resp = __utils__["httpclient.request"](url, headers={...}, timeout=5)
+    if resp["status"] == 200:
+        data = resp["json"]
+    __utils__["httpclient.metrics"]()
+
+request() raises OSError when the host can't be reached after all retries;
+any HTTP status is returned, never raised.
+
+Proxies: request(proxy="http://[user:pass@]host:port") sends plain HTTP
+through the proxy and tunnels HTTPS with CONNECT. proxy_for(url, opts)
+picks the proxy salt.utils.http would have used: the proxy_host,
+proxy_port, proxy_username and proxy_password options (minus no_proxy
+hosts), else the http_proxy/https_proxy/no_proxy environment.
+"""
+
+import base64
+import http.client
+import json
+import logging
+import ssl
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+log = logging.getLogger(__name__)
+
+# Idle connections kept per host
+MAX_IDLE = 4
+
+# Statuses worth another attempt (after backoff)
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Longest Retry-After honoured, in seconds
+MAX_RETRY_AFTER = 30
+
+# (scheme, host, port, proxy) -> idle connections
+_idle = {}
+# host -> counters, see metrics()
+_metrics = {}
+# (ca_file, verify) -> ssl.SSLContext
+_contexts = {}
+_lock = threading.Lock()
+
+# A kept-alive socket the server already closed fails like this on reuse
+_STALE = (
+  http.client.RemoteDisconnected,
+  http.client.BadStatusLine,
+  BrokenPipeError,
+  ConnectionResetError,
+  ConnectionAbortedError,
+)
+
+
+def _context(ca_file, verify):
+  key = (ca_file, verify)
+  with _lock:
+    if key not in _contexts:
+      if verify:
+        _contexts[key] = ssl.create_default_context(cafile=ca_file)
+      else:
+        _contexts[key] = ssl._create_unverified_context()  # noqa: S323
+    return _contexts[key]
+
+
+def _count(host, **deltas):
+  with _lock:
+    counters = _metrics.setdefault(
+      host,
+      {
+        "requests": 0,
+        "errors": 0,
+        "retries": 0,
+        "connections": 0,
+        "reused": 0,
+        "seconds": 0.0,
+        "bytes": 0,
+      },
+    )
+    for name, delta in deltas.items():
+      counters[name] += delta
+
+
+def _parse_proxy(proxy):
+  """(host, port, Proxy-Authorization value or None) from a proxy URL."""
+  if "://" not in proxy:
+    proxy = "http://" + proxy
+  parts = urllib.parse.urlsplit(proxy)
+  auth = None
+  if parts.username:
+    creds = urllib.parse.unquote(parts.username)
+    creds += ":" + urllib.parse.unquote(parts.password or "")
+    auth = "Basic " + base64.b64encode(creds.encode()).decode()
+  return parts.hostname, parts.port or 3128, auth
+
+
+def _connect(key, timeout, ca_file, verify):
+  scheme, host, port, proxy = key
+  if proxy is None:
+    if scheme == "https":
+      return http.client.HTTPSConnection(
+        host, port, timeout=timeout, context=_context(ca_file, verify)
+      )
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+  proxy_host, proxy_port, auth = _parse_proxy(proxy)
+  if scheme == "https":
+    conn = http.client.HTTPSConnection(
+      proxy_host, proxy_port, timeout=timeout, context=_context(ca_file, verify)
+    )
+    conn.set_tunnel(host, port, headers={"Proxy-Authorization": auth} if auth else None)
+    return conn
+  return http.client.HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+
+
+def _checkout(key, timeout, ca_file, verify):
+  """An idle connection for key, or a new one; (conn, reused)."""
+  with _lock:
+    idle = _idle.get(key)
+    conn = idle.pop() if idle else None
+  if conn is None:
+    return _connect(key, timeout, ca_file, verify), False
+  conn.timeout = timeout
+  if conn.sock is not None:
+    conn.sock.settimeout(timeout)
+  return conn, True
+
+
+def _checkin(key, conn, resp):
+  """Keep conn for reuse unless the server is closing it."""
+  if resp.will_close:
+    conn.close()
+    return
+  with _lock:
+    idle = _idle.setdefault(key, [])
+    if len(idle) < MAX_IDLE:
+      idle.append(conn)
+      return
+  conn.close()
+
+
+def _send(key, method, target, body, headers, timeout, ca_file, verify):
+  """
+  One request/response on a pooled connection.
+
+  Returns (status, headers, body, reused).
+  """
+  conn, reused = _checkout(key, timeout, ca_file, verify)
+  try:
+    try:
+      conn.request(method, target, body=body, headers=headers)
+      resp = conn.getresponse()
+    except _STALE:
+      if not reused:
+        raise
+      # the server dropped the idle socket; that's not a failed attempt
+      conn.close()
+      conn, reused = _connect(key, timeout, ca_file, verify), False
+      conn.request(method, target, body=body, headers=headers)
+      resp = conn.getresponse()
+    data = resp.read()
+  except BaseException:
+    conn.close()
+    raise
+  _checkin(key, conn, resp)
+  headers = {k.lower(): v for k, v in resp.getheaders()}
+  return resp.status, headers, data, reused
+
+
+def request(
+  url,
+  method="GET",
+  headers=None,
+  body=None,
+  json_body=None,
+  timeout=10,
+  retries=2,
+  backoff=0.5,
+  ca_file=None,
+  verify=True,
+  proxy=None,
+):
+  """
+  Make an HTTP(S) request over a pooled keep-alive connection.
+
+  Connection errors and 429/502/503/504 responses are retried up to
+  retries times, waiting backoff * 2**attempt seconds (or the server's
+  Retry-After, capped) in between.
+
+  Args:
+      url: Absolute http:// or https:// URL
+      method: HTTP method
+      headers: Extra request headers
+      body: Request body (bytes or str)
+      json_body: Object to send as a JSON body instead of body
+      timeout: Per-attempt socket timeout in seconds
+      retries: Extra attempts after the first
+      backoff: Base delay between attempts in seconds
+      ca_file: CA bundle to verify against (default: system store)
+      verify: Verify the server certificate (default: True)
+      proxy: Proxy URL to go through (default: connect directly), see
+          proxy_for()
+
+  Returns:
+      dict: ``status``, ``headers`` (lower-case names), ``body`` (bytes) and
+      ``json`` (decoded body, or None if it isn't JSON)
+
+  Raises:
+      OSError: The host couldn't be reached on any attempt
+  """
+  parts = urllib.parse.urlsplit(url)
+  scheme = parts.scheme.lower()
+  if scheme not in ("http", "https"):
+    raise ValueError(f"unsupported URL scheme: {url}")
+  port = parts.port or (443 if scheme == "https" else 80)
+  key = (scheme, parts.hostname, port, proxy or None)
+  host = parts.netloc
+  target = parts.path or "/"
+  if parts.query:
+    target += "?" + parts.query
+
+  headers = dict(headers or {})
+  if proxy and scheme == "http":
+    # plain HTTP goes to the proxy in absolute form; HTTPS is tunnelled
+    target = f"http://{host}{target}"
+    auth = _parse_proxy(proxy)[2]
+    if auth:
+      headers.setdefault("Proxy-Authorization", auth)
+  if json_body is not None:
+    body = json.dumps(json_body)
+    headers.setdefault("Content-Type", "application/json")
+  if isinstance(body, str):
+    body = body.encode()
+  headers.setdefault("Accept-Encoding", "identity")
+
+  attempt = 0
+  while True:
+    start = time.monotonic()
+    try:
+      status, resp_headers, data, reused = _send(
+        key, method, target, body, headers, timeout, ca_file, verify
+      )
+    except (OSError, http.client.HTTPException) as exc:
+      _count(host, requests=1, errors=1, seconds=time.monotonic() - start)
+      if attempt >= retries:
+        raise OSError(f"{method} {url}: {exc}") from exc
+      delay = backoff * 2**attempt
+      log.debug("httpclient: %s %s failed (%s), retrying", method, url, exc)
+    else:
+      _count(
+        host,
+        requests=1,
+        seconds=time.monotonic() - start,
+        bytes=len(data),
+        connections=0 if reused else 1,
+        reused=1 if reused else 0,
+      )
+      if status not in RETRY_STATUSES or attempt >= retries:
+        break
+      delay = backoff * 2**attempt
+      retry_after = resp_headers.get("retry-after", "")
+      if retry_after.isdigit():
+        delay = min(int(retry_after), MAX_RETRY_AFTER)
+      log.debug("httpclient: %s %s answered %d, retrying", method, url, status)
+    _count(host, retries=1)
+    attempt += 1
+    time.sleep(delay)
+
+  try:
+    decoded = json.loads(data) if data else None
+  except ValueError:
+    decoded = None
+  return {"status": status, "headers": resp_headers, "body": data, "json": decoded}
+
+
+def _bypassed(hostname, no_proxy):
+  for entry in no_proxy:
+    entry = entry.strip().lstrip(".").lower()
+    if entry == "*" or hostname == entry or hostname.endswith("." + entry):
+      return True
+  return False
+
+
+def proxy_for(url, opts=None):
+  """
+  The proxy a request to url should go through, like salt.utils.http.
+
+  The salt options proxy_host/proxy_port (with proxy_username and
+  proxy_password) win, except for hosts in the no_proxy option; without
+  them the http_proxy/https_proxy/no_proxy environment is used.
+
+  Args:
+      url: The URL about to be requested
+      opts: Salt options (__opts__)
+
+  Returns:
+      str: Proxy URL for request(proxy=...), or None to connect directly
+  """
+  opts = opts or {}
+  parts = urllib.parse.urlsplit(url)
+  hostname = (parts.hostname or "").lower()
+  proxy_host = opts.get("proxy_host")
+  if proxy_host:
+    no_proxy = opts.get("no_proxy") or []
+    if isinstance(no_proxy, str):
+      no_proxy = no_proxy.split(",")
+    if _bypassed(hostname, no_proxy):
+      return None
+    proxy_host = proxy_host.split("://", 1)[-1].rstrip("/")
+    netloc = f"{proxy_host}:{opts.get('proxy_port') or 3128}"
+    if opts.get("proxy_username"):
+      user = urllib.parse.quote(opts["proxy_username"], safe="")
+      password = urllib.parse.quote(opts.get("proxy_password") or "", safe="")
+      netloc = f"{user}:{password}@{netloc}"
+    return "http://" + netloc
+  if urllib.request.proxy_bypass(hostname):
+    return None
+  return urllib.request.getproxies().get(parts.scheme.lower())
+
+
+def metrics(host=None):
+  """
+  Per-host request counters for this process.
+
+  Args:
+      host: Only this host (netloc, e.g. "api.github.com")
+
+  Returns:
+      dict: host -> requests, errors, retries, connections (opened),
+      reused, seconds and bytes
+  """
+  with _lock:
+    snapshot = {h: dict(c) for h, c in _metrics.items()}
+  for counters in snapshot.values():
+    counters["seconds"] = round(counters["seconds"], 3)
+  if host is not None:
+    return snapshot.get(host, {})
+  return snapshot
+
+
+def close():
+  """Close every idle pooled connection and reset the metrics."""
+  with _lock:
+    pools = list(_idle.values())
+    _idle.clear()
+    _metrics.clear()
+  for idle in pools:
+    for conn in idle:
+      conn.close()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Salt utils module for recovering from failed batch package transactions.
+
+:maintainer: cozy-salt
+:maturity: production
+:platform: Arch Linux
+
+When a batch `pacman -S` / `yay -S` fails, retrying every package on its
+own costs one transaction (or one AUR build) per package. Bisecting the
+failed set instead isolates k bad packages in O(k log n) transactions
+while every good package still lands in some successful batch.
+
+Usage from execution modules:
+    installed, failed = __utils__["pkgbatch.bisect"](to_install, run_batch, result)
+"""
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def bisect(packages, run_batch, failed_result):
+  """
+  Split a failed batch in halves and retry until each failure is isolated.
+
+  Args:
+      packages: Package names from the batch that failed
+      run_batch: Callable taking a list of package names and returning a
+          cmd.run_all style dict (retcode, stdout, stderr)
+      failed_result: The cmd.run_all result of the failed batch
+
+  Returns:
+      tuple: (installed, failed) - package names from successful batches in
+      input order, and a dict of failing package name -> the result of its
+      single-package attempt
+  """
+  installed = []
+  failed = {}
+
+  def _solve(batch, result):
+    if result is None:
+      result = run_batch(batch)
+      if result["retcode"] == 0:
+        installed.extend(batch)
+        return
+    if len(batch) == 1:
+      failed[batch[0]] = result
+      return
+    mid = len(batch) // 2
+    _solve(batch[:mid], None)
+    _solve(batch[mid:], None)
+
+  _solve(list(packages), failed_result)
+  log.debug("pkgbatch.bisect: %d installed, failed: %s", len(installed), list(failed))
+  return installed, failed
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Salt utils module for the sanitized package-build environment.
+
+:maintainer: cozy-salt
+:maturity: production
+:platform: Arch Linux
+
+Single source of the clean environment pacman and yay commands run with.
+Explicitly zeroes tool-specific vars so PKGBUILD scripts and install hooks
+can't fall back to paths like /opt/rust. Empty string != unset for many
+build systems.
+
+Environments are built once per runas (home looked up via pwd) and the
+current values of the passthrough allowlist, and returned as read-only
+mappings. Callers take a .copy() where a mutable env is required.
+
+Usage from execution modules:
+    env = __utils__["pkgenv.clean_env"](runas)
+    __salt__["cmd.run_all"](cmd, runas=runas, env=env.copy())
+"""
+
+import os
+import pwd
+import types
+
+# Variables copied from the minion's own environment when set
+PASSTHROUGH = ("DISTCC_HOSTS",)
+
+# path — system + distcc for distributed builds
+PATH = (
+  "/usr/lib/distcc/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+)
+
+# Explicitly emptied so user/conda/toolchain config can't leak into builds
+CLEARED = (
+  # python — prevent conda/venv bleed
+  "PYTHONHOME",
+  "PYTHONPATH",
+  "CONDA_PREFIX",
+  "CONDA_DEFAULT_ENV",
+  "CONDA_EXE",
+  # node
+  "NVM_DIR",
+  "NODE_PATH",
+  "npm_config_prefix",
+  # rust — prevent /opt/rust fallback
+  "CARGO_HOME",
+  "RUSTUP_HOME",
+  # go
+  "GOPATH",
+  "GOROOT",
+  # ruby
+  "GEM_HOME",
+  "GEM_PATH",
+  # perl
+  "PERL5LIB",
+  "PERL_LOCAL_LIB_ROOT",
+  "PERL_MB_OPT",
+  "PERL_MM_OPT",
+  # java
+  "JAVA_HOME",
+  # qt
+  "QT_PLUGIN_PATH",
+  "QT_QPA_PLATFORMTHEME",
+  "QT_STYLE_OVERRIDE",
+  # compiler overrides — let makepkg use its own defaults
+  "CC",
+  "CXX",
+  "LD",
+  "AR",
+  "NM",
+  "STRIP",
+  "OBJCOPY",
+  "OBJDUMP",
+  "CFLAGS",
+  "CXXFLAGS",
+  "LDFLAGS",
+  "CPPFLAGS",
+)
+
+# (user, passthrough items) -> read-only env
+_env_cache = {}
+
+
+def home_dir(user):
+  """Home directory from the passwd database, /home/<user> if unknown."""
+  try:
+    return pwd.getpwnam(user).pw_dir
+  except KeyError:
+    return f"/home/{user}"
+
+
+def _build_env(user, passthrough):
+  home = home_dir(user)
+  env = {
+    # identity
+    "HOME": home,
+    "USER": user,
+    "LOGNAME": user,
+    "SHELL": "/bin/bash",
+    # locale
+    "LANG": "en_US.UTF-8",
+    "LC_ALL": "en_US.UTF-8",
+    "PATH": PATH,
+    # xdg
+    "XDG_CACHE_HOME": f"{home}/.cache",
+    "XDG_CONFIG_HOME": f"{home}/.config",
+    "XDG_DATA_HOME": f"{home}/.local/share",
+    "GNUPGHOME": f"{home}/.gnupg",
+    "PYTHON": "/usr/bin/python",
+  }
+  env.update(dict.fromkeys(CLEARED, ""))
+  env.update(passthrough)
+  return types.MappingProxyType(env)
+
+
+def clean_env(runas=None, passthrough=()):
+  """
+  Return the sanitized environment for package operations.
+
+  Args:
+      runas: User the command runs as (defaults to root)
+      passthrough: Extra variable names to copy from the minion environment,
+          on top of PASSTHROUGH
+
+  Returns:
+      mappingproxy: Read-only environment, shared between calls
+  """
+  user = runas or "root"
+  names = dict.fromkeys((*PASSTHROUGH, *passthrough))
+  items = tuple((name, os.environ.get(name, "")) for name in names)
+  key = (user, items)
+  env = _env_cache.get(key)
+  if env is None:
+    env = _env_cache[key] = _build_env(user, items)
+  return env
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Salt utils module for downloading package files ahead of a pacman transaction.
+
+:maintainer: cozy-salt
+:maturity: production
+:platform: Arch Linux
+
+pacman downloads and installs in one step while holding the database lock.
+fetch() pulls the planned package files into the pacman cache concurrently
+beforehand (no lock needed), so the transaction itself only finds them in
+CacheDir and installs. Each file is tried against its repo's servers in
+pacman.conf order and checked against the sync db sha256 before it is
+renamed into place; pacman still verifies signatures as usual.
+
+Usage from execution modules:
+    targets = __utils__["alpm.download_set"](index, names, local)
+    servers = __utils__["alpm.repo_servers"]("/etc/pacman.conf", arch)
+    __utils__["pkgfetch.fetch"](targets, "/var/cache/pacman/pkg", servers, jobs=4)
+"""
+
+import concurrent.futures
+import hashlib
+import logging
+import os
+import tempfile
+import urllib.request
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHEDIR = "/var/cache/pacman/pkg"
+
+CHUNK = 1024 * 1024
+
+
+def _cached(path, target):
+  """True if a complete copy of target is already at path."""
+  try:
+    size = os.path.getsize(path)
+  except OSError:
+    return False
+  return not target["size"] or size == target["size"]
+
+
+def _store(src, target, cachedir):
+  """Copy file object src into cachedir via a temp file, checking sha256."""
+  digest = hashlib.sha256()
+  fd, tmp = tempfile.mkstemp(prefix=f".{target['filename']}.", dir=cachedir)
+  written = 0
+  try:
+    with os.fdopen(fd, "wb") as out:
+      while chunk := src.read(CHUNK):
+        digest.update(chunk)
+        out.write(chunk)
+        written += len(chunk)
+    if target["sha256"] and digest.hexdigest() != target["sha256"]:
+      raise ValueError("sha256 mismatch")
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, os.path.join(cachedir, target["filename"]))
+  except BaseException:
+    os.unlink(tmp)
+    raise
+  return written
+
+
+def _download(url, target, cachedir, timeout):
+  """Stream url into cachedir; return bytes written."""
+  with urllib.request.urlopen(url, timeout=timeout) as r:
+    return _store(r, target, cachedir)
+
+
+def adopt(path, target, cachedir=DEFAULT_CACHEDIR):
+  """
+  Copy an already-local package file (e.g. from the fleet cache) into the
+  pacman cache after checking it against the sync db sha256.
+
+  Args:
+      path: Local file to copy
+      target: One alpm.download_set() entry
+      cachedir: pacman CacheDir
+
+  Returns:
+      int: Bytes copied, or None if the file is unreadable or doesn't match
+  """
+  os.makedirs(cachedir, exist_ok=True)
+  try:
+    with open(path, "rb") as src:
+      return _store(src, target, cachedir)
+  except (OSError, ValueError) as exc:
+    log.debug("pkgfetch: not adopting %s: %s", path, exc)
+    return None
+
+
+def _fetch_one(target, cachedir, servers, timeout):
+  """
+  Try each server for target.
+
+  Returns:
+      tuple: (bytes written, None) after a download, (None, None) when a
+      complete copy is already in cachedir, or (0, last error) when every
+      server failed
+  """
+  path = os.path.join(cachedir, target["filename"])
+  if _cached(path, target):
+    return None, None
+  error = "no servers configured"
+  for server in servers.get(target["repo"], []):
+    url = f"{server.rstrip('/')}/{target['filename']}"
+    try:
+      return _download(url, target, cachedir, timeout), None
+    except (OSError, ValueError) as exc:
+      log.debug("pkgfetch: %s failed: %s", url, exc)
+      error = f"{url}: {exc}"
+  return 0, error
+
+
+def fetch(targets, cachedir=DEFAULT_CACHEDIR, servers=None, jobs=4, timeout=30):
+  """
+  Download package files into the pacman cache in parallel.
+
+  Args:
+      targets: Result of alpm.download_set()
+      cachedir: pacman CacheDir
+      servers: Result of alpm.repo_servers()
+      jobs: Concurrent downloads
+      timeout: Per-connection timeout in seconds
+
+  Returns:
+      dict: ``fetched`` and ``cached`` filename lists, ``failed`` (filename
+      -> last error) and ``bytes`` downloaded
+  """
+  ret = {"fetched": [], "cached": [], "failed": {}, "bytes": 0}
+  if not targets:
+    return ret
+  os.makedirs(cachedir, exist_ok=True)
+  servers = servers or {}
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+    futures = {
+      pool.submit(_fetch_one, target, cachedir, servers, timeout): target
+      for target in targets
+    }
+    for future in concurrent.futures.as_completed(futures):
+      filename = futures[future]["filename"]
+      # written is None for a file that was already cached
+      written, error = future.result()
+      if error:
+        ret["failed"][filename] = error
+      elif written is None:
+        ret["cached"].append(filename)
+      else:
+        ret["fetched"].append(filename)
+        ret["bytes"] += written
+
+  ret["fetched"].sort()
+  ret["cached"].sort()
+  if ret["failed"]:
+    log.warning(
+      "pkgfetch: %d of %d downloads failed, pacman will retry them",
+      len(ret["failed"]),
+      len(targets),
+    )
+  return ret
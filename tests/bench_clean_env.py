@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-command cost of building the package environment.
+
+Compares rebuilding the sanitized env on every call (the old _clean_env)
+with the memoized pkgenv.clean_env lookup, plus the .copy() the
+modules hand to cmd.run_all.
+
+Usage:
+    python tests/bench_clean_env.py
+    python tests/bench_clean_env.py --calls 100000
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tests.lib.salt_modules import load_salt_module  # noqa: E402
+
+
+def run(calls):
+  pkgenv = load_salt_module("_utils/pkgenv.py")
+  cases = {
+    "rebuild per call": lambda: pkgenv._build_env("root", (("DISTCC_HOSTS", ""),)),
+    "memoized": lambda: pkgenv.clean_env("root"),
+    "memoized + copy()": lambda: pkgenv.clean_env("root").copy(),
+  }
+  print(f"{'case':<20} {'us/call':>8}")
+  for label, fn in cases.items():
+    seconds = min(timeit.repeat(fn, number=calls, repeat=5))
+    print(f"{label:<20} {seconds / calls * 1e6:>8.2f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument("--calls", type=int, default=20000)
+  args = parser.parse_args()
+  run(args.calls)
+
+
+if __name__ == "__main__":
+  main()
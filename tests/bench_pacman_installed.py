@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark pacman.installed probe cost against package count.
+
+Compares the old per-package `pacman -Q <pkg>` probing with the single
+snapshot used by pacman.installed(). Each fake cmd.run_all call sleeps for
+--fork-ms to stand in for the fork + pacman startup cost.
+
+Usage:
+    python tests/bench_pacman_installed.py
+    python tests/bench_pacman_installed.py --fork-ms 5 --sizes 10 100 300
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils  # noqa: E402
+
+
+def _fake_pacman(installed, fork_s):
+  def handler(cmd, **kwargs):
+    time.sleep(fork_s)
+    names = cmd.split()[2:]
+    if not names:
+      return 0, "\n".join(f"{n} 1.0-1" for n in installed), ""
+    return (0 if names[0] in installed else 1), "", ""
+
+  return handler
+
+
+def _measure(fn):
+  start = time.perf_counter()
+  fn()
+  return time.perf_counter() - start
+
+
+def run(sizes, fork_ms):
+  utils = load_salt_utils("_utils/pkgbatch.py", "_utils/pkgenv.py")
+  print(f"{'pkgs':>6} {'old forks':>10} {'old ms':>9} {'new forks':>10} {'new ms':>9}")
+  for size in sizes:
+    pkgs = [f"pkg{i}" for i in range(size)]
+    installed = set(pkgs)
+
+    old_run = FakeRunAll(_fake_pacman(installed, fork_ms / 1000))
+    old = load_salt_module(
+      "_modules/pacman.py", salt={"cmd.run_all": old_run}, utils=utils
+    )
+    old_s = _measure(lambda: [old.is_installed(p) for p in pkgs])
+
+    new_run = FakeRunAll(_fake_pacman(installed, fork_ms / 1000))
+    new = load_salt_module(
+      "_modules/pacman.py", salt={"cmd.run_all": new_run}, utils=utils
+    )
+    new_s = _measure(lambda: new.installed(pkgs=pkgs))
+
+    print(
+      f"{size:>6} {len(old_run.calls):>10} {old_s * 1000:>9.1f} "
+      f"{len(new_run.calls):>10} {new_s * 1000:>9.1f}"
+    )
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 300])
+  parser.add_argument("--fork-ms", type=float, default=2.0)
+  args = parser.parse_args()
+  run(args.sizes, args.fork_ms)
+
+
+if __name__ == "__main__":
+  main()
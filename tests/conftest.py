@@ -121,6 +121,20 @@ def windows_results(
   return _run_distro_test(container_manager, output_dir, "windows")
 
 
+@pytest.fixture
+def serve():
+  """Start stand-in servers with serve(cls, ...); all are stopped afterwards."""
+  servers = []
+
+  def _serve(cls, *args, **kwargs):
+    servers.append(cls(*args, **kwargs))
+    return servers[-1]
+
+  yield _serve
+  for server in servers:
+    server.stop()
+
+
 # Environment variable to skip container rebuild
 @pytest.fixture(scope="session")
 def skip_build() -> bool:
@@ -0,0 +1,35 @@
+"""
+Synthetic pacman databases for unit tests.
+
+Lays out local/ and sync/ the way libalpm does so the alpm utils reader and
+the pacman/yay modules can run against a tmp_path DBPath.
+"""
+
+import io
+import tarfile
+
+
+def write_local_pkg(dbpath, name, version, **fields):
+  """Create local/<name>-<version>/desc the way libalpm lays it out."""
+  pkg_dir = dbpath / "local" / f"{name}-{version}"
+  pkg_dir.mkdir(parents=True)
+  lines = ["%NAME%", name, "", "%VERSION%", version, ""]
+  for key, values in fields.items():
+    lines += [f"%{key.upper()}%", *values, ""]
+  (pkg_dir / "desc").write_text("\n".join(lines))
+  return pkg_dir
+
+
+def write_sync_db(dbpath, repo, packages):
+  """Create sync/<repo>.db as a gzip tarball of <name>-<version>/desc entries."""
+  sync_dir = dbpath / "sync"
+  sync_dir.mkdir(parents=True, exist_ok=True)
+  with tarfile.open(sync_dir / f"{repo}.db", "w:gz") as tar:
+    for fields in packages:
+      lines = []
+      for key, values in fields.items():
+        lines += [f"%{key.upper()}%", *values, ""]
+      data = "\n".join(lines).encode()
+      member = tarfile.TarInfo(f"{fields['name'][0]}-{fields['version'][0]}/desc")
+      member.size = len(data)
+      tar.addfile(member, io.BytesIO(data))
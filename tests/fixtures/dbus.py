@@ -0,0 +1,161 @@
+"""
+Local D-Bus session bus stand-in over a unix socket.
+
+Speaks just enough of the protocol for a notification client: EXTERNAL
+auth, a reply to Hello, and a reply to every other method call. Each call
+is recorded as (member, args) with the body decoded; args for Notify are
+the notification's (app, replaces_id, icon, summary, body, actions,
+hints, timeout).
+"""
+
+import os
+import socket
+import struct
+import threading
+
+ALIGN = {"y": 1, "g": 1, "v": 1, "u": 4, "i": 4, "s": 4, "o": 4, "a": 4, "{": 8}
+
+
+def split(sig):
+  """Complete types in a signature: "susa{sv}i" -> s, u, s, a{sv}, i."""
+  types, pos = [], 0
+  while pos < len(sig):
+    end = pos
+    while sig[end] == "a":
+      end += 1
+    if sig[end] == "{":
+      depth = 0
+      while True:
+        depth += {"{": 1, "}": -1}.get(sig[end], 0)
+        end += 1
+        if not depth:
+          break
+    else:
+      end += 1
+    types.append(sig[pos:end])
+    pos = end
+  return types
+
+
+class Reader:
+  def __init__(self, data, pos=0):
+    self.data, self.pos = data, pos
+
+  def align(self, n):
+    self.pos += -self.pos % n
+
+  def read(self, sig):
+    code = sig[0]
+    self.align(ALIGN[code])
+    if code == "y":
+      self.pos += 1
+      return self.data[self.pos - 1]
+    if code in "ui":
+      (value,) = struct.unpack_from("<I" if code == "u" else "<i", self.data, self.pos)
+      self.pos += 4
+      return value
+    if code in "so":
+      (n,) = struct.unpack_from("<I", self.data, self.pos)
+      value = self.data[self.pos + 4 : self.pos + 4 + n].decode()
+      self.pos += 5 + n
+      return value
+    if code == "g":
+      n = self.data[self.pos]
+      value = self.data[self.pos + 1 : self.pos + 1 + n].decode()
+      self.pos += 2 + n
+      return value
+    if code == "v":
+      return self.read(self.read("g"))
+    if code == "a":
+      (n,) = struct.unpack_from("<I", self.data, self.pos)
+      self.pos += 4
+      elem = sig[1:]
+      self.align(8 if elem[0] in "({" else ALIGN[elem[0]])
+      end, items = self.pos + n, []
+      while self.pos < end:
+        if elem[0] == "{":
+          self.align(8)
+          items.append((self.read(elem[1]), self.read(elem[2:-1])))
+        elif elem[0] == "(":
+          self.align(8)
+          items.append(tuple(self.read(c) for c in elem[1:-1]))
+        else:
+          items.append(self.read(elem))
+      return dict(items) if elem[0] == "{" else items
+    raise ValueError(sig)
+
+
+def pad(buf, n):
+  buf.extend(b"\0" * (-len(buf) % n))
+
+
+def method_return(serial, reply_serial, body=b"", signature=""):
+  fields = bytearray()
+  pad(fields, 8)
+  fields.extend(b"\x05\x01u\x00" + struct.pack("<I", reply_serial))
+  if signature:
+    pad(fields, 8)
+    fields.extend(b"\x08\x01g\x00" + bytes([len(signature)]) + signature.encode())
+    fields.append(0)
+  msg = bytearray(b"l\x02\x00\x01")
+  msg.extend(struct.pack("<III", len(body), serial, len(fields)))
+  msg.extend(fields)
+  pad(msg, 8)
+  return bytes(msg + body)
+
+
+class FakeSessionBus:
+  def __init__(self, path):
+    self.path = path
+    self.calls = []
+    self.auth = []
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.bind(path)
+    self.sock.listen(8)
+    threading.Thread(target=self._serve, daemon=True).start()
+
+  def _serve(self):
+    while True:
+      try:
+        conn, _ = self.sock.accept()
+      except OSError:
+        return
+      with conn:
+        try:
+          self._session(conn.makefile("rb"), conn)
+        except (OSError, ValueError, struct.error):
+          pass
+
+  def _session(self, stream, conn):
+    assert stream.read(1) == b"\0"
+    self.auth.append(stream.readline().strip().decode())
+    conn.sendall(b"OK 0123456789abcdef0123456789abcdef\r\n")
+    if stream.readline().strip() != b"BEGIN":
+      return
+    serial = 100
+    while True:
+      head = stream.read(16)
+      if len(head) < 16:
+        return
+      body_len, msg_serial, fields_len = struct.unpack("<III", head[4:16])
+      rest = stream.read(fields_len + (-(16 + fields_len) % 8) + body_len)
+      data = head + rest
+      reader = Reader(data, 12)
+      fields = dict(reader.read("a(yv)"))
+      reader.align(8)
+      args = [reader.read(t) for t in split(fields.get(8, ""))]
+      self.calls.append((fields[3], args))
+      serial += 1
+      if fields[3] == "Hello":
+        name = b":1.1"
+        body = struct.pack("<I", len(name)) + name + b"\0"
+        conn.sendall(method_return(serial, msg_serial, body, "s"))
+      else:
+        conn.sendall(method_return(serial, msg_serial, struct.pack("<I", 7), "u"))
+
+  def notifications(self):
+    return [args for member, args in self.calls if member == "Notify"]
+
+  def stop(self):
+    self.sock.close()
+    os.unlink(self.path)
@@ -0,0 +1,140 @@
+"""
+Local HTTP stand-in for the GitHub REST API.
+
+Point github_release at it with the github_release.api_url minion option.
+Release responses carry an ETag and Last-Modified and honour If-None-Match
+with a 304. POST /graphql answers the repository/latestRelease/releases
+batch queries github_release.latest_many sends (valid token required).
+Connections are kept alive (HTTP/1.1); pass tls=True to serve HTTPS with
+the throwaway certificate from tests.fixtures.https.
+"""
+
+import hashlib
+import http.server
+import json
+import re
+import socket
+import threading
+import time
+
+from tests.fixtures.https import use_tls
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def setup(self):
+    super().setup()
+    with self.server.api.lock:
+      self.server.api.connections += 1
+      self.server.api.sockets.append(self.connection)
+
+  def do_GET(self):
+    api = self.server.api
+    token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+    with api.lock:
+      api.requests.append((self.path, token))
+      api.headers.append(dict(self.headers))
+    if self.path == "/user":
+      status, delay, *headers = api.tokens.get(token, (401, 0))
+      time.sleep(delay)
+      self._send(
+        status,
+        {"login": "cozy"} if status == 200 else {"message": "Bad"},
+        headers=headers[0] if headers else None,
+      )
+      return
+    repo, _, rest = self.path.removeprefix("/repos/").partition("/releases")
+    releases = api.releases.get(repo)
+    if releases is None:
+      self._send(404, {"message": "Not Found"})
+    elif rest == "/latest":
+      stable = [r for r in releases if not r.get("prerelease")]
+      self._send(200, stable[0], conditional=True) if stable else self._send(404, {})
+    else:
+      self._send(200, releases, conditional=True)
+
+  def do_POST(self):
+    api = self.server.api
+    token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+    query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["query"]
+    with api.lock:
+      api.requests.append((self.path, token))
+    if self.path != "/graphql" or api.tokens.get(token, (401,))[0] != 200:
+      self._send(401, {"message": "Bad credentials"})
+      return
+    data = {}
+    pattern = r'(r\d+): repository\(owner: "(.*?)", name: "(.*?)"\) \{ (\w+)'
+    for alias, owner, name, field in re.findall(pattern, query):
+      releases = api.releases.get(f"{owner}/{name}")
+      if releases is None:
+        data[alias] = None
+      elif field == "latestRelease":
+        stable = [r for r in releases if not r.get("prerelease")]
+        data[alias] = {
+          "latestRelease": {"tagName": stable[0]["tag_name"]} if stable else None
+        }
+      else:
+        data[alias] = {
+          "releases": {"nodes": [{"tagName": r["tag_name"]} for r in releases[:1]]}
+        }
+    self._send(200, {"data": data})
+
+  def _send(self, status, body, conditional=False, headers=None):
+    data = json.dumps(body).encode()
+    etag = f'"{hashlib.sha1(data).hexdigest()}"'
+    if conditional and self.headers.get("If-None-Match") == etag:
+      self.send_response(304)
+      self.send_header("ETag", etag)
+      self.end_headers()
+      return
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    if conditional:
+      self.send_header("ETag", etag)
+      self.send_header("Last-Modified", "Sat, 17 Oct 2026 12:00:00 GMT")
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(data)
+
+  def log_message(self, *args):
+    pass
+
+
+class FakeGitHub:
+  """
+  Threaded fake API.
+
+  tokens: token -> (status for /user, delay seconds[, extra response headers])
+  releases: "owner/name" -> list of release dicts, newest first
+  """
+
+  def __init__(self, tokens=None, releases=None, tls=False):
+    self.tokens = tokens or {}
+    self.releases = releases or {}
+    self.lock = threading.Lock()
+    self.requests = []
+    self.headers = []
+    self.connections = 0
+    self.sockets = []
+    self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    self.server.api = self
+    self.ca_file = use_tls(self.server) if tls else None
+    scheme = "https" if tls else "http"
+    self.url = f"{scheme}://127.0.0.1:{self.server.server_port}"
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def paths(self, prefix=""):
+    return [path for path, _ in self.requests if path.startswith(prefix)]
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+    # kept-alive connections would otherwise go on being served
+    for sock in self.sockets:
+      try:
+        sock.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
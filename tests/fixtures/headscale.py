@@ -0,0 +1,48 @@
+"""
+Local HTTPS stand-in for the headscale API (GET /api/v1/node).
+
+Point the headscale module at it with headscale:login-server = url and
+headscale:api-key = api_key in pillar, and ca_bundle = ca_file in opts.
+Requests without the right bearer key get a 401. With etag=True the list
+carries an ETag and If-None-Match is answered with a 304.
+"""
+
+import hashlib
+import json
+
+from tests.fixtures.https import LocalHTTPS
+
+
+def node(name, ips, online=True, tags=(), given_name=None):
+  """A node dict shaped like headscale's API response."""
+  return {
+    "name": name,
+    "givenName": given_name or name,
+    "ipAddresses": list(ips),
+    "online": online,
+    "tags": list(tags),
+  }
+
+
+class FakeHeadscale(LocalHTTPS):
+  """nodes: list of node() dicts served from /api/v1/node."""
+
+  def __init__(self, nodes=None, api_key="hskey", etag=False):
+    self.nodes = nodes or []
+    self.api_key = api_key
+    self.etag = etag
+    super().__init__({"/api/v1/node": self._list_nodes})
+
+  def _list_nodes(self, handler, body):
+    if handler.headers.get("Authorization") != f"Bearer {self.api_key}":
+      return 401, {"message": "Unauthorized"}
+    data = json.dumps({"nodes": self.nodes}).encode()
+    if not self.etag:
+      return 200, data
+    etag = f'"{hashlib.sha1(data).hexdigest()}"'
+    if handler.headers.get("If-None-Match") == etag:
+      return 304, b"", {"ETag": etag}
+    return 200, data, {"ETag": etag}
+
+  def node_requests(self):
+    return self.paths().count("/api/v1/node")
@@ -0,0 +1,182 @@
+"""
+Local HTTPS stand-ins for the httpclient utils and the modules using it.
+
+cert() makes a throwaway self-signed certificate for 127.0.0.1/localhost
+with the openssl CLI (once per test session); use_tls() wraps any
+http.server listening socket with it. LocalHTTPS serves canned routes over
+keep-alive HTTP/1.1 and counts the TCP connections it accepted;
+ConnectProxy is a CONNECT-only forward proxy in front of it.
+"""
+
+import functools
+import http.server
+import json
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+
+@functools.lru_cache(maxsize=None)
+def cert():
+  """(certfile, keyfile) of a self-signed cert valid for 127.0.0.1."""
+  directory = Path(tempfile.mkdtemp(prefix="cozy-tls-"))
+  certfile, keyfile = directory / "cert.pem", directory / "key.pem"
+  subprocess.run(
+    [
+      "openssl",
+      "req",
+      "-x509",
+      "-newkey",
+      "rsa:2048",
+      "-nodes",
+      "-days",
+      "1",
+      "-subj",
+      "/CN=localhost",
+      "-addext",
+      "subjectAltName=IP:127.0.0.1,DNS:localhost",
+      "-keyout",
+      str(keyfile),
+      "-out",
+      str(certfile),
+    ],
+    check=True,
+    capture_output=True,
+  )
+  return str(certfile), str(keyfile)
+
+
+def use_tls(server):
+  """Serve server over TLS; returns the CA file clients should trust."""
+  certfile, keyfile = cert()
+  context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+  context.load_cert_chain(certfile, keyfile)
+  server.socket = context.wrap_socket(server.socket, server_side=True)
+  return certfile
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def setup(self):
+    super().setup()
+    with self.server.stand_in.lock:
+      self.server.stand_in.connections += 1
+      self.server.stand_in.sockets.append(self.connection)
+
+  def _serve(self):
+    stand_in = self.server.stand_in
+    length = int(self.headers.get("Content-Length") or 0)
+    body = self.rfile.read(length) if length else b""
+    with stand_in.lock:
+      stand_in.requests.append((self.command, self.path, dict(self.headers), body))
+    route = stand_in.routes.get(self.path, (404, {"message": "Not Found"}))
+    if callable(route):
+      route = route(self, body)
+    status, payload = route[:2]
+    headers = route[2] if len(route) > 2 else {}
+    data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    self.send_response(status)
+    self.send_header("Content-Length", str(len(data)))
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(data)
+
+  do_GET = do_POST = _serve
+
+  def log_message(self, *args):
+    pass
+
+
+class LocalHTTPS:
+  """
+  Threaded HTTPS server with canned responses.
+
+  routes: path (including query) -> (status, body[, headers]) or a
+  callable (handler, request body) returning that tuple. Bodies that
+  aren't bytes are sent as JSON.
+  """
+
+  def __init__(self, routes=None, tls=True):
+    self.routes = routes or {}
+    self.lock = threading.Lock()
+    self.requests = []
+    self.connections = 0
+    self.sockets = []
+    self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    self.server.stand_in = self
+    self.ca_file = use_tls(self.server) if tls else None
+    scheme = "https" if tls else "http"
+    self.host = f"127.0.0.1:{self.server.server_port}"
+    self.url = f"{scheme}://{self.host}"
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def paths(self):
+    return [path for _, path, _, _ in self.requests]
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+    # kept-alive connections would otherwise go on being served
+    for sock in self.sockets:
+      try:
+        sock.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+
+
+class ConnectProxy:
+  """
+  Forward proxy that only tunnels: answers CONNECT host:port with 200 and
+  pipes bytes both ways. Records (request line, headers) per tunnel.
+  """
+
+  def __init__(self):
+    self.tunnels = []
+    self.sock = socket.create_server(("127.0.0.1", 0))
+    self.host = f"127.0.0.1:{self.sock.getsockname()[1]}"
+    self.url = f"http://{self.host}"
+    threading.Thread(target=self._serve, daemon=True).start()
+
+  def _serve(self):
+    while True:
+      try:
+        client, _ = self.sock.accept()
+      except OSError:
+        return
+      threading.Thread(target=self._tunnel, args=(client,), daemon=True).start()
+
+  def _tunnel(self, client):
+    stream = client.makefile("rb")
+    line = stream.readline().decode().strip()
+    headers = {}
+    while (header := stream.readline().decode().strip()) != "":
+      name, _, value = header.partition(":")
+      headers[name.strip()] = value.strip()
+    self.tunnels.append((line, headers))
+    host, _, port = line.split()[1].rpartition(":")
+    upstream = socket.create_connection((host, int(port)))
+    client.sendall(b"HTTP/1.1 200 Connection established\r\n\r\n")
+    threading.Thread(target=self._pipe, args=(upstream, client), daemon=True).start()
+    self._pipe(client, upstream)
+
+  @staticmethod
+  def _pipe(src, dst):
+    try:
+      while data := src.recv(65536):
+        dst.sendall(data)
+    except OSError:
+      pass
+    finally:
+      for sock in (src, dst):
+        try:
+          sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+          pass
+
+  def stop(self):
+    self.sock.close()
@@ -0,0 +1,80 @@
+"""
+Local HTTP stand-in for a pacman mirror.
+
+Serves <root>/<repo>/os/<arch>/<filename> like a real mirror, slowly enough
+to observe concurrent downloads.
+"""
+
+import functools
+import hashlib
+import http.server
+import threading
+import time
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+  def do_GET(self):
+    mirror = self.server.mirror
+    with mirror.lock:
+      mirror.active += 1
+      mirror.max_active = max(mirror.max_active, mirror.active)
+      mirror.requests.append(self.path)
+    time.sleep(mirror.delay_s)
+    try:
+      super().do_GET()
+    finally:
+      with mirror.lock:
+        mirror.active -= 1
+
+  def log_message(self, *args):
+    pass
+
+
+class LocalMirror:
+  """Threaded HTTP server over root; call stop() when done."""
+
+  def __init__(self, root, delay_s=0.05):
+    self.root = root
+    self.root.mkdir(parents=True, exist_ok=True)
+    self.delay_s = delay_s
+    self.lock = threading.Lock()
+    self.active = 0
+    self.max_active = 0
+    self.requests = []
+    handler = functools.partial(_Handler, directory=str(root))
+    self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    self.server.mirror = self
+    self.url = f"http://127.0.0.1:{self.server.server_port}"
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def publish(self, repo, name, version, depends=(), data=None, arch="x86_64"):
+    """Put a package file on the mirror; return its sync db fields."""
+    filename = f"{name}-{version}-{arch}.pkg.tar.zst"
+    data = data or f"{name} payload".encode() * 100
+    path = self.root / repo / "os" / arch / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return {
+      "name": [name],
+      "version": [version],
+      "filename": [filename],
+      "csize": [str(len(data))],
+      "sha256sum": [hashlib.sha256(data).hexdigest()],
+      **({"depends": list(depends)} if depends else {}),
+    }
+
+  def write_conf(self, directory):
+    """pacman.conf whose [core] Includes a mirrorlist with a dead server first."""
+    mirrorlist = directory / "mirrorlist"
+    mirrorlist.write_text(
+      "## reflector output\n"
+      "Server = http://127.0.0.1:9/$repo/os/$arch\n"
+      f"Server = {self.url}/$repo/os/$arch\n"
+    )
+    conf = directory / "pacman.conf"
+    conf.write_text(f"[options]\nHoldPkg = pacman\n\n[core]\nInclude = {mirrorlist}\n")
+    return conf
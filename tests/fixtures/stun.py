@@ -0,0 +1,63 @@
+"""
+Local STUN stand-in (RFC 5389 binding requests over UDP).
+
+Answers every binding request with an XOR-MAPPED-ADDRESS of mapped (the
+address the server pretends it saw), optionally after a delay. Point a
+netinfo stun provider at host/port.
+"""
+
+import ipaddress
+import socket
+import struct
+import threading
+import time
+
+MAGIC = 0x2112A442
+
+
+class FakeSTUN:
+  def __init__(self, mapped="198.51.100.7", delay=0, host="127.0.0.1"):
+    self.mapped = mapped
+    self.delay = delay
+    self.requests = 0
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    self.sock = socket.socket(family, socket.SOCK_DGRAM)
+    self.sock.bind((host, 0))
+    self.host = host
+    self.port = self.sock.getsockname()[1]
+    self._stop = False
+    threading.Thread(target=self._serve, daemon=True).start()
+
+  def _serve(self):
+    while not self._stop:
+      try:
+        data, peer = self.sock.recvfrom(2048)
+      except OSError:
+        return
+      self.requests += 1
+      msg_type, _, cookie = struct.unpack("!HHI", data[:8])
+      if msg_type != 0x0001 or cookie != MAGIC:
+        continue
+      txid = data[8:20]
+      address = ipaddress.ip_address(self.mapped)
+      mask = struct.pack("!I", MAGIC) + txid
+      xaddr = bytes(b ^ m for b, m in zip(address.packed, mask))
+      family = 0x01 if address.version == 4 else 0x02
+      value = struct.pack("!BBH", 0, family, 3478 ^ (MAGIC >> 16)) + xaddr
+      # an unrelated attribute first, as real servers send SOFTWARE etc.
+      software = b"fake"
+      attrs = struct.pack("!HH", 0x8022, len(software)) + software
+      attrs += struct.pack("!HH", 0x0020, len(value)) + value
+      time.sleep(self.delay)
+      if self._stop:
+        return
+      self.sock.sendto(
+        struct.pack("!HHI", 0x0101, len(attrs), MAGIC) + txid + attrs, peer
+      )
+
+  def provider(self, name="stun"):
+    return {"name": name, "type": "stun", "host": self.host, "port": self.port}
+
+  def stop(self):
+    self._stop = True
+    self.sock.close()
@@ -0,0 +1,171 @@
+"""
+Load cozy-salt custom modules outside of a Salt minion.
+
+Custom modules under srv/salt/_* rely on loader-injected dunders
+(__salt__, __grains__, __pillar__, __opts__, __context__, __utils__).
+These helpers import a module straight from its file and inject plain
+dicts in their place so unit tests can drive it with fakes.
+
+With loader_context=True the dunders behave like Salt's (3004+)
+NamedLoaderContext instead: they resolve through a contextvar set in the
+loading thread, so a thread started without a copy of that context can't
+use them - the failure a real minion hits.
+"""
+
+import collections.abc
+import contextvars
+import importlib.util
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+SALT_ROOT = PROJECT_ROOT / "srv" / "salt"
+
+LOADER_DUNDERS = (
+  "__salt__",
+  "__grains__",
+  "__pillar__",
+  "__opts__",
+  "__context__",
+  "__utils__",
+)
+
+
+class LoaderDunder(collections.abc.MutableMapping):
+  """A loader dunder whose value lives in a contextvar, like Salt's."""
+
+  def __init__(self, name: str, value: dict):
+    self._var: contextvars.ContextVar = contextvars.ContextVar(name)
+    self._var.set(value)
+
+  def _value(self) -> dict:
+    try:
+      return self._var.get()
+    except LookupError:
+      raise RuntimeError(f"{self._var.name} used outside the loader context") from None
+
+  def __getitem__(self, key: Any) -> Any:
+    return self._value()[key]
+
+  def __setitem__(self, key: Any, value: Any) -> None:
+    self._value()[key] = value
+
+  def __delitem__(self, key: Any) -> None:
+    del self._value()[key]
+
+  def __iter__(self):
+    return iter(self._value())
+
+  def __len__(self) -> int:
+    return len(self._value())
+
+
+def load_salt_module(
+  relpath: str, loader_context: bool = False, **dunders: Any
+) -> ModuleType:
+  """
+  Import a custom Salt module from srv/salt with injected loader dunders.
+
+  Args:
+      relpath: Path relative to srv/salt (e.g. "_modules/pacman.py").
+      loader_context: Resolve the dunders through a contextvar set in the
+          calling thread (see LoaderDunder) instead of plain dicts.
+      **dunders: Loader dunders keyed without underscores
+          (salt=..., grains=..., pillar=..., opts=..., context=..., utils=...).
+
+  Returns:
+      The freshly imported module object.
+  """
+  path = SALT_ROOT / relpath
+  name = "cozy_" + relpath.replace("/", "_").removesuffix(".py").lstrip("_")
+  spec = importlib.util.spec_from_file_location(name, path)
+  module = importlib.util.module_from_spec(spec)
+  for dunder in LOADER_DUNDERS:
+    value = dunders.get(dunder.strip("_"), {})
+    if loader_context:
+      value = LoaderDunder(dunder, value)
+    setattr(module, dunder, value)
+  spec.loader.exec_module(module)
+  return module
+
+
+def load_salt_utils(*relpaths: str) -> dict:
+  """
+  Build an __utils__ mapping for custom utils modules under srv/salt/_utils.
+
+  Args:
+      *relpaths: Paths relative to srv/salt (e.g. "_utils/alpm.py").
+
+  Returns:
+      Dict of "<module>.<function>" -> callable for public functions.
+  """
+  utils = {}
+  for relpath in relpaths:
+    module = load_salt_module(relpath)
+    prefix = Path(relpath).stem
+    utils.update(
+      {
+        f"{prefix}.{attr}": getattr(module, attr)
+        for attr in dir(module)
+        if not attr.startswith("_") and callable(getattr(module, attr))
+      }
+    )
+  return utils
+
+
+def load_http_module(
+  relpath: str,
+  server: Any = None,
+  cachedir: Any = None,
+  loader_context: bool = False,
+  **dunders: Any,
+) -> ModuleType:
+  """
+  Import a custom Salt module that talks HTTP through __utils__["httpclient.*"].
+
+  Args:
+      relpath: Path relative to srv/salt (e.g. "_modules/headscale.py").
+      server: Stand-in server from tests/fixtures; its ca_file, if it
+          serves TLS, becomes the ca_bundle option.
+      cachedir: Directory for the cachedir option.
+      loader_context: See load_salt_module.
+      **dunders: Other loader dunders, as for load_salt_module; opts are
+          merged over the ones above and utils defaults to httpclient.
+
+  Returns:
+      The freshly imported module object.
+  """
+  opts = {}
+  if getattr(server, "ca_file", None):
+    opts["ca_bundle"] = server.ca_file
+  if cachedir is not None:
+    opts["cachedir"] = str(cachedir)
+  opts.update(dunders.pop("opts", {}))
+  dunders.setdefault("utils", load_salt_utils("_utils/httpclient.py"))
+  return load_salt_module(relpath, loader_context, opts=opts, **dunders)
+
+
+class FakeRunAll:
+  """
+  Stand-in for __salt__["cmd.run_all"] that records every call.
+
+  The handler receives the command string and the keyword arguments and
+  returns (retcode, stdout, stderr). Without a handler every command
+  succeeds with empty output.
+  """
+
+  def __init__(self, handler: Optional[Callable[..., tuple]] = None):
+    self.handler = handler
+    self.calls: list[str] = []
+
+  def __call__(self, cmd: str, **kwargs: Any) -> dict:
+    self.calls.append(cmd)
+    retcode, stdout, stderr = (
+      self.handler(cmd, **kwargs) if self.handler else (0, "", "")
+    )
+    return {"retcode": retcode, "stdout": stdout, "stderr": stderr}
+
+  def count(self, prefix: str) -> int:
+    """Number of recorded commands starting with prefix."""
+    return sum(1 for cmd in self.calls if cmd.startswith(prefix))
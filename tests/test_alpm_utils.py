@@ -0,0 +1,232 @@
+"""
+Unit tests for the libalpm local database reader (srv/salt/_utils/alpm.py).
+
+Builds a synthetic pacman DBPath under tmp_path and checks both the reader
+and the pacman/yay modules that use it for read-only queries.
+"""
+
+import os
+
+import pytest
+
+from tests.fixtures.alpm import write_local_pkg, write_sync_db
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+
+@pytest.fixture
+def syncdb(tmp_path):
+  write_sync_db(
+    tmp_path,
+    "core",
+    [
+      {"name": ["git"], "version": ["2.47.0-1"], "desc": ["the fast VCS"]},
+      {
+        "name": ["openssh"],
+        "version": ["9.9p1-1"],
+        "desc": ["SSH connectivity tools"],
+        "provides": ["ssh=9.9"],
+        "csize": ["1048576"],
+      },
+    ],
+  )
+  write_sync_db(
+    tmp_path,
+    "extra",
+    [
+      {"name": ["firefox"], "version": ["131.0-1"], "desc": ["Web browser"]},
+      {"name": ["git"], "version": ["2.48.0-1"], "desc": ["newer git"]},
+    ],
+  )
+  return tmp_path
+
+
+@pytest.fixture
+def dbpath(tmp_path):
+  (tmp_path / "local").mkdir()
+  (tmp_path / "local" / "ALPM_DB_VERSION").write_text("9\n")
+  write_local_pkg(tmp_path, "git", "2.47.0-1", provides=["git-core"])
+  write_local_pkg(tmp_path, "vim", "9.1.0-1", desc=["Vi Improved"], reason=["1"])
+  return tmp_path
+
+
+@pytest.fixture
+def alpm():
+  return load_salt_module("_utils/alpm.py")
+
+
+def test_parse_desc_multi_value_fields(alpm):
+  fields = alpm.parse_desc("%NAME%\nfoo\n\n%DEPENDS%\nglibc\nzlib\n\n")
+
+  assert fields == {"name": ["foo"], "depends": ["glibc", "zlib"]}
+
+
+def test_local_packages_reads_desc_files(alpm, dbpath):
+  packages = alpm.local_packages(str(dbpath))
+
+  assert set(packages) == {"git", "vim"}
+  assert packages["git"]["provides"] == ["git-core"]
+  assert packages["vim"]["desc"] == "Vi Improved"
+  assert packages["vim"]["reason"] == 1
+  assert alpm.local_versions(str(dbpath)) == {"git": "2.47.0-1", "vim": "9.1.0-1"}
+
+
+def test_index_is_cached_until_mtime_changes(alpm, dbpath):
+  first = alpm.local_versions(str(dbpath))
+  assert alpm.local_versions(str(dbpath)) is first
+
+  write_local_pkg(dbpath, "htop", "3.3.0-1")
+  local = dbpath / "local"
+  stat = os.stat(local)
+  os.utime(local, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+  assert "htop" in alpm.local_versions(str(dbpath))
+
+
+def test_missing_database_returns_none(alpm, tmp_path):
+  assert alpm.local_versions(str(tmp_path / "nope")) is None
+
+
+@pytest.mark.parametrize("relpath", ["_modules/pacman.py", "_modules/yay.py"])
+def test_modules_query_without_forking(relpath, dbpath):
+  run_all = FakeRunAll()
+  module = load_salt_module(
+    relpath,
+    salt={"cmd.run_all": run_all},
+    opts={"pacman.dbpath": str(dbpath)},
+    utils=load_salt_utils("_utils/alpm.py", "_utils/pkgenv.py"),
+  )
+
+  assert module.is_installed("git", runas="builder") is True
+  # provided by git, as pacman -Q resolves it
+  assert module.is_installed("git-core", runas="builder") is True
+  assert module.is_installed("emacs", runas="builder") is False
+  assert module.list_installed(runas="builder") == {"git": "2.47.0-1", "vim": "9.1.0-1"}
+  assert run_all.calls == []
+
+
+def test_local_provides_strip_versions(alpm, dbpath):
+  write_local_pkg(dbpath, "vim-git", "9.2.r1-1", provides=["vim=9.2", "xxd"])
+  os.utime(dbpath / "local", ns=(1, 1))
+
+  provides = alpm.local_provides(str(dbpath))
+  assert provides["git-core"] == ["git"]
+  assert provides["vim"] == ["vim-git"]
+  assert provides["xxd"] == ["vim-git"]
+
+
+def test_provided_targets_count_as_installed(dbpath):
+  write_local_pkg(dbpath, "yay-bin", "12.4.2-1", provides=["yay=12.4.2"])
+  run_all = FakeRunAll()
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={"cmd.run_all": run_all},
+    opts={"pacman.dbpath": str(dbpath)},
+    utils=load_salt_utils("_utils/alpm.py", "_utils/pkgenv.py"),
+  )
+
+  ret = module.installed(pkgs=["yay", "git-core", "vim"])
+  assert ret["result"] is True and ret["changes"] == {}
+  assert module.missing(["yay", "emacs"]) == ["emacs"]
+  assert run_all.calls == []
+
+
+def test_modules_fall_back_to_pacman_without_database(tmp_path):
+  run_all = FakeRunAll(lambda cmd, **kw: (0, "git 2.47.0-1", ""))
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={"cmd.run_all": run_all},
+    opts={"pacman.dbpath": str(tmp_path / "missing")},
+    utils=load_salt_utils("_utils/alpm.py", "_utils/pkgenv.py"),
+  )
+
+  assert module.list_installed() == {"git": "2.47.0-1"}
+  assert run_all.calls == ["pacman -Q"]
+
+
+def test_sync_index_resolves_in_repo_order(alpm, syncdb):
+  index = alpm.sync_index(str(syncdb), repos=["core", "extra"])
+
+  assert index["by_name"]["git"][0] == "core"
+  assert index["provides"]["ssh"] == ["openssh"]
+  assert alpm.sync_search(index, "GIT") == ["git", "git"]
+  assert alpm.sync_search(index, "^web") == ["firefox"]
+
+
+def test_sync_search_terms_like_pacman_ss(alpm, syncdb):
+  index = alpm.sync_index(str(syncdb), repos=["core", "extra"])
+
+  # every term has to match, in the name or the description
+  assert alpm.sync_search(index, "git fast") == ["git"]
+  assert alpm.sync_search(index, ["ssh", "tools"]) == ["openssh"]
+  assert alpm.sync_search(index, "git browser") == []
+  # not a valid regex: matched literally instead of raising re.error
+  assert alpm.sync_search(index, "git(") == []
+  assert alpm.sync_search(index, "*fast") == []
+
+
+def test_sync_index_follows_the_given_pacman_conf(alpm, syncdb, tmp_path):
+  conf = tmp_path / "pacman.conf"
+  conf.write_text("[options]\nArchitecture = auto\n\n[extra]\n[core]\n")
+
+  index = alpm.sync_index(str(syncdb), conf=str(conf))
+  assert index["by_name"]["git"] == ("extra", index["by_name"]["git"][1])
+  assert [repo for repo, _ in index["entries"]][0] == "extra"
+
+  module = load_salt_module(
+    "_modules/pacman.py",
+    opts={
+      "pacman.dbpath": str(syncdb),
+      "pacman.conf": str(conf),
+      "cachedir": str(tmp_path / "cache"),
+    },
+    utils=load_salt_utils("_utils/alpm.py", "_utils/pkgenv.py"),
+  )
+  assert module.info("git")["Version"] == "2.48.0-1"
+
+
+def test_sync_info_matches_pacman_si_keys(alpm, syncdb):
+  index = alpm.sync_index(str(syncdb), repos=["core", "extra"])
+
+  info = alpm.sync_info(index, "openssh")
+  assert info["Repository"] == "core"
+  assert info["Version"] == "9.9p1-1"
+  assert info["Provides"] == "ssh=9.9"
+  assert info["Depends On"] == "None"
+  assert info["Download Size"] == "1.00 MiB"
+  assert alpm.sync_info(index, "extra/git")["Version"] == "2.48.0-1"
+  assert alpm.sync_info(index, "missing") == {}
+
+  many = alpm.sync_info_many(index, ["git", "firefox", "missing"])
+  assert many["firefox"]["Repository"] == "extra"
+  assert many["missing"] == {}
+
+
+def test_sync_index_persists_compact_cache(alpm, syncdb, tmp_path):
+  cachedir = tmp_path / "cache"
+  alpm.sync_index(str(syncdb), str(cachedir), repos=["core", "extra"])
+  assert (cachedir / "core.json").exists()
+
+  fresh = load_salt_module("_utils/alpm.py")
+
+  def _no_tarball(path):
+    raise AssertionError(f"sync db re-read: {path}")
+
+  fresh._read_sync_db = _no_tarball
+  index = fresh.sync_index(str(syncdb), str(cachedir), repos=["core", "extra"])
+
+  assert index["by_name"]["firefox"][0] == "extra"
+
+
+def test_pacman_search_and_info_without_forking(syncdb, tmp_path):
+  run_all = FakeRunAll()
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={"cmd.run_all": run_all},
+    opts={"pacman.dbpath": str(syncdb), "cachedir": str(tmp_path / "cache")},
+    utils=load_salt_utils("_utils/alpm.py", "_utils/pkgenv.py"),
+  )
+
+  assert "firefox" in module.search("browser")
+  assert module.info("firefox")["Version"] == "131.0-1"
+  assert set(module.info_many(["git", "firefox"])) == {"git", "firefox"}
+  assert run_all.calls == []
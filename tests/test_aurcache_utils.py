@@ -0,0 +1,269 @@
+"""
+Unit tests for the AUR build artifact cache (srv/salt/_utils/aurcache.py).
+
+Covers the cache itself, its use by yay's makepkg pipeline (local hits and
+the fleet cache on the master) and the aurcache.collect runner.
+"""
+
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+
+from tests.fixtures.alpm import write_sync_db
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+
+@pytest.fixture
+def aurcache():
+  return load_salt_module("_utils/aurcache.py")
+
+
+def make_pkg(directory, name, size=16):
+  directory.mkdir(parents=True, exist_ok=True)
+  path = directory / f"{name}-1.0-1-x86_64.pkg.tar.zst"
+  path.write_bytes(b"x" * size)
+  return str(path)
+
+
+def test_cache_key_covers_pkgbuild_srcinfo_and_arch(aurcache):
+  key = aurcache.cache_key(b"pkgbuild", b"srcinfo", "x86_64")
+
+  assert key == aurcache.cache_key(b"pkgbuild", b"srcinfo", "x86_64")
+  assert key != aurcache.cache_key(b"pkgbuild", b"srcinfo", "aarch64")
+  assert key != aurcache.cache_key(b"pkgbuild2", b"srcinfo", "x86_64")
+
+
+def test_store_and_lookup(aurcache, tmp_path):
+  built = [make_pkg(tmp_path / "build", "foo"), make_pkg(tmp_path / "build", "foo-doc")]
+  cache = tmp_path / "cache"
+
+  assert aurcache.lookup(str(cache), "k1") is None
+  stored = aurcache.store(str(cache), "k1", built)
+
+  assert set(stored) == {"foo", "foo-doc"}
+  assert aurcache.lookup(str(cache), "k1") == stored
+  assert stored["foo"].startswith(str(cache / "k1"))
+
+
+def test_evict_by_age_then_lru_size(aurcache, tmp_path):
+  cache = tmp_path / "cache"
+  now = time.time()
+  for i, age_days in enumerate([100, 3, 2, 1]):
+    aurcache.store(str(cache), f"k{i}", [make_pkg(tmp_path / f"b{i}", "p", 100)])
+    os.utime(cache / f"k{i}", (now - age_days * 86400,) * 2)
+
+  # each entry is a 100-byte package plus its SHA256SUMS line
+  evicted = aurcache.evict(str(cache), max_bytes=400, max_age_days=30)
+
+  assert evicted == ["k0", "k1"]
+  assert sorted(os.listdir(cache)) == ["k2", "k3"]
+
+
+class FakeAurBuilds:
+  """Simulated git/makepkg that writes real PKGBUILD and package files."""
+
+  def __init__(self):
+    self.builds = []
+
+  def __call__(self, cmd, **kwargs):
+    builddir = (
+      cmd.split("git clone ")[-1].split()[1].rstrip(";") if "clone" in cmd else None
+    )
+    if builddir:
+      os.makedirs(builddir, exist_ok=True)
+      base = os.path.basename(builddir)
+      for name in ("PKGBUILD", ".SRCINFO"):
+        with open(os.path.join(builddir, name), "w") as f:
+          f.write(f"{name} for {base}\n")
+      return 0, "", ""
+    if "makepkg --noconfirm" in cmd:
+      builddir = cmd.split()[1]
+      base = os.path.basename(builddir)
+      self.builds.append(base)
+      with open(os.path.join(builddir, f"{base}-1.0-1-x86_64.pkg.tar.zst"), "wb") as f:
+        f.write(b"pkg")
+      return 0, "", ""
+    if "makepkg --packagelist" in cmd:
+      builddir = cmd.split()[1]
+      base = os.path.basename(builddir)
+      return 0, os.path.join(builddir, f"{base}-1.0-1-x86_64.pkg.tar.zst"), ""
+    return 0, "", ""
+
+
+@pytest.fixture
+def yay(tmp_path):
+  write_sync_db(tmp_path / "db", "extra", [{"name": ["git"], "version": ["1-1"]}])
+  (tmp_path / "db" / "local").mkdir()
+
+  def _load(fleet=False, master=None):
+    builds = FakeAurBuilds()
+    master = master if master is not None else {}
+    pushed = []
+    config = {
+      "aur_build_cache": {
+        "enabled": True,
+        "dir": str(tmp_path / "aur-builds"),
+        "fleet": fleet,
+      }
+    }
+    utils = load_salt_utils(
+      "_utils/alpm.py", "_utils/pkgbatch.py", "_utils/aurcache.py", "_utils/pkgenv.py"
+    )
+    module = load_salt_module(
+      "_modules/yay.py",
+      salt={
+        "cmd.run_all": FakeRunAll(builds),
+        "config.get": lambda key, default=None: config.get(key, default),
+        "cp.list_master": lambda prefix="": [p for p in master if p.startswith(prefix)],
+        "cp.cache_file": lambda url: master.get(url.removeprefix("salt://"), ""),
+        "cp.push": lambda path, upload_path: pushed.append(upload_path) or True,
+      },
+      grains={"cpuarch": "x86_64"},
+      opts={"pacman.dbpath": str(tmp_path / "db"), "cachedir": str(tmp_path)},
+      utils=utils,
+    )
+    module._clean_env = lambda runas: {"HOME": str(tmp_path / "home" / runas)}
+    module._aur_info = lambda names: {
+      n: {"Name": n, "PackageBase": n} for n in names if n.startswith("aur-")
+    }
+    return module, builds, pushed
+
+  return _load
+
+
+def test_yay_reuses_cached_build(yay):
+  module, builds, _ = yay()
+  assert module.installed(pkgs=["aur-foo"], runas="builder")["result"] is True
+  assert builds.builds == ["aur-foo"]
+
+  module, builds, _ = yay()
+  ret = module.installed(pkgs=["aur-foo"], runas="builder")
+
+  assert ret["result"] is True
+  assert builds.builds == []
+
+
+def test_yay_pushes_to_and_pulls_from_fleet_cache(yay, tmp_path):
+  module, builds, pushed = yay(fleet=True)
+  module.installed(pkgs=["aur-foo"], runas="builder")
+
+  assert [os.path.basename(p) for p in pushed] == [
+    "SHA256SUMS",
+    "aur-foo-1.0-1-x86_64.pkg.tar.zst",
+  ]
+  assert all(p.startswith("/aur-cache/x86_64/") for p in pushed)
+
+  # Another host: empty local cache, master serves the pushed file
+  served = make_pkg(tmp_path / "master", "aur-foo")
+  master = {pushed[1].lstrip("/"): served}
+  (tmp_path / "aur-builds").rename(tmp_path / "other-host")
+  module, builds, _ = yay(fleet=True, master=master)
+  ret = module.installed(pkgs=["aur-foo"], runas="builder")
+
+  assert ret["result"] is True
+  assert builds.builds == []
+
+
+def push(aurcache, tmp_path, minion_id, key="abc123"):
+  """A build entry as cp.push leaves it in the master's cachedir."""
+  uploads = tmp_path / "master" / "minions" / minion_id / "files" / "aur-cache"
+  aurcache.store(
+    str(uploads / "x86_64"), key, [make_pkg(tmp_path / "build" / key, "aur-foo")]
+  )
+  return uploads / "x86_64" / key
+
+
+def load_collect(tmp_path, **opts):
+  return load_salt_module(
+    "_runners/aurcache.py",
+    opts={"cachedir": str(tmp_path / "master"), **opts},
+    utils=load_salt_utils("_utils/aurcache.py"),
+  )
+
+
+def test_collect_runner_publishes_pushed_builds(aurcache, tmp_path):
+  upload = push(aurcache, tmp_path, "guava")
+  runner = load_collect(tmp_path, **{"aurcache.builders": ["guava"]})
+
+  ret = runner.collect(dest=str(tmp_path / "fileroot" / "aur-cache"))
+
+  assert ret["published"] == ["x86_64/abc123"]
+  assert ret["rejected"] == []
+  published = tmp_path / "fileroot" / "aur-cache" / "x86_64" / "abc123"
+  assert sorted(os.listdir(published)) == [
+    "SHA256SUMS",
+    "aur-foo-1.0-1-x86_64.pkg.tar.zst",
+  ]
+  assert not upload.exists()
+
+
+def test_collect_refuses_unlisted_and_tampered_uploads(aurcache, tmp_path):
+  stranger = push(aurcache, tmp_path, "papaya", "k1")
+  tampered = push(aurcache, tmp_path, "builder-1", "k2")
+  (tampered / "aur-foo-1.0-1-x86_64.pkg.tar.zst").write_bytes(b"evil")
+  extra = push(aurcache, tmp_path, "builder-1", "k3")
+  (extra / ".INSTALL").write_text("rm -rf /")
+  unlisted = push(aurcache, tmp_path, "builder-2", "k4")
+  (unlisted / "SHA256SUMS").write_text("")
+  runner = load_collect(tmp_path, **{"aurcache.builders": ["builder-*"]})
+
+  dest = tmp_path / "fileroot" / "aur-cache"
+  ret = runner.collect(dest=str(dest))
+
+  assert ret["published"] == []
+  assert sorted(ret["rejected"]) == [
+    "builder-1: x86_64/k2: aur-foo-1.0-1-x86_64.pkg.tar.zst does not match SHA256SUMS",
+    "builder-1: x86_64/k3: unexpected file .INSTALL",
+    "builder-2: x86_64/k4: aur-foo-1.0-1-x86_64.pkg.tar.zst does not match SHA256SUMS",
+    "papaya: x86_64/k1: not in aurcache.builders",
+  ]
+  assert not dest.exists() or not list(dest.rglob("*.pkg.tar*"))
+  assert not any(p.exists() for p in (stranger, tampered, extra, unlisted))
+
+
+def test_collect_without_builders_publishes_nothing(aurcache, tmp_path):
+  push(aurcache, tmp_path, "guava")
+
+  ret = load_collect(tmp_path).collect(dest=str(tmp_path / "fileroot"))
+
+  assert ret["published"] == []
+  assert ret["rejected"] == ["guava: x86_64/abc123: not in aurcache.builders"]
+
+
+@pytest.fixture(scope="module")
+def signing_key(tmp_path_factory):
+  """A throwaway GnuPG home with one key, and its exported public keyring."""
+  if shutil.which("gpg") is None or shutil.which("gpgv") is None:
+    pytest.skip("gpg/gpgv not installed")
+  home = tmp_path_factory.mktemp("gnupg")
+  gpg = ["gpg", "--homedir", str(home), "--batch", "--pinentry-mode", "loopback"]
+  subprocess.run(
+    gpg + ["--passphrase", "", "--quick-gen-key", "builder@cozy", "ed25519"],
+    check=True,
+    capture_output=True,
+  )
+  keyring = home / "builders.gpg"
+  subprocess.run(gpg + ["--output", str(keyring), "--export"], check=True)
+  return gpg, str(keyring)
+
+
+def test_collect_checks_signatures_with_a_keyring(aurcache, tmp_path, signing_key):
+  gpg, keyring = signing_key
+  signed = push(aurcache, tmp_path, "guava", "k1")
+  package = signed / "aur-foo-1.0-1-x86_64.pkg.tar.zst"
+  subprocess.run(gpg + ["--detach-sign", str(package)], check=True)
+  push(aurcache, tmp_path, "guava", "k2")
+  runner = load_collect(
+    tmp_path, **{"aurcache.builders": ["guava"], "aurcache.keyring": keyring}
+  )
+
+  ret = runner.collect(dest=str(tmp_path / "fileroot"))
+
+  assert ret["published"] == ["x86_64/k1"]
+  assert ret["rejected"] == [
+    "guava: x86_64/k2: aur-foo-1.0-1-x86_64.pkg.tar.zst: bad or missing signature"
+  ]
+  assert (tmp_path / "fileroot" / "x86_64" / "k1" / (package.name + ".sig")).exists()
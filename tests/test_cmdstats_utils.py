@@ -0,0 +1,107 @@
+"""
+Unit tests for pacman/yay command instrumentation (srv/salt/_utils/cmdstats.py).
+"""
+
+import pytest
+
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+
+@pytest.fixture
+def cmdstats():
+  return load_salt_module("_utils/cmdstats.py")
+
+
+@pytest.mark.parametrize(
+  "cmd, cls",
+  [
+    ("pacman -Q git", "query"),
+    ("pacman -Qu", "query"),
+    ("yay -Ss firefox", "query"),
+    ("pacman -Si git", "query"),
+    ("pacman -S --needed --noconfirm git vim", "install"),
+    ("pacman -Sy --needed --noconfirm git", "install"),
+    ("yay -U --needed --noconfirm /tmp/a.pkg.tar.zst", "install"),
+    ("pacman -R --noconfirm git", "remove"),
+    ("pacman -Syu --noconfirm", "upgrade"),
+    ("yay -Su --noconfirm", "upgrade"),
+    ("pacman -Sy --noconfirm", "sync"),
+    ("cd /home/b/.cache/yay/foo && makepkg --noconfirm", "build"),
+    ("test -d /b/foo/.git && git -C /b/foo pull || git clone /aur/foo /b/foo", "build"),
+    ("pacman --version", "other"),
+  ],
+)
+def test_classify(cmdstats, cmd, cls):
+  assert cmdstats.classify(cmd) == cls
+
+
+def test_summarize_percentiles_and_bytes(cmdstats):
+  calls = []
+  for i in range(1, 11):
+    cmdstats.record(calls, "pacman -Q x", {"retcode": 0, "stdout": "é" * i}, i / 10)
+  cmdstats.record(calls, "pacman -S x", {"retcode": 1, "stderr": "boom"}, 5.0)
+
+  summary = cmdstats.summarize(calls)
+
+  assert summary["seq"] == 11 and summary["calls"] == 11
+  query = summary["classes"]["query"]
+  assert (query["count"], query["failed"]) == (10, 0)
+  assert (query["p50_s"], query["p90_s"], query["p99_s"]) == (0.5, 0.9, 1.0)
+  assert query["stdout_bytes"] == 2 * 55
+  assert summary["classes"]["install"]["failed"] == 1
+  assert summary["classes"]["install"]["stderr_bytes"] == 4
+
+  assert cmdstats.summarize(calls, since=10)["classes"].keys() == {"install"}
+
+
+def test_record_is_bounded(cmdstats, monkeypatch):
+  monkeypatch.setattr(cmdstats, "MAX_CALLS", 3)
+  calls = []
+  for _ in range(5):
+    cmdstats.record(calls, "pacman -Q", {"retcode": 0}, 0.1)
+
+  assert [c["seq"] for c in calls] == [3, 4, 5]
+
+
+def test_state_return_carries_its_commands(tmp_path):
+  context = {}
+  installed = set()
+
+  def _pacman(cmd, **kw):
+    argv = cmd.split()
+    names = [a for a in argv[2:] if not a.startswith("-")]
+    if argv[1] == "-Q":
+      return 0, "\n".join(f"{n} 1.0-1" for n in sorted(installed)), ""
+    if argv[1] == "-T":
+      missing = [n for n in names if n not in installed]
+      return (127 if missing else 0), "\n".join(missing), ""
+    installed.update(names)
+    return 0, "", ""
+
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={"cmd.run_all": FakeRunAll(_pacman)},
+    opts={"pacman.dbpath": str(tmp_path / "no-db"), "pacman.prefetch_jobs": 0},
+    context=context,
+    utils=load_salt_utils("_utils/pkgenv.py", "_utils/cmdstats.py"),
+  )
+  module.is_installed("git")
+  state = load_salt_module(
+    "_states/pacman.py",
+    salt={
+      "pacman.list_installed": module.list_installed,
+      "pacman.missing": module.missing,
+      "pacman.installed": module.installed,
+      "pacman.stats": module.stats,
+    },
+    opts={"test": False},
+  )
+
+  ret = state.installed(pkgs=["git", "vim"])
+
+  # the earlier is_installed probe belongs to no state
+  # -Q snapshot, one -T for both checks, -S, -Q after the transaction
+  assert ret["stats"]["calls"] == 4
+  assert ret["stats"]["classes"]["query"]["count"] == 3
+  assert ret["stats"]["classes"]["install"]["count"] == 1
+  assert module.stats()["calls"] == 5
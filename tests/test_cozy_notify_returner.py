@@ -0,0 +1,279 @@
+"""
+Unit tests for the cozy_notify returner: queueing, coalescing, rate
+limiting, bus discovery and D-Bus delivery against a fake session bus.
+"""
+
+import os
+import queue
+import socket
+import threading
+import time
+
+import pytest
+
+from tests.fixtures.dbus import FakeSessionBus
+from tests.lib.salt_modules import load_salt_module
+
+
+def highstate(minion_id="guava", success=True, failed=0, changed=1, **extra):
+  states = {}
+  for n in range(changed):
+    states[f"file_|-changed{n}_|-/tmp/c{n}_|-managed"] = {
+      "result": True,
+      "changes": {"diff": "..."},
+    }
+  for n in range(failed):
+    states[f"pkg_|-failed{n}_|-vim_|-installed"] = {"result": False, "changes": {}}
+  return {
+    "id": minion_id,
+    "fun": "state.highstate",
+    "fun_args": [],
+    "jid": "20261018084500123456",
+    "success": success,
+    "return": states,
+    **extra,
+  }
+
+
+def load(tmp_path, window=0, min_interval=0):
+  # the worker thread runs without the job's loader context, as on a minion
+  module = load_salt_module(
+    "_returners/cozy_notify.py",
+    loader_context=True,
+    opts={
+      "cachedir": str(tmp_path / "cache"),
+      "cozy_notify.window": window,
+      "cozy_notify.min_interval": min_interval,
+    },
+  )
+  module.IDLE_TIMEOUT = 0.05
+  module.RUN_USER = str(tmp_path / "run")
+  os.makedirs(module.RUN_USER, exist_ok=True)
+  return module
+
+
+@pytest.fixture
+def notify(tmp_path):
+  return load(tmp_path)
+
+
+class FakeNotifier:
+  """Records toasts in place of desktop delivery."""
+
+  def __init__(self, *modules):
+    self.toasts = []
+    for module in modules:
+      module._deliver = self.deliver
+
+  def deliver(self, title, body, success):
+    self.toasts.append((time.monotonic(), title, body, success))
+
+  def shown(self):
+    return [toast[1:] for toast in self.toasts]
+
+
+def drain(*modules):
+  for module in modules:
+    thread = module._worker_thread
+    if thread is not None:
+      thread.join(5)
+
+
+def listen(path):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.bind(path)
+  return sock
+
+
+def test_returner_only_queues(notify):
+  delivered = []
+
+  def slow(title, body, success):
+    time.sleep(0.02)
+    delivered.append((title, body, success))
+
+  notify._deliver = slow
+  timings = []
+  for n in range(20):
+    start = time.perf_counter()
+    notify.returner(highstate(f"m{n}"))
+    timings.append(time.perf_counter() - start)
+
+  assert sorted(timings)[len(timings) // 2] < 0.001
+  drain(notify)
+  assert [d[0] for d in delivered] == [f"Salt OK — m{n}" for n in range(20)]
+  assert notify._worker_thread is None
+
+
+def test_unwatched_functions_are_ignored(notify):
+  notify._deliver = lambda *toast: pytest.fail("delivered")
+  notify.returner({"fun": "test.ping", "id": "guava", "return": True})
+  assert notify._worker_thread is None
+
+
+def test_full_queue_drops_instead_of_blocking(notify):
+  notify._queue = queue.Queue(maxsize=2)
+  busy, release, delivered = threading.Event(), threading.Event(), []
+
+  def blocked(title, body, success):
+    busy.set()
+    release.wait(5)
+    delivered.append(title)
+
+  notify._deliver = blocked
+  notify.returner(highstate("first"))
+  assert busy.wait(5)
+  for n in range(4):
+    notify.returner(highstate(f"m{n}"))
+  release.set()
+  drain(notify)
+
+  assert delivered == ["Salt OK — first", "Salt OK — m0", "Salt OK — m1"]
+
+
+def test_session_buses_are_scanned_and_cached(notify):
+  run = notify.RUN_USER
+  buses = [listen(f"{run}/1000/bus"), listen(f"{run}/120/bus")]
+  os.makedirs(f"{run}/1001")
+  open(f"{run}/1001/bus", "w").close()
+  os.makedirs(f"{run}/gdm")
+
+  assert notify._session_buses() == [f"{run}/1000/bus"]
+  buses.append(listen(f"{run}/1002/bus"))
+  assert notify._session_buses() == [f"{run}/1000/bus"]
+  notify._buses["at"] = None
+  assert notify._session_buses() == [f"{run}/1000/bus", f"{run}/1002/bus"]
+  for sock in buses:
+    sock.close()
+
+
+def test_notifications_go_over_dbus(notify):
+  os.makedirs(f"{notify.RUN_USER}/1000")
+  bus = FakeSessionBus(f"{notify.RUN_USER}/1000/bus")
+  try:
+    notify.returner(highstate(success=False, failed=1))
+    drain(notify)
+  finally:
+    bus.stop()
+
+  assert bus.auth == ["AUTH EXTERNAL " + str(os.geteuid()).encode().hex()]
+  assert [member for member, _ in bus.calls] == ["Hello", "Notify"]
+  app, replaces, icon, title, body, actions, hints, timeout = bus.notifications()[0]
+  assert (app, replaces, actions, timeout) == ("Salt", 0, [], -1)
+  assert title == "Salt FAILED — guava"
+  assert body == "highstate — 1 changed, 1 failed"
+  assert hints == {"urgency": 2}
+
+
+def test_dead_bus_is_skipped_and_rescanned(notify):
+  run = notify.RUN_USER
+  dead = listen(f"{run}/1000/bus")
+  dead.close()
+  os.makedirs(f"{run}/1001")
+  bus = FakeSessionBus(f"{run}/1001/bus")
+  try:
+    notify.returner(highstate())
+    drain(notify)
+  finally:
+    bus.stop()
+
+  assert len(bus.notifications()) == 1
+  assert notify._buses["at"] is None
+
+
+def orch_run(n, failed=False, orch="20261018090000000001"):
+  return highstate(
+    success=not failed,
+    failed=int(failed),
+    fun="state.sls",
+    fun_args=[f"linux.step{n}", {"orchestration_jid": orch}],
+    jid=f"2026101809000{n:07d}",
+  )
+
+
+def test_orchestration_burst_is_one_toast(tmp_path):
+  notify = load(tmp_path, window=0.3)
+  notifier = FakeNotifier(notify)
+
+  for n in range(12):
+    notify.returner(orch_run(n, failed=n in (2, 5, 9)))
+  drain(notify)
+
+  assert notifier.shown() == [("Salt FAILED — guava", "12 runs, 3 failed", False)]
+  assert not list((tmp_path / "cache" / "cozy_notify").glob("*.pending"))
+
+
+def test_job_processes_share_the_spool(tmp_path):
+  # each return runs in its own job process with its own module state
+  processes = [load(tmp_path, window=0.3) for _ in range(4)]
+  notifier = FakeNotifier(*processes)
+
+  for n, process in enumerate(processes):
+    process.returner(orch_run(n))
+  drain(*processes)
+
+  assert notifier.shown() == [("Salt OK — guava", "4 runs, 0 failed", True)]
+
+
+def test_families_are_kept_apart(tmp_path):
+  notify = load(tmp_path, window=0.2)
+  notifier = FakeNotifier(notify)
+
+  notify.returner(orch_run(1, orch="20261018090000000001"))
+  notify.returner(orch_run(2, orch="20261018090000000002"))
+  notify.returner(highstate(jid="20261018091500000000", schedule="highstate"))
+  notify.returner(highstate(jid="20261018093000000000", schedule="highstate"))
+  drain(notify)
+
+  assert sorted(notifier.shown()) == [
+    ("Salt OK — guava", "2 runs, 0 failed", True),
+    ("Salt OK — guava", "linux.step1 — 1 changed, 0 failed", True),
+    ("Salt OK — guava", "linux.step2 — 1 changed, 0 failed", True),
+  ]
+
+
+def test_rate_limit_defers_and_merges(tmp_path):
+  notify = load(tmp_path, min_interval=0.4)
+  notifier = FakeNotifier(notify)
+
+  start = time.monotonic()
+  notify.returner(highstate(jid="1"))
+  drain(notify)
+  # sooner than min_interval: held back, then shown together
+  late = [load(tmp_path, min_interval=0.4) for _ in range(3)]
+  for n, process in enumerate(late):
+    process._deliver = notifier.deliver
+    process.returner(highstate(jid="2", failed=int(n == 0), success=n != 0))
+  drain(*late)
+
+  assert [t[2] for t in notifier.toasts] == [
+    "highstate — 1 changed, 0 failed",
+    "3 runs, 1 failed",
+  ]
+  first, second = (t[0] - start for t in notifier.toasts)
+  assert first < 0.2 and second >= 0.35
+
+
+def test_last_notified_survives_restart(tmp_path):
+  before = load(tmp_path, min_interval=0.4)
+  notifier = FakeNotifier(before)
+  before.returner(highstate(jid="1"))
+  drain(before)
+
+  marker = tmp_path / "cache" / "cozy_notify" / "last" / "guava"
+  assert abs(float(marker.read_text()) - time.time()) < 1
+
+  restarted = load(tmp_path, min_interval=0.4)
+  restarted._deliver = notifier.deliver
+  restarted.returner(highstate(jid="2"))
+  drain(restarted)
+  assert notifier.toasts[1][0] - notifier.toasts[0][0] >= 0.35
+
+
+def test_kwargs_are_not_the_sls_name(notify):
+  notifier = FakeNotifier(notify)
+  notify.returner(highstate(fun_args=[{"pillar": {"x": 1}}]))
+  drain(notify)
+
+  assert notifier.shown()[0][1] == "highstate — 1 changed, 0 failed"
@@ -0,0 +1,366 @@
+"""
+Unit tests for the github_release execution module against a local GitHub
+API stand-in.
+"""
+
+import json
+import time
+
+import pytest
+
+from tests.fixtures.github import FakeGitHub
+from tests.lib.salt_modules import (
+  SALT_ROOT,
+  load_http_module,
+  load_salt_module,
+  load_salt_utils,
+)
+
+GOOD = "ghp_good"
+
+
+@pytest.fixture
+def github(serve):
+  return serve(
+    FakeGitHub,
+    tokens={
+      GOOD: (200, 0.3),
+      "ghp_expired1": (401, 0.3),
+      "ghp_expired2": (401, 0.3),
+      "ghp_expired3": (401, 0.3),
+    },
+    releases={"ipfs/kubo": [{"tag_name": "v0.40.0"}]},
+  )
+
+
+@pytest.fixture
+def load(github, tmp_path):
+  def _load(tokens, published=None):
+    pillar = {"github:tokens": tokens, "users": {}}
+    for flag, tags in (published or {}).items():
+      pillar[f"github_releases:{flag}"] = tags
+    return load_http_module(
+      "_modules/github_release.py",
+      github,
+      tmp_path,
+      # token checks and REST lookups run on pool threads, as on a minion
+      loader_context=True,
+      salt={"pillar.get": lambda key, default=None: pillar.get(key, default)},
+      opts={"github_release.api_url": github.url},
+    )
+
+  return _load
+
+
+def wait_for_cache(tmp_path, count):
+  path = tmp_path / "github_release" / "tokens.json"
+  for _ in range(100):
+    if path.exists() and len(json.loads(path.read_text())) == count:
+      return json.loads(path.read_text())
+    time.sleep(0.05)
+  raise AssertionError(f"token cache never reached {count} entries")
+
+
+def test_candidates_are_checked_concurrently(load, github, tmp_path):
+  module = load(["ghp_expired1", "ghp_expired2", "ghp_expired3", GOOD])
+
+  start = time.monotonic()
+  assert module.find_valid_token() == GOOD
+  # serially this is 4 x 0.3s
+  assert time.monotonic() - start < 0.9
+  assert module.find_valid_token() == GOOD
+  assert len(github.paths("/user")) == 4
+
+  entries = wait_for_cache(tmp_path, 4)
+  assert sorted(e["valid"] for e in entries.values()) == [False, False, False, True]
+  assert GOOD not in (tmp_path / "github_release" / "tokens.json").read_text()
+
+
+def test_cache_survives_processes_with_negative_entries(load, github, tmp_path):
+  load(["ghp_expired1", GOOD]).find_valid_token()
+  wait_for_cache(tmp_path, 2)
+  github.requests.clear()
+
+  # a fresh process: the good token is trusted, nothing is re-checked
+  assert load(["ghp_expired1", GOOD]).find_valid_token() == GOOD
+  assert github.paths("/user") == []
+
+  # only rejected tokens left: skipped until the negative TTL runs out
+  assert load(["ghp_expired1"]).find_valid_token() == ""
+  assert github.paths("/user") == []
+
+
+def test_expired_cache_entries_are_rechecked(load, github, tmp_path):
+  load([GOOD]).find_valid_token()
+  entries = wait_for_cache(tmp_path, 1)
+  for entry in entries.values():
+    entry["checked"] -= 7200
+  (tmp_path / "github_release" / "tokens.json").write_text(json.dumps(entries))
+  github.requests.clear()
+
+  assert load([GOOD]).find_valid_token() == GOOD
+  assert len(github.paths("/user")) == 1
+
+
+def test_rate_limited_403_is_not_a_verdict(load, github, tmp_path):
+  github.tokens["ghp_limited"] = (403, 0, {"X-RateLimit-Remaining": "0"})
+  github.tokens["ghp_throttled"] = (403, 0, {"Retry-After": "60"})
+  github.tokens["ghp_noaccess"] = (403, 0, {"X-RateLimit-Remaining": "4999"})
+
+  assert load(["ghp_limited", "ghp_throttled", "ghp_noaccess"]).find_valid_token() == ""
+  entries = wait_for_cache(tmp_path, 1)
+  assert list(entries.values())[0]["valid"] is False
+
+  # once the limit resets, the same tokens are checked again and accepted
+  github.tokens["ghp_limited"] = (200, 0)
+  github.requests.clear()
+  assert load(["ghp_limited", "ghp_noaccess"]).find_valid_token() == "ghp_limited"
+  assert len(github.paths("/user")) == 1
+
+
+def test_network_errors_are_not_cached(tmp_path):
+  module = load_http_module(
+    "_modules/github_release.py",
+    cachedir=tmp_path,
+    salt={
+      "pillar.get": lambda key, default=None: (
+        [GOOD] if key == "github:tokens" else default
+      )
+    },
+    opts={"github_release.api_url": "http://127.0.0.1:9"},
+  )
+
+  assert module.find_valid_token() == ""
+  assert not (tmp_path / "github_release" / "tokens.json").exists()
+
+
+def test_unreachable_api_is_tried_once(tmp_path):
+  utils = load_salt_utils("_utils/httpclient.py")
+  module = load_http_module(
+    "_modules/github_release.py",
+    cachedir=tmp_path,
+    salt={"pillar.get": lambda key, default=None: default},
+    opts={"github_release.api_url": "http://127.0.0.1:9"},
+    utils=utils,
+  )
+
+  assert module.latest("ipfs/kubo", fallback="v0.1.0") == "v0.1.0"
+  stats = utils["httpclient.metrics"]("127.0.0.1:9")
+  assert stats["errors"] == 1 and stats["retries"] == 0
+  utils["httpclient.close"]()
+
+
+def test_latest_uses_api_url(load):
+  assert load([]).latest("ipfs/kubo") == "v0.40.0"
+
+
+def release_cache(tmp_path):
+  return json.loads((tmp_path / "github_release" / "releases.json").read_text())
+
+
+def age_release_cache(tmp_path, seconds):
+  entries = release_cache(tmp_path)
+  for entry in entries.values():
+    entry["fetched"] -= seconds
+  (tmp_path / "github_release" / "releases.json").write_text(json.dumps(entries))
+
+
+def test_latest_serves_fresh_cache_without_network(load, github, tmp_path):
+  assert load([]).latest("ipfs/kubo") == "v0.40.0"
+  github.requests.clear()
+
+  assert load([]).latest("ipfs/kubo") == "v0.40.0"
+  assert github.requests == []
+  assert release_cache(tmp_path)["ipfs/kubo|stable"]["etag"]
+
+
+def test_latest_revalidates_with_etag(load, github, tmp_path):
+  load([]).latest("ipfs/kubo")
+  age_release_cache(tmp_path, 3600)
+  github.headers.clear()
+
+  assert load([]).latest("ipfs/kubo") == "v0.40.0"
+  assert (
+    github.headers[-1]["If-None-Match"]
+    == release_cache(tmp_path)["ipfs/kubo|stable"]["etag"]
+  )
+  assert github.headers[-1]["If-Modified-Since"] == "Sat, 17 Oct 2026 12:00:00 GMT"
+
+  # a new release changes the ETag and replaces the cached tag
+  github.releases["ipfs/kubo"].insert(0, {"tag_name": "v0.41.0"})
+  age_release_cache(tmp_path, 3600)
+  assert load([]).latest("ipfs/kubo") == "v0.41.0"
+
+
+def test_latest_keys_on_prerelease_flag(load, github):
+  github.releases["ipfs/kubo"].insert(
+    0, {"tag_name": "v0.41.0-rc1", "prerelease": True}
+  )
+  module = load([])
+
+  assert module.latest("ipfs/kubo") == "v0.40.0"
+  assert module.latest("ipfs/kubo", prerelease=True) == "v0.41.0-rc1"
+
+
+def test_latest_prefers_stale_tag_over_fallback(load, github, tmp_path):
+  load([]).latest("ipfs/kubo")
+  age_release_cache(tmp_path, 3600)
+  github.stop()
+
+  assert load([]).latest("ipfs/kubo", fallback="v0.1.0") == "v0.40.0"
+  assert load([]).latest("nvm-sh/nvm", fallback="v0.1.0") == "v0.1.0"
+
+
+def test_latest_many_batches_into_one_graphql_query(load, github):
+  github.releases["nvm-sh/nvm"] = [{"tag_name": "v0.40.3"}]
+  module = load([GOOD])
+
+  assert module.latest_many(["ipfs/kubo", "nvm-sh/nvm", "ipfs/kubo"]) == {
+    "ipfs/kubo": "v0.40.0",
+    "nvm-sh/nvm": "v0.40.3",
+  }
+  assert len(github.paths("/graphql")) == 1
+  assert github.paths("/repos/ipfs/kubo/releases") == []
+
+  # rendering afterwards is answered from the memo
+  github.requests.clear()
+  assert module.latest("nvm-sh/nvm") == "v0.40.3"
+  assert github.requests == []
+
+
+def test_latest_many_prerelease_query(load, github):
+  github.releases["ipfs/kubo"].insert(
+    0, {"tag_name": "v0.41.0-rc1", "prerelease": True}
+  )
+  module = load([GOOD])
+
+  assert module.latest_many(["ipfs/kubo"], prerelease=True) == {
+    "ipfs/kubo": "v0.41.0-rc1"
+  }
+  assert module.latest_many(["ipfs/kubo"]) == {"ipfs/kubo": "v0.40.0"}
+
+
+def test_latest_many_falls_back_to_rest_without_token(load, github, tmp_path):
+  github.releases["nvm-sh/nvm"] = [{"tag_name": "v0.40.3"}]
+  module = load([])
+
+  assert module.latest_many(["ipfs/kubo", "nvm-sh/nvm", "gone/away"]) == {
+    "ipfs/kubo": "v0.40.0",
+    "nvm-sh/nvm": "v0.40.3",
+    "gone/away": None,
+  }
+  assert github.paths("/graphql") == []
+  assert set(release_cache(tmp_path)) == {"ipfs/kubo|stable", "nvm-sh/nvm|stable"}
+
+  # a fresh process finds both in the disk cache
+  github.requests.clear()
+  assert load([]).latest_many(["ipfs/kubo", "nvm-sh/nvm"])["nvm-sh/nvm"] == "v0.40.3"
+  assert github.requests == []
+
+
+def test_runner_finds_referenced_repos(tmp_path):
+  (tmp_path / "linux").mkdir()
+  (tmp_path / "linux" / "a.sls").write_text(
+    "{%- set v = salt['github_release.latest']('ipfs/kubo', fallback='v1', "
+    "prerelease=True) %}\n"
+    "{%- set n = salt['github_release.latest']('nvm-sh/nvm') %}\n"
+  )
+  (tmp_path / "b.sls").write_text(
+    '{%- set m = salt["github_release.latest"]("conda-forge/miniforge", '
+    'fallback="26.3.2-3") %}\n'
+  )
+  runner = load_salt_module(
+    "_runners/releases.py", opts={"file_roots": {"base": [str(tmp_path)]}}
+  )
+
+  assert runner.referenced() == {
+    "stable": ["conda-forge/miniforge", "nvm-sh/nvm"],
+    "prerelease": ["ipfs/kubo"],
+  }
+
+
+def test_runner_covers_the_real_tree():
+  runner = load_salt_module(
+    "_runners/releases.py", opts={"file_roots": {"base": [str(SALT_ROOT)]}}
+  )
+
+  repos = runner.referenced()
+  assert "Nonary/vibeshine" in repos["prerelease"]
+  assert "coreybutler/nvm-windows" in repos["stable"]
+
+
+def test_latest_prefers_master_published_tags(load, github):
+  module = load([], published={"prerelease": {"ipfs/kubo": "v0.42.0-rc2"}})
+
+  assert module.latest("ipfs/kubo", prerelease=True) == "v0.42.0-rc2"
+  assert module.latest_many(["ipfs/kubo"], prerelease=True) == {
+    "ipfs/kubo": "v0.42.0-rc2"
+  }
+  assert github.requests == []
+  # not published for this flag: resolved as before
+  assert module.latest("ipfs/kubo") == "v0.40.0"
+
+
+def test_runner_resolves_and_publishes_tags(github, tmp_path):
+  tree = tmp_path / "tree"
+  tree.mkdir()
+  (tree / "a.sls").write_text(
+    "{%- set v = salt['github_release.latest']('ipfs/kubo', prerelease=True) %}\n"
+    "{%- set n = salt['github_release.latest']('nvm-sh/nvm') %}\n"
+  )
+  github.releases["nvm-sh/nvm"] = [{"tag_name": "v0.40.3"}]
+  runner = load_http_module(
+    "_runners/releases.py",
+    github,
+    opts={"file_roots": {"base": [str(tree)]}, "github_release.api_url": github.url},
+  )
+  data_dir = tmp_path / "releases"
+
+  ret = runner.resolve(str(data_dir))
+  assert ret["changed"] and ret["failed"] == []
+  tags = json.loads((data_dir / "tags.json").read_text())
+  assert tags["stable"] == {"nvm-sh/nvm": "v0.40.3"}
+  assert tags["prerelease"] == {"ipfs/kubo": "v0.40.0"}
+
+  # next run revalidates with the stored ETags and leaves the file alone
+  github.headers.clear()
+  assert runner.resolve(str(data_dir))["changed"] is False
+  assert all("If-None-Match" in headers for headers in github.headers)
+
+  # GitHub unreachable: the published tags are kept
+  github.stop()
+  ret = runner.resolve(str(data_dir))
+  assert ret["failed"] == ["ipfs/kubo", "nvm-sh/nvm"]
+  assert ret["changed"] is False
+  assert ret["stable"] == {"nvm-sh/nvm": "v0.40.3"}
+
+
+def test_lookups_share_one_tls_connection(serve, tmp_path):
+  github = serve(
+    FakeGitHub,
+    tokens={GOOD: (200, 0)},
+    releases={"ipfs/kubo": [{"tag_name": "v0.40.0"}], "nvm-sh/nvm": []},
+    tls=True,
+  )
+  utils = load_salt_utils("_utils/httpclient.py")
+  module = load_http_module(
+    "_modules/github_release.py",
+    github,
+    tmp_path,
+    salt={
+      "pillar.get": lambda key, default=None: (
+        [GOOD] if key == "github:tokens" else default
+      )
+    },
+    opts={"github_release.api_url": github.url},
+    utils=utils,
+  )
+
+  assert module.latest("ipfs/kubo") == "v0.40.0"
+  assert module.latest("nvm-sh/nvm", fallback="v0.1.0") == "v0.1.0"
+  assert module.latest("ipfs/kubo", prerelease=True) == "v0.40.0"
+  # /user + three release lookups over one handshake
+  assert len(github.requests) == 4
+  assert github.connections == 1
+  host = github.url.removeprefix("https://")
+  assert utils["httpclient.metrics"](host)["reused"] == 3
@@ -0,0 +1,265 @@
+"""
+Unit tests for the headscale execution module's node inventory against a
+fake headscale API.
+"""
+
+import json
+import socket
+import time
+
+import pytest
+
+from tests.fixtures.headscale import FakeHeadscale, node
+from tests.lib.salt_modules import load_http_module, load_salt_utils
+
+
+@pytest.fixture
+def api(serve):
+  return serve(
+    FakeHeadscale,
+    [
+      node(
+        "papaya-1a2b",
+        ["100.64.0.2", "fd7a::2"],
+        tags=["tag:distcc"],
+        given_name="papaya",
+      ),
+      node("guava", ["100.64.0.3", "fd7a::3"], tags=["tag:distcc", "tag:server"]),
+      node("kiwi", ["100.64.0.4"], online=False, tags=["tag:distcc"]),
+    ],
+  )
+
+
+@pytest.fixture
+def load(api, tmp_path):
+  def _load(salt=None, **opts):
+    return load_http_module(
+      "_modules/headscale.py",
+      api,
+      tmp_path,
+      salt=salt or {},
+      pillar={"headscale": {"login-server": api.url, "api-key": api.api_key}},
+      opts=opts,
+    )
+
+  return _load
+
+
+def test_one_fetch_per_run(load, api):
+  headscale = load()
+
+  assert headscale.get_node_ip("papaya") == "100.64.0.2"
+  assert headscale.get_node_ip("papaya-1a2b", ipv6=True) == "fd7a::2"
+  assert headscale.node_map() == {
+    "papaya": "100.64.0.2",
+    "guava": "100.64.0.3",
+    "kiwi": "100.64.0.4",
+  }
+  assert [n["name"] for n in headscale.get_online_nodes()] == ["papaya-1a2b", "guava"]
+  assert headscale.get_distcc_hosts() == "papaya guava"
+  assert headscale.get_distcc_hosts(online_only=False) == "papaya guava kiwi"
+  assert [n["name"] for n in headscale.get_nodes_by_tag("server")] == ["guava"]
+  assert api.node_requests() == 1
+
+
+def test_lookup_by_name_or_ip(load):
+  headscale = load()
+
+  assert headscale.get_node("100.64.0.3")["name"] == "guava"
+  assert headscale.get_node("fd7a::2")["givenName"] == "papaya"
+  assert headscale.get_node("papaya-1a2b")["givenName"] == "papaya"
+  assert headscale.get_node("mango") is None
+  assert headscale.get_node_ip("mango") is None
+  assert headscale.get_node_ip("kiwi", ipv6=True) is None
+
+
+def test_refresh_bypasses_the_cache(load, api):
+  headscale = load()
+  headscale.get_nodes()
+  api.nodes.append(node("mango", ["100.64.0.5"]))
+
+  assert headscale.get_node_ip("mango") is None
+  assert headscale.get_node_ip("mango", refresh=True) == "100.64.0.5"
+  # the refreshed list is what later lookups see
+  assert headscale.get_node_ip("mango") == "100.64.0.5"
+  assert api.node_requests() == 2
+
+
+def test_disk_cache_spans_runs(load, api, tmp_path):
+  load().get_nodes()
+  cache = tmp_path / "headscale" / "nodes.json"
+  assert cache.stat().st_mode & 0o777 == 0o600
+
+  # a new run within the TTL doesn't ask the API
+  assert load().get_distcc_hosts() == "papaya guava"
+  assert api.node_requests() == 1
+
+  # past the TTL it does
+  data = json.loads(cache.read_text())
+  data["fetched"] -= 3600
+  cache.write_text(json.dumps(data))
+  load().get_nodes()
+  assert api.node_requests() == 2
+
+
+def test_disk_cache_can_be_disabled(load, api, tmp_path):
+  load(**{"headscale.cache_ttl": 0}).get_nodes()
+  load(**{"headscale.cache_ttl": 0}).get_nodes()
+
+  assert api.node_requests() == 2
+  assert not (tmp_path / "headscale").exists()
+
+
+def test_api_failure_uses_stale_copy_once(load, api, tmp_path):
+  load().get_nodes()
+  cache = tmp_path / "headscale" / "nodes.json"
+  data = json.loads(cache.read_text())
+  data["fetched"] -= 3600
+  cache.write_text(json.dumps(data))
+  api.api_key = "rotated"
+
+  headscale = load()
+  assert headscale.get_node_ip("guava") == "100.64.0.3"
+  assert headscale.get_distcc_hosts() == "papaya guava"
+  # the failed fetch isn't repeated for every lookup in the run
+  assert api.node_requests() == 2
+
+
+def test_no_login_server_means_no_nodes(tmp_path):
+  headscale = load_http_module("_modules/headscale.py", cachedir=tmp_path)
+
+  assert headscale.get_nodes() == []
+  assert headscale.get_distcc_hosts() == ""
+
+
+@pytest.fixture
+def distccd():
+  """Listeners on 127.0.0.2 and 127.0.0.3 sharing one port (127.0.0.4: none)."""
+  listeners = [socket.socket()]
+  listeners[0].bind(("127.0.0.2", 0))
+  port = listeners[0].getsockname()[1]
+  listeners.append(socket.socket())
+  listeners[1].bind(("127.0.0.3", port))
+  for listener in listeners:
+    listener.listen(16)
+  yield port
+  for listener in listeners:
+    listener.close()
+
+
+@pytest.fixture
+def builders(api):
+  api.nodes[:] = [
+    node("arm", ["127.0.0.2"], tags=["tag:distcc"]),
+    node("x86", ["127.0.0.3"], tags=["tag:distcc"]),
+    node("gone", ["127.0.0.4"], tags=["tag:distcc"]),
+    node("asleep", ["127.0.0.5"], online=False, tags=["tag:distcc"]),
+  ]
+
+
+def fake_salt(pillar=None, mine=None, mine_calls=None):
+  pillar = pillar or {}
+  mine = mine or {}
+
+  def mine_get(tgt, fun, tgt_type="glob"):
+    if mine_calls is not None:
+      mine_calls.append((tgt, fun, tgt_type))
+    if isinstance(mine, Exception):
+      raise mine
+    names = tgt if tgt_type == "list" else [tgt]
+    return {name: mine[name] for name in names if name in mine}
+
+  return {
+    "pillar.get": lambda key, default=None: pillar.get(key, default),
+    "mine.get": mine_get,
+  }
+
+
+def slowed(headscale, delays):
+  """Add per-address latency on top of the real TCP connect."""
+  probe = headscale._probe
+  calls = []
+
+  def _probe(address, port, timeout):
+    calls.append(address)
+    rtt = probe(address, port, timeout)
+    time.sleep(delays.get(address, 0))
+    return None if rtt is None else rtt + delays.get(address, 0)
+
+  headscale._probe = _probe
+  return calls
+
+
+@pytest.mark.usefixtures("builders")
+def test_distcc_hosts_nearest_first_with_limits(load, distccd):
+  headscale = load(salt=fake_salt(pillar={"distcc:limits:x86": 16}, mine={"arm": "4"}))
+  slowed(headscale, {"127.0.0.2": 0.3, "127.0.0.3": 0.05, "127.0.0.4": 0.3})
+
+  start = time.monotonic()
+  assert headscale.distcc_hosts(port=distccd) == "x86/16 arm/4"
+  # probed concurrently
+  assert time.monotonic() - start < 0.5
+  assert headscale.distcc_hosts(port=distccd, with_limits=False) == "x86 arm"
+
+
+@pytest.mark.usefixtures("builders")
+def test_distcc_limit_defaults(load, distccd):
+  mine_calls = []
+  headscale = load(
+    salt=fake_salt(pillar={"distcc:default_limit": 2}, mine_calls=mine_calls)
+  )
+  assert headscale.distcc_hosts(port=distccd) in ("arm/2 x86/2", "x86/2 arm/2")
+  # one mine round trip for all reachable hosts
+  assert mine_calls == [(["arm", "x86"], "distcc_jobs", "list")]
+
+  headscale = load(salt=fake_salt())
+  assert headscale.distcc_hosts(port=distccd).count("/4") == 2
+
+
+@pytest.mark.usefixtures("builders")
+def test_distcc_limit_mine_unavailable(load, distccd):
+  headscale = load(salt=fake_salt(pillar={"distcc:limits:x86": 16}))
+  headscale.__salt__["mine.get"] = fake_salt(mine=headscale.SaltException("no master"))[
+    "mine.get"
+  ]
+  assert headscale.distcc_hosts(port=distccd) in ("arm/4 x86/16", "x86/16 arm/4")
+
+
+@pytest.mark.usefixtures("builders")
+def test_probe_results_are_cached(load, distccd, tmp_path):
+  headscale = load(salt=fake_salt())
+  calls = slowed(headscale, {})
+  headscale.distcc_hosts(port=distccd)
+  assert sorted(calls) == ["127.0.0.2", "127.0.0.3", "127.0.0.4"]
+
+  # another run within probe_ttl reuses them, unreachable hosts included
+  headscale = load(salt=fake_salt())
+  calls = slowed(headscale, {})
+  assert headscale.distcc_hosts(port=distccd).count("/") == 2
+  assert calls == []
+
+  assert headscale.distcc_hosts(port=distccd, refresh=True)
+  assert len(calls) == 3
+
+  probes = json.loads((tmp_path / "headscale" / "probes.json").read_text())
+  assert probes[f"127.0.0.4:{distccd}"]["rtt"] is None
+  for entry in probes.values():
+    entry["probed"] -= 60
+  (tmp_path / "headscale" / "probes.json").write_text(json.dumps(probes))
+  headscale.distcc_hosts(port=distccd)
+  assert len(calls) == 6
+
+
+def test_unreachable_api_is_tried_once(tmp_path):
+  utils = load_salt_utils("_utils/httpclient.py")
+  headscale = load_http_module(
+    "_modules/headscale.py",
+    cachedir=tmp_path,
+    pillar={"headscale": {"login-server": "http://127.0.0.1:9", "api-key": "k"}},
+    utils=utils,
+  )
+
+  assert headscale.get_node_ip("papaya") is None
+  stats = utils["httpclient.metrics"]("127.0.0.1:9")
+  assert stats["errors"] == 1 and stats["retries"] == 0
+  utils["httpclient.close"]()
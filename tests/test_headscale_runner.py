@@ -0,0 +1,121 @@
+"""
+Unit tests for the headscale change-feed runner against a fake headscale API.
+"""
+
+import functools
+
+import pytest
+
+from tests.fixtures.headscale import FakeHeadscale, node
+from tests.lib.salt_modules import load_http_module
+
+
+@pytest.fixture
+def api(serve):
+  return serve(
+    FakeHeadscale,
+    [
+      node("papaya", ["100.64.0.2"], tags=["tag:distcc"]),
+      node("guava", ["100.64.0.3"]),
+      node("kiwi", ["100.64.0.4"], online=False),
+    ],
+    etag=True,
+  )
+
+
+@pytest.fixture
+def runner(api, tmp_path):
+  module = load_http_module(
+    "_runners/headscale.py",
+    api,
+    opts={"headscale": {"login-server": api.url + "/", "api-key": api.api_key}},
+  )
+  module.fired = []
+  module._fire = lambda tag, data: module.fired.append((tag, data))
+  module.poll = functools.partial(module.poll, data_dir=str(tmp_path / "headscale"))
+  return module
+
+
+def tags(runner):
+  return [(tag.rsplit("/", 1)[1], data["node"]) for tag, data in runner.fired]
+
+
+def test_first_poll_only_records(runner):
+  ret = runner.poll()
+
+  assert ret["changed"] and ret["initial"]
+  assert runner.fired == []
+
+
+def test_unchanged_list_is_a_304(runner, api):
+  runner.poll()
+
+  assert runner.poll() == {"changed": False, "events": []}
+  assert api.requests[-1][2]["If-None-Match"]
+  assert runner.fired == []
+
+
+def test_online_offline_and_tag_events(runner, api):
+  runner.poll()
+  api.nodes[0]["online"] = False
+  api.nodes[2]["online"] = True
+  api.nodes[1]["tags"] = ["tag:distcc"]
+
+  ret = runner.poll()
+  assert sorted(tags(runner)) == [
+    ("offline", "papaya"),
+    ("online", "kiwi"),
+    ("tags-changed", "guava"),
+  ]
+  assert len(ret["events"]) == 3
+  changed = dict(runner.fired)["cozy/headscale/node/tags-changed"]
+  assert changed["tags"] == ["tag:distcc"]
+  assert changed["old_tags"] == []
+  assert changed["ips"] == ["100.64.0.3"]
+
+
+def test_address_change_fires_ips_changed(runner, api):
+  runner.poll()
+  api.nodes[0]["ipAddresses"] = ["100.64.0.12", "fd7a::12"]
+  api.nodes[1]["ipAddresses"] = ["100.64.0.3"]
+
+  ret = runner.poll()
+  assert tags(runner) == [("ips-changed", "papaya")]
+  assert [event["tag"] for event in ret["events"]] == [
+    "cozy/headscale/node/ips-changed"
+  ]
+  moved = runner.fired[0][1]
+  assert moved["ips"] == ["100.64.0.12", "fd7a::12"]
+  assert moved["old_ips"] == ["100.64.0.2"]
+  assert moved["tags"] == moved["old_tags"] == ["tag:distcc"]
+
+
+def test_joined_and_removed_nodes(runner, api):
+  runner.poll()
+  api.nodes.append(node("mango", ["100.64.0.5"]))
+  api.nodes.append(node("lime", ["100.64.0.6"], online=False))
+  del api.nodes[0]
+
+  runner.poll()
+  assert sorted(tags(runner)) == [("offline", "papaya"), ("online", "mango")]
+  removed = dict(runner.fired)["cozy/headscale/node/offline"]
+  assert removed["old_tags"] == ["tag:distcc"] and removed["tags"] == []
+
+
+def test_ignored_fields_dont_fire(runner, api):
+  runner.poll()
+  api.nodes[1]["lastSeen"] = "2026-10-18T08:00:00Z"
+
+  assert runner.poll()["changed"] is False
+  assert runner.fired == []
+
+
+def test_api_errors_keep_the_snapshot(runner, api):
+  runner.poll()
+  api.api_key = "rotated"
+  assert runner.poll() == {"error": "HTTP 401"}
+
+  api.api_key = "hskey"
+  api.nodes[0]["online"] = False
+  runner.poll()
+  assert tags(runner) == [("offline", "papaya")]
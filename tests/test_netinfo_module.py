@@ -0,0 +1,139 @@
+"""
+Unit tests for netinfo.wan_info / wan_ips against local HTTP(S) and STUN
+stand-ins.
+"""
+
+import functools
+import json
+import time
+
+import pytest
+
+from tests.fixtures.https import LocalHTTPS
+from tests.fixtures.stun import FakeSTUN
+from tests.lib.salt_modules import load_http_module
+
+
+@pytest.fixture
+def echo(serve):
+  return serve(
+    LocalHTTPS,
+    {
+      "/v4": (200, {"ip": "203.0.113.7"}),
+      "/v6": (200, b"2001:db8::7\n"),
+      "/wrong-family": (200, {"ip": "203.0.113.8"}),
+      "/broken": (500, {}),
+    },
+  )
+
+
+@pytest.fixture
+def stun(serve):
+  return functools.partial(serve, FakeSTUN)
+
+
+@pytest.fixture
+def load(echo, tmp_path):
+  def _load(providers, **opts):
+    return load_http_module(
+      "_modules/netinfo.py",
+      echo,
+      tmp_path,
+      salt={"config.get": lambda key, default=None: providers},
+      opts=opts,
+    )
+
+  return _load
+
+
+def http(echo, path, name=None):
+  return {"name": name or path.strip("/"), "type": "http", "url": echo.url + path}
+
+
+def test_families_resolve_concurrently(load, echo, stun):
+  slow4 = stun(mapped="198.51.100.7", delay=0.3)
+  slow6 = stun(mapped="2001:db8::9", delay=0.3, host="::1")
+  netinfo = load({"v4": [slow4.provider()], "v6": [slow6.provider()]})
+
+  start = time.monotonic()
+  info = netinfo.wan_info()
+  assert time.monotonic() - start < 0.55
+  assert info["ips"] == ["198.51.100.7", "2001:db8::9"]
+  assert info["v4"]["provider"] == "stun"
+  assert info["v4"]["seconds"] >= 0.3
+  assert info["cached"] is False
+
+
+def test_providers_fall_back_in_order(load, echo, stun):
+  netinfo = load(
+    {
+      "v4": [
+        http(echo, "/broken"),
+        {"name": "nothing-there", "type": "stun", "host": "127.0.0.1", "port": 9},
+        http(echo, "/v4", "lan-echo"),
+      ],
+      "v6": [http(echo, "/wrong-family"), http(echo, "/v6", "plain-text")],
+    }
+  )
+
+  info = netinfo.wan_info()
+  assert info["v4"]["provider"] == "lan-echo"
+  assert info["v6"] == {
+    "ip": "2001:db8::7",
+    "provider": "plain-text",
+    "seconds": info["v6"]["seconds"],
+  }
+  assert netinfo.wan_ips() == ["2001:db8::7", "203.0.113.7"]
+
+
+def test_deadline_bounds_a_hanging_provider(load, echo, stun):
+  hanging = stun(delay=2)
+  netinfo = load(
+    {"v4": [hanging.provider("slow")], "v6": [http(echo, "/v6")]},
+    **{"netinfo.wan_deadline": 0.4},
+  )
+
+  start = time.monotonic()
+  info = netinfo.wan_info()
+  assert time.monotonic() - start < 1
+  assert info["v4"] is None
+  assert info["ips"] == ["2001:db8::7"]
+
+
+def test_answers_are_cached(load, echo, stun, tmp_path):
+  server = stun()
+  providers = {"v4": [server.provider()], "v6": []}
+
+  assert load(providers).wan_ips() == ["198.51.100.7"]
+  # a beacon storm: new processes, same answer, no new lookups
+  for _ in range(5):
+    info = load(providers).wan_info()
+    assert info["cached"] and info["v4"]["provider"] == "stun"
+  assert server.requests == 1
+
+  assert load(providers).wan_ips(refresh=True) == ["198.51.100.7"]
+  assert server.requests == 2
+
+  cache = tmp_path / "netinfo" / "wan.json"
+  data = json.loads(cache.read_text())
+  data["fetched"] -= 120
+  cache.write_text(json.dumps(data))
+  load(providers).wan_ips()
+  assert server.requests == 3
+
+
+def test_failures_are_not_cached(load, echo, tmp_path):
+  netinfo = load({"v4": [http(echo, "/broken")], "v6": []})
+
+  assert netinfo.wan_ips() == []
+  assert not (tmp_path / "netinfo" / "wan.json").exists()
+
+
+def test_default_providers_without_config(load):
+  netinfo = load({})
+  assert set(netinfo.DEFAULT_PROVIDERS) == {"v4", "v6"}
+  assert all(
+    p["type"] in ("http", "stun")
+    for ps in netinfo.DEFAULT_PROVIDERS.values()
+    for p in ps
+  )
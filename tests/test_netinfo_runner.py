@@ -0,0 +1,264 @@
+"""
+Unit tests for the netinfo collector runner with a fake LocalClient.
+"""
+
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from tests.lib.salt_modules import load_salt_module
+
+
+class FakeLocalClient:
+  """Answers cmd_iter from a minion -> {function: return} table."""
+
+  def __init__(self, returns):
+    self.returns = returns
+    self.jobs = []
+
+  def cmd_iter(self, tgt, fun, arg, tgt_type="glob", timeout=None):
+    self.jobs.append({"tgt": list(tgt), "fun": fun, "arg": arg, "tgt_type": tgt_type})
+    for minion_id in tgt:
+      if minion_id in self.returns:
+        yield {minion_id: {"ret": self.returns[minion_id], "retcode": 0}}
+
+
+def minion(gateway, wan):
+  return {
+    "netinfo.default_gw": {"gateway": gateway, "interface": "eth0"},
+    "netinfo.wan_ips": wan,
+  }
+
+
+@pytest.fixture
+def client():
+  return FakeLocalClient(
+    {
+      "guava": minion("10.0.0.1", ["203.0.113.7"]),
+      "papaya": minion("10.0.0.1", ["203.0.113.7"]),
+      "kiwi": minion("192.168.1.1", ["198.51.100.2", "2001:db8::2"]),
+    }
+  )
+
+
+@pytest.fixture
+def runner(client):
+  module = load_salt_module("_runners/netinfo.py")
+  module._client = lambda: client
+  return module
+
+
+def read(tmp_path, minion_id):
+  return json.loads((tmp_path / f"{minion_id}.json").read_text())
+
+
+def test_collect_keeps_output_and_change_detection(runner, client, tmp_path):
+  ret = runner.collect("kiwi", data_dir=str(tmp_path))
+
+  assert ret["changed"] is True
+  assert client.jobs == [
+    {
+      "tgt": ["kiwi"],
+      "fun": ["netinfo.default_gw", "netinfo.wan_ips"],
+      "arg": [[], ["refresh=True"]],
+      "tgt_type": "list",
+    }
+  ]
+  data = read(tmp_path, "kiwi")
+  assert set(data) == {"gateway", "interface", "wan", "__changed__"}
+  assert data["wan"] == ["198.51.100.2", "2001:db8::2"]
+
+  stamp = data["__changed__"]
+  assert runner.collect("kiwi", data_dir=str(tmp_path))["changed"] is False
+  assert read(tmp_path, "kiwi")["__changed__"] == stamp
+
+  client.returns["kiwi"]["netinfo.wan_ips"] = ["198.51.100.3"]
+  assert runner.collect("kiwi", data_dir=str(tmp_path))["changed"] is True
+
+
+def test_collect_many_is_one_job(runner, client, tmp_path):
+  ret = runner.collect_many("guava,papaya,kiwi,mango", data_dir=str(tmp_path))
+
+  assert len(client.jobs) == 1
+  assert client.jobs[0]["tgt"] == ["guava", "kiwi", "mango", "papaya"]
+  assert ret["guava"]["gateway"] == "10.0.0.1"
+  # no answer: recorded the way a single collect always did
+  assert ret["mango"]["gateway"] is None and ret["mango"]["wan"] == []
+
+
+def test_failed_function_returns_are_tolerated(runner, client, tmp_path):
+  client.returns["guava"]["netinfo.wan_ips"] = "'netinfo.wan_ips' is not available."
+
+  ret = runner.collect("guava", data_dir=str(tmp_path))
+  assert ret["wan"] == [] and ret["gateway"] == "10.0.0.1"
+
+
+def test_events_in_window_coalesce_into_one_job(runner, client, tmp_path):
+  results = {}
+
+  def fire(minion_id):
+    results[minion_id] = runner.collect(minion_id, data_dir=str(tmp_path), window=0.3)
+
+  threads = [threading.Thread(target=fire, args=(m,)) for m in client.returns]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert len(client.jobs) == 1
+  assert client.jobs[0]["tgt"] == ["guava", "kiwi", "papaya"]
+  leaders = [r for r in results.values() if "queued" not in r]
+  assert len(leaders) == 1
+  assert set(leaders[0]["collected"]) == {"guava", "kiwi", "papaya"}
+  for minion_id in client.returns:
+    assert read(tmp_path, minion_id)["gateway"]
+  assert not list((tmp_path / ".pending").iterdir())
+
+
+def test_later_events_get_their_own_job(runner, client, tmp_path):
+  runner.collect("guava", data_dir=str(tmp_path), window=0.05)
+  runner.collect("kiwi", data_dir=str(tmp_path), window=0.05)
+
+  assert [job["tgt"] for job in client.jobs] == [["guava"], ["kiwi"]]
+
+
+def test_query_uses_the_inventory(runner, client, tmp_path):
+  runner.collect_many("guava,papaya,kiwi", data_dir=str(tmp_path))
+
+  assert sorted(runner.query(wan="203.0.113.7", data_dir=str(tmp_path))) == [
+    "guava",
+    "papaya",
+  ]
+  assert list(runner.query(wan="2001:db8::2", data_dir=str(tmp_path))) == ["kiwi"]
+  assert list(
+    runner.query(gateway="192.168.1.1", interface="eth0", data_dir=str(tmp_path))
+  ) == ["kiwi"]
+  assert runner.query(gateway="10.0.0.1", minion="kiwi", data_dir=str(tmp_path)) == {}
+  assert len(runner.query(data_dir=str(tmp_path))) == 3
+
+  db = sqlite3.connect(tmp_path / "inventory.db")
+  assert db.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+  plan = db.execute(
+    "EXPLAIN QUERY PLAN SELECT minion_id FROM wan WHERE ip = ?", ("x",)
+  ).fetchall()
+  assert "USING" in plan[0][-1] and "SCAN" not in plan[0][-1]
+
+
+def test_history_appends_only_on_change(runner, client, tmp_path):
+  for wan in (["198.51.100.2"], ["198.51.100.2"], ["198.51.100.3"]):
+    client.returns["kiwi"]["netinfo.wan_ips"] = wan
+    runner.collect("kiwi", data_dir=str(tmp_path))
+
+  changes = runner.history("kiwi", data_dir=str(tmp_path))
+  assert [c["wan"] for c in changes] == [["198.51.100.3"], ["198.51.100.2"]]
+  assert runner.query(wan="198.51.100.2", data_dir=str(tmp_path)) == {}
+  assert runner.history("kiwi", limit=1, data_dir=str(tmp_path)) == changes[:1]
+
+
+def test_existing_json_is_imported_and_exported(runner, client, tmp_path):
+  old = {
+    "gateway": "10.9.0.1",
+    "interface": "wlan0",
+    "wan": ["192.0.2.4"],
+    "__changed__": "2026-01-02T03:04:05Z",
+  }
+  (tmp_path / "mango.json").write_text(json.dumps(old))
+  (tmp_path / "broken.json").write_text("{")
+
+  assert runner.query(minion="mango", data_dir=str(tmp_path))["mango"] == old
+
+  out = tmp_path / "export"
+  runner.collect("kiwi", data_dir=str(tmp_path))
+  paths = runner.export(data_dir=str(tmp_path), dest=str(out))
+  assert [p.rsplit("/", 1)[1] for p in paths] == ["kiwi.json", "mango.json"]
+  assert json.loads((out / "mango.json").read_text()) == old
+  assert json.loads((out / "kiwi.json").read_text()) == read(tmp_path, "kiwi")
+
+
+class ChurningClient(FakeLocalClient):
+  """A minion whose WAN address changes on every job."""
+
+  def __init__(self):
+    super().__init__({})
+    self.counter = itertools.count(1)
+
+  def cmd_iter(self, tgt, fun, arg, tgt_type="glob", timeout=None):
+    n = next(self.counter)
+    self.returns = {m: minion("10.0.0.1", [f"198.51.100.{n}"]) for m in tgt}
+    yield from super().cmd_iter(tgt, fun, arg, tgt_type, timeout)
+
+
+def test_concurrent_collects_for_one_minion(tmp_path):
+  module = load_salt_module("_runners/netinfo.py")
+  client = ChurningClient()
+  module._client = lambda: client
+  path = tmp_path / "kiwi.json"
+  stop = threading.Event()
+  torn = []
+
+  def reader():
+    while not stop.is_set():
+      try:
+        json.loads(path.read_text())
+      except FileNotFoundError:
+        pass
+      except ValueError as exc:
+        torn.append(exc)
+
+  def writer():
+    for _ in range(10):
+      module.collect("kiwi", data_dir=str(tmp_path))
+
+  watcher = threading.Thread(target=reader)
+  watcher.start()
+  threads = [threading.Thread(target=writer) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  stop.set()
+  watcher.join()
+
+  assert torn == []
+  assert len(client.jobs) == 80
+  # whoever exported last wrote the state the inventory ended up with
+  stored = module.query(minion="kiwi", data_dir=str(tmp_path))["kiwi"]
+  assert json.loads(path.read_text()) == stored
+  assert len(module.history("kiwi", limit=100, data_dir=str(tmp_path))) == 80
+  assert sorted(p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")) == []
+
+
+def test_truncated_json_is_not_a_change(runner, client, tmp_path):
+  runner.collect("kiwi", data_dir=str(tmp_path))
+  (tmp_path / "kiwi.json").write_text('{"gateway": "192.168.')
+
+  assert runner.collect("kiwi", data_dir=str(tmp_path))["changed"] is False
+
+
+def test_repeated_events_write_once_per_window(tmp_path):
+  module = load_salt_module("_runners/netinfo.py")
+  client = ChurningClient()
+  module._client = lambda: client
+  writes = []
+  export = module._export
+  module._export = lambda *args: writes.append(time.monotonic()) or export(*args)
+
+  def fire():
+    module.collect("kiwi", data_dir=str(tmp_path), window=0.2)
+
+  start = time.monotonic()
+  threads = []
+  while time.monotonic() - start < 0.7:
+    threads.append(threading.Thread(target=fire))
+    threads[-1].start()
+    time.sleep(0.02)
+  for thread in threads:
+    thread.join()
+
+  assert len(threads) > 20
+  assert 2 <= len(writes) <= 5
+  assert all(b - a >= 0.19 for a, b in itertools.pairwise(writes))
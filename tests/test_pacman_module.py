@@ -0,0 +1,128 @@
+"""
+Unit tests for the pacman execution module (srv/salt/_modules/pacman.py).
+
+Runs the module outside Salt with a fake cmd.run_all that simulates a
+local package database, so no Arch host is needed.
+"""
+
+import pytest
+
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+
+class FakePacman:
+  """Minimal pacman simulator backing a FakeRunAll."""
+
+  def __init__(self, installed=None, broken=(), provides=None):
+    self.installed = dict(installed or {})
+    self.broken = set(broken)
+    self.provides = dict(provides or {})
+
+  def satisfied(self, name):
+    return name in self.installed or self.provides.get(name) in self.installed
+
+  def __call__(self, cmd, **kwargs):
+    argv = cmd.split()
+    op, names = argv[1], [a for a in argv[2:] if not a.startswith("-")]
+    if op == "-Q":
+      if not names:
+        return 0, "\n".join(f"{n} {v}" for n, v in self.installed.items()), ""
+      missing = [n for n in names if not self.satisfied(n)]
+      return (1 if missing else 0), "", ""
+    if op == "-T":
+      missing = [n for n in names if not self.satisfied(n)]
+      return (127 if missing else 0), "\n".join(missing), ""
+    if op in ("-S", "-Sy"):
+      bad = [n for n in names if n in self.broken]
+      if bad:
+        return 1, "", f"error: target not found: {bad[0]}"
+      todo = [n for n in names if n not in self.installed]
+      if not todo:
+        return 0, " there is nothing to do", ""
+      self.installed.update({n: "1.0-1" for n in todo})
+      return 0, "installing", ""
+    return 0, "", ""
+
+
+@pytest.fixture
+def pacman(tmp_path):
+  def _load(installed=None, broken=(), provides=None):
+    run_all = FakeRunAll(FakePacman(installed, broken, provides))
+    module = load_salt_module(
+      "_modules/pacman.py",
+      salt={"cmd.run_all": run_all},
+      # No local db here, so queries go through the fake pacman -Q
+      opts={"pacman.dbpath": str(tmp_path / "no-db")},
+      utils=load_salt_utils("_utils/pkgbatch.py", "_utils/pkgenv.py"),
+    )
+    return module, run_all
+
+  return _load
+
+
+def test_installed_takes_single_snapshot(pacman):
+  module, run_all = pacman(installed={f"pkg{i}": "1.0-1" for i in range(50)})
+
+  ret = module.installed(pkgs=[f"pkg{i}" for i in range(50)])
+
+  assert ret["result"] is True
+  assert ret["changes"] == {}
+  assert run_all.calls == ["pacman -Q"]
+
+
+def test_installed_refreshes_snapshot_after_transaction(pacman):
+  module, run_all = pacman(installed={"git": "2.0-1"})
+
+  ret = module.installed(pkgs=["git", "vim", "htop"])
+
+  assert ret["result"] is True
+  assert set(ret["changes"]) == {"vim", "htop"}
+  assert run_all.count("pacman -Q") == 2
+  assert run_all.count("pacman -S") == 1
+  assert module.__context__[module._INDEX_KEY]["vim"] == "1.0-1"
+
+
+def test_snapshot_is_shared_across_calls_in_a_run(pacman):
+  module, run_all = pacman(installed={"git": "2.0-1"})
+
+  module.installed(pkgs=["git"])
+  module.installed(name="git")
+  assert module.list_installed(cached=True) == {"git": "2.0-1"}
+
+  assert run_all.count("pacman -Q") == 1
+
+
+def test_remove_invalidates_snapshot(pacman):
+  module, run_all = pacman(installed={"git": "2.0-1"})
+
+  module.installed(pkgs=["git"])
+  module.remove("git")
+
+  assert module._INDEX_KEY not in module.__context__
+
+
+def test_failed_batch_reports_failed_packages(pacman):
+  module, _ = pacman(broken={"nope"})
+
+  ret = module.installed(pkgs=["vim", "nope"])
+
+  assert ret["result"] is False
+  assert "vim" in ret["changes"]
+  assert "Failed: nope" in ret["comment"]
+
+
+def test_provided_target_is_not_reinstalled(pacman):
+  module, run_all = pacman(
+    installed={"neovim-git": "0.11.r1-1", "git": "2.0-1"},
+    provides={"neovim": "neovim-git"},
+  )
+
+  ret = module.installed(pkgs=["git", "neovim", "htop"])
+
+  assert set(ret["changes"]) == {"htop"}
+  assert "Already installed: git, neovim" in ret["comment"]
+  assert run_all.count("pacman -T") == 1
+  assert [c for c in run_all.calls if c.startswith("pacman -S")] == [
+    "pacman -S --needed --noconfirm htop"
+  ]
+  assert module.is_installed("neovim") is True
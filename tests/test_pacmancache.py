@@ -0,0 +1,151 @@
+"""
+Unit tests for the fleet pacman package cache: the minion side in
+pacman.prefetch and the pacmancache.collect runner on the master.
+"""
+
+import os
+import shutil
+import time
+
+import pytest
+
+from tests.fixtures.alpm import write_sync_db
+from tests.fixtures.mirror import LocalMirror
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+
+@pytest.fixture
+def mirror(serve, tmp_path):
+  return serve(LocalMirror, tmp_path / "mirror", delay_s=0)
+
+
+@pytest.fixture
+def fleet(tmp_path, mirror):
+  """pacman module with fleet caching on and a fake master fileserver."""
+  dbpath = tmp_path / "db"
+  (dbpath / "local").mkdir(parents=True)
+  packages = [mirror.publish("core", name, "1.0-1") for name in ("a", "b", "c")]
+  write_sync_db(dbpath, "core", packages)
+
+  master_root = tmp_path / "master"
+  master_root.mkdir()
+  master = {}
+
+  def serve(name, data):
+    path = master_root / name
+    path.write_bytes(data)
+    master[f"pacman-cache/x86_64/{name}"] = path
+
+  def cache_file(url):
+    # the fileclient hands back its own copy
+    src = master.get(url.removeprefix("salt://"))
+    if src is None:
+      return ""
+    dst = tmp_path / "fileclient" / src.name
+    dst.parent.mkdir(exist_ok=True)
+    shutil.copy(src, dst)
+    return str(dst)
+
+  pushed = []
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={
+      "cmd.run_all": FakeRunAll(),
+      "config.get": lambda key, default=None: (
+        {"enabled": True} if key == "pacman_fleet_cache" else default
+      ),
+      "cp.list_master": lambda prefix="": [p for p in master if p.startswith(prefix)],
+      "cp.cache_file": cache_file,
+      "cp.push": lambda path, upload_path: pushed.append(upload_path) or True,
+    },
+    grains={"cpuarch": "x86_64"},
+    opts={
+      "pacman.dbpath": str(dbpath),
+      "pacman.conf": str(mirror.write_conf(tmp_path)),
+      "pacman.cachedir": str(tmp_path / "pkg"),
+      "cachedir": str(tmp_path / "salt"),
+    },
+    utils=load_salt_utils("_utils/alpm.py", "_utils/pkgenv.py", "_utils/pkgfetch.py"),
+  )
+  return module, serve, pushed
+
+
+def test_prefetch_prefers_fleet_cache_and_falls_back(fleet, mirror):
+  module, serve, pushed = fleet
+  serve(
+    "a-1.0-1-x86_64.pkg.tar.zst",
+    (mirror.root / "core/os/x86_64/a-1.0-1-x86_64.pkg.tar.zst").read_bytes(),
+  )
+  serve("b-1.0-1-x86_64.pkg.tar.zst", b"tampered")
+
+  ret = module.prefetch(pkgs=["a", "b", "c"])
+
+  assert ret["fleet"] == ["a-1.0-1-x86_64.pkg.tar.zst"]
+  assert ret["fetched"] == ["b-1.0-1-x86_64.pkg.tar.zst", "c-1.0-1-x86_64.pkg.tar.zst"]
+  assert not any("/a-1.0-1" in r for r in mirror.requests)
+  assert sorted(pushed) == [
+    "/pacman-cache/x86_64/b-1.0-1-x86_64.pkg.tar.zst",
+    "/pacman-cache/x86_64/c-1.0-1-x86_64.pkg.tar.zst",
+  ]
+
+  stats = module.fleet_cache_stats()
+  assert (stats["hits"], stats["misses"]) == (1, 2)
+  assert stats["bytes_saved"] == len(b"a payload" * 100)
+  assert stats["hit_rate"] == 0.333
+
+
+def test_collect_dedups_and_trims_lru(tmp_path):
+  master_cache = tmp_path / "master"
+  for minion in ("guava", "quince"):
+    upload = master_cache / "minions" / minion / "files" / "pacman-cache" / "x86_64"
+    upload.mkdir(parents=True)
+    (upload / "git-2.48.0-1-x86_64.pkg.tar.zst").write_bytes(b"g" * 600 * 1024)
+  dest = tmp_path / "fileroot" / "pacman-cache"
+  (dest / "x86_64").mkdir(parents=True)
+  stale = dest / "x86_64" / "vim-9.0-1-x86_64.pkg.tar.zst"
+  stale.write_bytes(b"v" * 600 * 1024)
+  old = time.time() - 86400 * 30
+  os.utime(stale, (old, old))
+
+  runner = load_salt_module(
+    "_runners/pacmancache.py",
+    opts={"cachedir": str(master_cache), "pacmancache.pushers": ["guava", "quince"]},
+  )
+  ret = runner.collect(dest=str(dest), max_mb=1)
+
+  assert ret["published"] == ["x86_64/git-2.48.0-1-x86_64.pkg.tar.zst"]
+  assert ret["rejected"] == []
+  assert ret["duplicates"] == 1
+  assert ret["evicted"] == ["x86_64/vim-9.0-1-x86_64.pkg.tar.zst"]
+  assert os.listdir(dest / "x86_64") == ["git-2.48.0-1-x86_64.pkg.tar.zst"]
+  assert not list(master_cache.glob("minions/*/files/pacman-cache/*/*"))
+
+
+def test_collect_only_takes_listed_pushers(tmp_path):
+  master_cache = tmp_path / "master"
+  for minion in ("builder-1", "papaya"):
+    upload = master_cache / "minions" / minion / "files" / "pacman-cache" / "x86_64"
+    upload.mkdir(parents=True)
+    (upload / f"{minion}-1.0-1-x86_64.pkg.tar.zst").write_bytes(b"pkg")
+  dest = tmp_path / "fileroot" / "pacman-cache"
+
+  runner = load_salt_module(
+    "_runners/pacmancache.py",
+    opts={"cachedir": str(master_cache), "pacmancache.pushers": ["builder-*"]},
+  )
+  ret = runner.collect(dest=str(dest))
+
+  assert ret["published"] == ["x86_64/builder-1-1.0-1-x86_64.pkg.tar.zst"]
+  assert ret["rejected"] == [
+    "papaya: x86_64/papaya-1.0-1-x86_64.pkg.tar.zst: not in pacmancache.pushers"
+  ]
+  assert os.listdir(dest / "x86_64") == ["builder-1-1.0-1-x86_64.pkg.tar.zst"]
+  assert not list(master_cache.glob("minions/*/files/pacman-cache/*/*"))
+
+  # no pushers configured: nothing is published
+  upload = master_cache / "minions" / "builder-1" / "files" / "pacman-cache"
+  (upload / "x86_64" / "vim-9.0-1-x86_64.pkg.tar.zst").write_bytes(b"pkg")
+  runner = load_salt_module(
+    "_runners/pacmancache.py", opts={"cachedir": str(master_cache)}
+  )
+  assert runner.collect(dest=str(dest))["published"] == []
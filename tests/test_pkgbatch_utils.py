@@ -0,0 +1,96 @@
+"""
+Unit tests for failed-batch bisection (srv/salt/_utils/pkgbatch.py).
+
+Drives pacman.installed and yay.installed with a fake cmd.run_all whose
+transactions fail whenever a known-bad package is in the batch, and counts
+how many transactions it takes to isolate the failures.
+"""
+
+import pytest
+
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+PACKAGES = [f"font-{i:02d}" for i in range(40)]
+
+
+def fake_tool(installed, broken):
+  """Transactions fail atomically if any broken package is in the batch."""
+
+  def handler(cmd, **kwargs):
+    argv = cmd.split()
+    names = [a for a in argv[2:] if not a.startswith("-")]
+    if argv[1] == "-Q":
+      if not names:
+        return 0, "\n".join(f"{n} 1.0-1" for n in installed), ""
+      return (0 if names[0] in installed else 1), "", ""
+    bad = [n for n in names if n in broken]
+    if bad:
+      return 1, "", f"error: failed to build {bad[0]}"
+    installed.update(names)
+    return 0, "", ""
+
+  return handler
+
+
+def load(relpath, tmp_path, broken):
+  run_all = FakeRunAll(fake_tool(set(), set(broken)))
+  module = load_salt_module(
+    relpath,
+    salt={"cmd.run_all": run_all, "config.get": lambda key, default=None: default},
+    opts={"pacman.dbpath": str(tmp_path / "no-db")},
+    utils=load_salt_utils("_utils/pkgbatch.py", "_utils/pkgenv.py"),
+  )
+  return module, run_all
+
+
+def test_bisect_isolates_failures():
+  pkgbatch = load_salt_module("_utils/pkgbatch.py")
+  calls = []
+
+  def run_batch(batch):
+    calls.append(batch)
+    return {"retcode": 1 if "c" in batch else 0, "stderr": "boom"}
+
+  good, bad = pkgbatch.bisect(list("abcdefgh"), run_batch, {"retcode": 1})
+
+  assert good == list("abdefgh")
+  assert list(bad) == ["c"]
+  assert bad["c"]["stderr"] == "boom"
+  assert len(calls) == 6
+
+
+def test_bisect_single_package_reuses_failed_result():
+  pkgbatch = load_salt_module("_utils/pkgbatch.py")
+
+  good, bad = pkgbatch.bisect(["a"], pytest.fail, {"retcode": 1, "stderr": "x"})
+
+  assert good == []
+  assert bad == {"a": {"retcode": 1, "stderr": "x"}}
+
+
+@pytest.mark.parametrize(
+  "relpath,install_prefix",
+  [("_modules/pacman.py", "pacman -S"), ("_modules/yay.py", "yay -S")],
+)
+def test_installed_bisects_failed_batch(relpath, install_prefix, tmp_path):
+  module, run_all = load(relpath, tmp_path, broken={"font-17"})
+
+  ret = module.installed(pkgs=PACKAGES, runas="builder")
+
+  assert ret["result"] is False
+  assert len(ret["changes"]) == 39
+  assert "font-17" not in ret["changes"]
+  assert "Failed: font-17" in ret["comment"]
+  assert "Errors: font-17: error: failed to build font-17" in ret["comment"]
+  # 1 batch + ~2 log2(40) bisection steps, vs 41 with one-at-a-time retries
+  assert run_all.count(install_prefix) <= 1 + 2 * 6
+
+
+def test_installed_bisect_scales_with_failure_count(tmp_path):
+  broken = {"font-03", "font-21", "font-38"}
+  module, run_all = load("_modules/yay.py", tmp_path, broken=broken)
+
+  ret = module.installed(pkgs=PACKAGES, runas="builder")
+
+  assert set(PACKAGES) - set(ret["changes"]) == broken
+  assert run_all.count("yay -S") < len(PACKAGES)
@@ -0,0 +1,78 @@
+"""
+Unit tests for the shared package environment (srv/salt/_utils/pkgenv.py).
+"""
+
+import pwd
+
+import pytest
+
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+
+@pytest.fixture
+def pkgenv():
+  return load_salt_module("_utils/pkgenv.py")
+
+
+def load(relpath, opts, utils):
+  run_all = FakeRunAll()
+  module = load_salt_module(
+    relpath, salt={"cmd.run_all": run_all}, opts=opts, utils=utils
+  )
+  return module, run_all
+
+
+def test_env_is_memoized_and_read_only(pkgenv):
+  env = pkgenv.clean_env("builder")
+
+  assert pkgenv.clean_env("builder") is env
+  assert pkgenv.clean_env("other") is not env
+  with pytest.raises(TypeError):
+    env["PATH"] = "/opt/rust/bin"
+
+
+def test_home_comes_from_passwd(pkgenv):
+  root_home = pwd.getpwuid(0).pw_dir
+
+  assert pkgenv.clean_env()["HOME"] == root_home
+  assert pkgenv.clean_env()["USER"] == "root"
+  assert pkgenv.clean_env("no-such-user")["HOME"] == "/home/no-such-user"
+  assert pkgenv.clean_env("no-such-user")["GNUPGHOME"] == "/home/no-such-user/.gnupg"
+
+
+def test_passthrough_allowlist(pkgenv, monkeypatch):
+  monkeypatch.setenv("DISTCC_HOSTS", "guava/8")
+  monkeypatch.setenv("MAKEFLAGS", "-j8")
+  monkeypatch.setenv("SSH_AUTH_SOCK", "/tmp/agent")
+
+  env = pkgenv.clean_env("builder", ["MAKEFLAGS"])
+
+  assert env["DISTCC_HOSTS"] == "guava/8"
+  assert env["MAKEFLAGS"] == "-j8"
+  assert "SSH_AUTH_SOCK" not in env
+  assert env["CARGO_HOME"] == ""
+
+  monkeypatch.setenv("DISTCC_HOSTS", "guava/8 quince/4")
+  assert (
+    pkgenv.clean_env("builder", ["MAKEFLAGS"])["DISTCC_HOSTS"] == "guava/8 quince/4"
+  )
+
+
+def test_pacman_and_yay_run_with_identical_env(monkeypatch):
+  monkeypatch.setenv("DISTCC_HOSTS", "guava/8")
+  monkeypatch.setenv("MAKEFLAGS", "-j8")
+  opts = {"pkgenv.passthrough": ["MAKEFLAGS"]}
+  utils = load_salt_utils("_utils/pkgenv.py")
+  pacman, pacman_run = load("_modules/pacman.py", opts, utils)
+  yay, yay_run = load("_modules/yay.py", opts, utils)
+  envs = []
+  for run_all in (pacman_run, yay_run):
+    run_all.handler = lambda cmd, **kwargs: envs.append(kwargs["env"]) or (0, "", "")
+
+  pacman._run_pacman("pacman -V", runas="builder")
+  yay._run_yay("yay -V", runas="builder")
+
+  assert envs[0] == envs[1]
+  assert envs[0]["MAKEFLAGS"] == "-j8"
+  assert type(envs[0]) is dict and envs[0] is not envs[1]
+  assert pacman._clean_env("builder") is yay._clean_env("builder")
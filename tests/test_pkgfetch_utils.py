@@ -0,0 +1,155 @@
+"""
+Unit tests for package download-ahead (srv/salt/_utils/pkgfetch.py).
+
+A local HTTP server stands in for the mirrors listed in pacman.conf.
+"""
+
+import os
+
+import pytest
+
+from tests.fixtures.alpm import write_sync_db
+from tests.fixtures.mirror import LocalMirror
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+
+@pytest.fixture
+def mirror(serve, tmp_path):
+  return serve(LocalMirror, tmp_path / "mirror")
+
+
+@pytest.fixture
+def alpm():
+  return load_salt_module("_utils/alpm.py")
+
+
+@pytest.fixture
+def pkgfetch():
+  return load_salt_module("_utils/pkgfetch.py")
+
+
+def test_repo_servers_expands_includes(alpm, tmp_path, mirror):
+  conf = mirror.write_conf(tmp_path)
+
+  assert alpm.repo_servers(str(conf), "x86_64") == {
+    "core": ["http://127.0.0.1:9/core/os/x86_64", f"{mirror.url}/core/os/x86_64"]
+  }
+
+
+def test_fetch_downloads_concurrently_with_fallback(alpm, pkgfetch, tmp_path, mirror):
+  targets = [
+    {
+      "repo": "core",
+      "name": f"pkg{i}",
+      "filename": fields["filename"][0],
+      "size": int(fields["csize"][0]),
+      "sha256": fields["sha256sum"][0],
+    }
+    for i, fields in enumerate(
+      mirror.publish("core", f"pkg{i}", "1.0-1") for i in range(4)
+    )
+  ]
+  servers = alpm.repo_servers(str(mirror.write_conf(tmp_path)), "x86_64")
+  cache = tmp_path / "pkg"
+
+  ret = pkgfetch.fetch(targets, str(cache), servers, jobs=4, timeout=5)
+
+  assert ret["failed"] == {}
+  assert len(ret["fetched"]) == 4
+  assert mirror.max_active > 1
+  assert sorted(os.listdir(cache)) == sorted(t["filename"] for t in targets)
+  assert oct(os.stat(cache / targets[0]["filename"]).st_mode & 0o777) == "0o644"
+
+  again = pkgfetch.fetch(targets, str(cache), servers, jobs=4, timeout=5)
+  assert again["fetched"] == [] and len(again["cached"]) == 4
+
+
+def test_fetch_rejects_checksum_mismatch(pkgfetch, tmp_path, mirror):
+  fields = mirror.publish("core", "evil", "1.0-1")
+  target = {
+    "repo": "core",
+    "name": "evil",
+    "filename": fields["filename"][0],
+    "size": int(fields["csize"][0]),
+    "sha256": "0" * 64,
+  }
+  cache = tmp_path / "pkg"
+
+  ret = pkgfetch.fetch(
+    [target], str(cache), {"core": [f"{mirror.url}/core/os/x86_64"]}, timeout=5
+  )
+
+  assert "sha256 mismatch" in ret["failed"][target["filename"]]
+  assert os.listdir(cache) == []
+
+
+def test_installed_prefetches_targets_and_deps_before_pacman(tmp_path, mirror):
+  dbpath = tmp_path / "db"
+  (dbpath / "local").mkdir(parents=True)
+  write_sync_db(
+    dbpath,
+    "core",
+    [
+      mirror.publish("core", "app", "2.0-1", depends=["libfoo>=1"]),
+      mirror.publish("core", "libfoo", "1.1-1"),
+      mirror.publish("core", "unrelated", "1.0-1"),
+    ],
+  )
+  cache = tmp_path / "pkg"
+  seen = {}
+
+  def handler(cmd, **kwargs):
+    if cmd.startswith("pacman -S "):
+      seen["cache"] = sorted(os.listdir(cache))
+      for name in ("app", "libfoo"):
+        (dbpath / "local" / f"{name}-x").mkdir()
+        (dbpath / "local" / f"{name}-x" / "desc").write_text(f"%NAME%\n{name}\n")
+      stat = os.stat(dbpath / "local")
+      os.utime(dbpath / "local", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    return 0, "", ""
+
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={
+      "cmd.run_all": FakeRunAll(handler),
+      "config.get": lambda key, default=None: default,
+    },
+    grains={"cpuarch": "x86_64"},
+    opts={
+      "pacman.dbpath": str(dbpath),
+      "pacman.conf": str(mirror.write_conf(tmp_path)),
+      "pacman.cachedir": str(cache),
+      "cachedir": str(tmp_path / "salt"),
+    },
+    utils=load_salt_utils(
+      "_utils/alpm.py", "_utils/pkgbatch.py", "_utils/pkgenv.py", "_utils/pkgfetch.py"
+    ),
+  )
+
+  ret = module.installed(pkgs=["app"])
+
+  assert ret["result"] is True
+  assert seen["cache"] == [
+    "app-2.0-1-x86_64.pkg.tar.zst",
+    "libfoo-1.1-1-x86_64.pkg.tar.zst",
+  ]
+
+
+def test_prefetch_disabled_or_without_databases(tmp_path):
+  run_all = FakeRunAll()
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={"cmd.run_all": run_all},
+    opts={"pacman.dbpath": str(tmp_path / "missing"), "pacman.prefetch_jobs": 0},
+    utils=load_salt_utils("_utils/alpm.py", "_utils/pkgenv.py", "_utils/pkgfetch.py"),
+  )
+
+  assert module.prefetch(pkgs=["app"]) == {
+    "fetched": [],
+    "cached": [],
+    "fleet": [],
+    "failed": {},
+    "bytes": 0,
+  }
+  module.upgrade()
+  assert run_all.calls == ["pacman -Syu --noconfirm"]
@@ -0,0 +1,229 @@
+"""
+Unit tests for upgrade planning (alpm.upgrade_plan, pacman/yay.plan_upgrade
+and the pacman/yay uptodate states).
+"""
+
+import pytest
+
+from tests.fixtures.alpm import write_local_pkg, write_sync_db
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+UTILS = ("_utils/alpm.py", "_utils/pkgenv.py")
+
+
+@pytest.fixture
+def alpm():
+  return load_salt_module("_utils/alpm.py")
+
+
+@pytest.fixture
+def dbpath(tmp_path):
+  write_local_pkg(tmp_path, "git", "2.47.0-1", size=["1000"])
+  write_local_pkg(tmp_path, "vim", "9.1.0-1", size=["500"])
+  write_local_pkg(tmp_path, "linux", "6.11.1-1", size=["100"], groups=["kernel"])
+  write_local_pkg(tmp_path, "old-tool", "1.0-1", size=["300"])
+  write_local_pkg(tmp_path, "aur-foo", "1.0-1")
+  write_sync_db(
+    tmp_path,
+    "core",
+    [
+      {"name": ["git"], "version": ["2.48.0-1"], "csize": ["400"], "isize": ["1200"]},
+      {"name": ["vim"], "version": ["9.1.0-1"], "csize": ["300"], "isize": ["500"]},
+      {"name": ["linux"], "version": ["6.12.0-1"], "csize": ["50"], "isize": ["150"]},
+      {
+        "name": ["new-tool"],
+        "version": ["2.0-1"],
+        "replaces": ["old-tool<2"],
+        "csize": ["10"],
+        "isize": ["200"],
+      },
+    ],
+  )
+  return tmp_path
+
+
+@pytest.mark.parametrize(
+  "a, b, expected",
+  [
+    ("1.0", "1.0", 0),
+    ("1.0", "2.0", -1),
+    ("1.0a", "1.0", -1),
+    ("1.0", "1.0.1", -1),
+    ("1.0rc1", "1.0", -1),
+    ("1.0alpha", "1.0beta", -1),
+    ("1.010", "1.9", 1),
+    ("1.0-2", "1.0", 0),
+    ("1.0-1", "1.0-2", -1),
+    ("1:1.0", "2.0", 1),
+    ("0:1.0", "1.0", 0),
+    ("1..0", "1.0", 1),
+    ("r1500.abc", "r1499.def", 1),
+  ],
+)
+def test_vercmp_matches_libalpm(alpm, a, b, expected):
+  assert alpm.vercmp(a, b) == expected
+  assert alpm.vercmp(b, a) == -expected
+
+
+def test_upgrade_plan_diffs_versions_and_sizes(alpm, dbpath):
+  plan = alpm.upgrade_plan(
+    alpm.local_packages(str(dbpath)), alpm.sync_index(str(dbpath), repos=["core"])
+  )
+
+  assert set(plan) == {"git", "linux", "new-tool"}
+  assert plan["git"] == {
+    "old": "2.47.0-1",
+    "new": "2.48.0-1",
+    "repo": "core",
+    "download_size": 400,
+    "installed_size_delta": 200,
+  }
+  assert plan["new-tool"]["replaces"] == ["old-tool"]
+  assert plan["new-tool"]["installed_size_delta"] == -100
+  assert (
+    alpm.upgrade_summary(plan) == "3 packages, 460.00 B download, +150.00 B installed"
+  )
+
+
+def test_upgrade_plan_honours_ignore_rules(alpm, dbpath, tmp_path):
+  conf = tmp_path / "pacman.conf"
+  conf.write_text("[options]\nIgnorePkg = git  # pinned\nIgnoreGroup = kern*\n[core]\n")
+
+  plan = alpm.upgrade_plan(
+    alpm.local_packages(str(dbpath)),
+    alpm.sync_index(str(dbpath), repos=["core"]),
+    conf=str(conf),
+  )
+
+  assert set(plan) == {"new-tool"}
+
+
+def load_state(relpath, module, test, utils=UTILS[:1]):
+  calls = []
+
+  def upgrade(runas=None, refresh=True):
+    calls.append(("upgrade", refresh))
+    return {"success": True, "stdout": "", "stderr": "", "retcode": 0}
+
+  def sync(runas=None):
+    calls.append(("sync",))
+    return {"retcode": 0, "stdout": "", "stderr": ""}
+
+  virtual = relpath.split("/")[-1].removesuffix(".py")
+  state = load_salt_module(
+    relpath,
+    salt={
+      f"{virtual}.plan_upgrade": module.plan_upgrade,
+      f"{virtual}.upgrade": upgrade,
+      f"{virtual}.sync": sync,
+      f"{virtual}.stats": module.stats,
+    },
+    opts={"test": test},
+    utils=load_salt_utils(*utils),
+  )
+  return state, calls
+
+
+@pytest.mark.parametrize("virtual", ["pacman", "yay"])
+def test_uptodate_reports_plan_in_test_mode(virtual, dbpath, tmp_path):
+  run_all = FakeRunAll()
+  module = load_salt_module(
+    f"_modules/{virtual}.py",
+    salt={"cmd.run_all": run_all},
+    opts={"pacman.dbpath": str(dbpath), "cachedir": str(tmp_path / "cache")},
+    utils=load_salt_utils(*UTILS),
+  )
+  module._aur_info = lambda names: {"aur-foo": {"Name": "aur-foo", "Version": "1.1-1"}}
+  state, calls = load_state(f"_states/{virtual}.py", module, test=True)
+
+  ret = state.uptodate(runas="builder")
+
+  assert ret["result"] is None
+  assert ret["changes"]["git"]["new"] == "2.48.0-1"
+  assert ("aur-foo" in ret["changes"]) is (virtual == "yay")
+  assert calls == []
+  assert run_all.calls == []
+
+
+def test_uptodate_skips_upgrade_when_nothing_pending(tmp_path):
+  write_local_pkg(tmp_path, "vim", "9.1.0-1")
+  write_sync_db(tmp_path, "core", [{"name": ["vim"], "version": ["9.1.0-1"]}])
+  module = load_salt_module(
+    "_modules/pacman.py",
+    opts={"pacman.dbpath": str(tmp_path), "cachedir": str(tmp_path / "cache")},
+    utils=load_salt_utils(*UTILS),
+  )
+  state, calls = load_state("_states/pacman.py", module, test=False)
+
+  ret = state.uptodate()
+  ret.pop("stats")
+
+  assert ret == {
+    "name": "pacman.uptodate",
+    "result": True,
+    "changes": {},
+    "comment": "All packages are up to date",
+  }
+  assert calls == [("sync",)]
+
+
+def test_uptodate_upgrades_pending_plan(dbpath):
+  module = load_salt_module(
+    "_modules/pacman.py",
+    opts={"pacman.dbpath": str(dbpath)},
+    utils=load_salt_utils(*UTILS),
+  )
+  state, calls = load_state("_states/pacman.py", module, test=False)
+
+  ret = state.uptodate()
+
+  assert ret["result"] is True
+  assert set(ret["changes"]) == {"git", "linux", "new-tool"}
+  assert calls == [("sync",), ("upgrade", False)]
+
+
+def test_plan_falls_back_to_query_upgrades(tmp_path):
+  run_all = FakeRunAll(
+    lambda cmd, **kw: (
+      0,
+      "git 2.47.0-1 -> 2.48.0-1\nlinux 6.11-1 -> 6.12-1 [ignored]",
+      "",
+    )
+  )
+  module = load_salt_module(
+    "_modules/pacman.py",
+    salt={"cmd.run_all": run_all},
+    opts={"pacman.dbpath": str(tmp_path / "missing")},
+    utils=load_salt_utils(*UTILS),
+  )
+
+  plan = module.plan_upgrade()
+
+  assert run_all.calls == ["pacman -Qu"]
+  assert plan == {
+    "git": {
+      "old": "2.47.0-1",
+      "new": "2.48.0-1",
+      "repo": None,
+      "download_size": None,
+      "installed_size_delta": None,
+    }
+  }
+
+
+@pytest.mark.parametrize("virtual", ["pacman", "yay"])
+def test_uptodate_without_alpm_utils(virtual, tmp_path):
+  run_all = FakeRunAll(lambda cmd, **kw: (0, "git 2.47.0-1 -> 2.48.0-1", ""))
+  module = load_salt_module(
+    f"_modules/{virtual}.py",
+    salt={"cmd.run_all": run_all},
+    opts={"cachedir": str(tmp_path / "cache")},
+    utils=load_salt_utils("_utils/pkgenv.py"),
+  )
+  state, calls = load_state(f"_states/{virtual}.py", module, test=True, utils=())
+
+  ret = state.uptodate(runas="builder")
+
+  assert ret["result"] is None
+  assert ret["comment"] == "Would upgrade 1 package"
+  assert set(ret["changes"]) == {"git"}
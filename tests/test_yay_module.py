@@ -0,0 +1,176 @@
+"""
+Unit tests for the yay execution module (srv/salt/_modules/yay.py).
+
+The parallel AUR pipeline runs against a synthetic sync database, canned
+AUR RPC metadata and a simulated makepkg that records build concurrency.
+"""
+
+import threading
+import time
+
+import pytest
+
+from tests.fixtures.alpm import write_local_pkg, write_sync_db
+from tests.lib.salt_modules import FakeRunAll, load_salt_module, load_salt_utils
+
+AUR = {
+  "app-a": {"Depends": ["lib-x>=1.0", "cmake"]},
+  "lib-x": {},
+  "app-b": {"MakeDepends": ["git"]},
+  "app-c": {"Depends": ["broken-lib"]},
+  "broken-lib": {},
+}
+
+
+class FakeMakepkg:
+  """Simulated yay/makepkg: builds take a little while and can fail."""
+
+  def __init__(self, broken=(), build_s=0.05):
+    self.broken = set(broken)
+    self.build_s = build_s
+    self.lock = threading.Lock()
+    self.running = 0
+    self.max_running = 0
+    self.reasons = {}
+
+  def _install(self, argv):
+    """Record pacman's install reason for each target of -S / -U."""
+    asdeps = "--asdeps" in argv
+    for target in (a for a in argv[2:] if not a.startswith("-")):
+      name = target.rsplit("/", 1)[-1].split("-1.0-1-")[0]
+      if "--needed" in argv and name in self.reasons:
+        continue
+      self.reasons[name] = "dependency" if asdeps else "explicit"
+
+  def __call__(self, cmd, **kwargs):
+    if "makepkg --noconfirm" in cmd:
+      base = cmd.split("/.cache/yay/")[1].split()[0]
+      with self.lock:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+      time.sleep(self.build_s)
+      with self.lock:
+        self.running -= 1
+      if base in self.broken:
+        return 1, "", f"==> ERROR: A failure occurred in build() of {base}"
+      return 0, "", ""
+    if "makepkg --packagelist" in cmd:
+      base = cmd.split("/.cache/yay/")[1].split()[0]
+      return 0, f"/home/builder/.cache/yay/{base}/{base}-1.0-1-x86_64.pkg.tar.zst", ""
+    argv = cmd.split()
+    if argv[:2] in (["yay", "-S"], ["yay", "-U"]):
+      with self.lock:
+        self._install(argv)
+    return 0, "", ""
+
+
+@pytest.fixture
+def yay(tmp_path):
+  write_sync_db(
+    tmp_path,
+    "extra",
+    [
+      {"name": ["cmake"], "version": ["3.30.0-1"]},
+      {"name": ["htop"], "version": ["3.3.0-1"]},
+    ],
+  )
+  write_local_pkg(tmp_path, "git", "2.47.0-1")
+
+  def _load(broken=(), config=None):
+    makepkg = FakeMakepkg(broken)
+    run_all = FakeRunAll(makepkg)
+    config = config or {}
+    utils = load_salt_utils(
+      "_utils/alpm.py", "_utils/pkgbatch.py", "_utils/aurcache.py", "_utils/pkgenv.py"
+    )
+    # dunders resolve like a real minion's, so pool threads need the context
+    module = load_salt_module(
+      "_modules/yay.py",
+      loader_context=True,
+      salt={
+        "cmd.run_all": run_all,
+        "config.get": lambda key, default=None: config.get(key, default),
+      },
+      grains={"cpuarch": "x86_64"},
+      opts={"pacman.dbpath": str(tmp_path), "cachedir": str(tmp_path / "cache")},
+      utils=utils,
+    )
+    module._aur_info = lambda names: {
+      n: {"Name": n, "PackageBase": n, **AUR[n]} for n in names if n in AUR
+    }
+    return module, run_all, makepkg
+
+  return _load
+
+
+def test_parallel_builds_install_in_one_final_transaction(yay):
+  module, run_all, makepkg = yay()
+
+  ret = module.installed(pkgs=["htop", "app-a", "app-b"], runas="builder", build_jobs=2)
+
+  assert ret["result"] is True
+  assert set(ret["changes"]) == {"htop", "app-a", "app-b"}
+  assert makepkg.max_running == 2
+  # lib-x goes in as a dep before app-a builds, then one final transaction
+  final = [c for c in run_all.calls if c.startswith("yay -U") and "--asdeps" not in c]
+  assert len(final) == 1
+  assert "app-a-1.0-1" in final[0] and "app-b-1.0-1" in final[0]
+  asdeps = [c for c in run_all.calls if c.startswith("yay -U") and "--asdeps" in c]
+  assert len(asdeps) == 1 and "lib-x" in asdeps[0]
+  assert run_all.calls.index(asdeps[0]) < next(
+    i for i, c in enumerate(run_all.calls) if "yay/app-a" in c
+  )
+  assert "yay -S --needed --noconfirm --asdeps cmake" in run_all.calls
+  assert makepkg.reasons["lib-x"] == makepkg.reasons["cmake"] == "dependency"
+  assert makepkg.reasons["app-a"] == "explicit"
+  # a diverged clone (AUR force-push) is reset, or removed and re-cloned
+  fetch = next(c for c in run_all.calls if "yay/app-a" in c and "git" in c)
+  assert "fetch -q origin" in fetch and "reset -q --hard origin/HEAD" in fetch
+  assert "rm -rf /home/builder/.cache/yay/app-a && git clone" in fetch
+
+
+def test_requested_dependency_stays_explicit(yay):
+  module, run_all, makepkg = yay()
+
+  ret = module.installed(
+    pkgs=["app-a", "lib-x", "cmake"], runas="builder", build_jobs=2
+  )
+
+  assert ret["result"] is True
+  # lib-x and cmake are deps of app-a, but were asked for by name
+  assert makepkg.reasons == {
+    "cmake": "explicit",
+    "lib-x": "explicit",
+    "app-a": "explicit",
+  }
+  assert not [c for c in run_all.calls if "--asdeps" in c]
+
+
+def test_concurrency_is_bounded(yay):
+  module, _, makepkg = yay()
+
+  module.installed(pkgs=["lib-x", "app-b", "broken-lib"], runas="builder", build_jobs=1)
+  assert makepkg.max_running == 0  # build_jobs=1 keeps the single yay -S
+
+  module.installed(pkgs=["lib-x", "app-b", "broken-lib"], runas="builder", build_jobs=3)
+  assert makepkg.max_running == 3
+
+
+def test_failed_build_fails_its_dependents(yay):
+  module, _, _ = yay(broken={"broken-lib"})
+
+  ret = module.installed(pkgs=["app-b", "app-c"], runas="builder", build_jobs=4)
+
+  assert ret["result"] is False
+  assert list(ret["changes"]) == ["app-b"]
+  assert "Failed: app-c" in ret["comment"]
+  assert "app-c: dependency failed: broken-lib" in ret["comment"]
+
+
+def test_unknown_package_is_reported(yay):
+  module, _, _ = yay()
+
+  ret = module.installed(pkgs=["app-b", "no-such-pkg"], runas="builder", build_jobs=2)
+
+  assert "app-b" in ret["changes"]
+  assert "no-such-pkg: not found in sync databases or AUR" in ret["comment"]